@@ -1,9 +1,8 @@
 #!/bin/bash
 
-PGPASSWORD=postgres psql -h db -U postgres -c "CREATE DATABASE front_docs;"
-python3 manage.py migrate
-echo "from django.contrib.auth import get_user_model;
-User = get_user_model();
-User.objects.create_superuser('admin', 'admin@myproject.com', 'admin')" | python3 manage.py shell
-python3 manage.py runserver 0.0.0.0:8001
-
+# При запуске через docker-compose bootstrap выполняет отдельный одноразовый сервис,
+# и реплики стартуют сразу (BOOTSTRAP_ON_START=0).
+if [ "${BOOTSTRAP_ON_START:-1}" = "1" ]; then
+    python3 manage.py bootstrap || exit 1
+fi
+exec python3 manage.py serve --bind 0.0.0.0:8001
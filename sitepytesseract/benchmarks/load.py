@@ -0,0 +1,264 @@
+"""
+    Нагрузочный прогон сайта: register -> login -> upload -> analyze -> get_text -> delete
+    с заданной параллельностью. Для каждого шага (представления) считаются p50/p95/p99,
+    пропускная способность, ошибки и число запросов к БД (заголовок X-DB-Queries,
+    включается QUERY_COUNT_HEADER=True). Отчёт пишется в JSON, --baseline сравнивает
+    его с отчётом прошлого прогона.
+
+    python -m benchmarks.load --url http://localhost:8001 --concurrency 8 --flows 200 \
+        --admin admin:admin --report report.json --baseline previous.json
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+QUERY_COUNT_HEADER = 'X-DB-Queries'
+SAMPLE_IMAGE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            'integration_tests', 'static', 'image_for_analyzing.png')
+
+
+class FlowError(Exception):
+    pass
+
+
+def percentile(values: list, percent: float):
+    """
+        Перцентиль методом ближайшего ранга.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def add(self, step: str, seconds: float, status: int, queries):
+        with self.lock:
+            self.samples.append((step, seconds, status, queries))
+
+    def steps(self, duration: float) -> dict:
+        grouped = {}
+        for step, seconds, status, queries in self.samples:
+            grouped.setdefault(step, []).append((seconds, status, queries))
+
+        report = {}
+        for step, samples in grouped.items():
+            latencies = [seconds for seconds, _, _ in samples]
+            queries = [count for _, _, count in samples if count is not None]
+            report[step] = {
+                'count': len(samples),
+                'errors': sum(1 for _, status, _ in samples if status == 0 or status >= 400),
+                'throughput': round(len(samples) / duration, 3) if duration else None,
+                'latency': {
+                    'mean': round(sum(latencies) / len(latencies), 6),
+                    'p50': round(percentile(latencies, 50), 6),
+                    'p95': round(percentile(latencies, 95), 6),
+                    'p99': round(percentile(latencies, 99), 6),
+                    'max': round(max(latencies), 6),
+                },
+                'db_queries': {
+                    'mean': round(sum(queries) / len(queries), 2),
+                    'p95': percentile(queries, 95),
+                    'max': max(queries),
+                } if queries else None,
+            }
+        return report
+
+
+class Client:
+    """
+        Сессия одного виртуального пользователя. Куки access/refresh сайт ставит
+        с флагом Secure, поэтому при прогоне по http они возвращаются вручную.
+    """
+
+    def __init__(self, base_url: str, recorder: Recorder, timeout: float):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def request(self, step: str, method: str, path: str, expected=(200, 302), **kwargs) -> requests.Response:
+        headers = kwargs.pop('headers', {})
+        csrf_token = self.session.cookies.get('csrftoken')
+        if method != 'GET' and csrf_token:
+            headers['X-CSRFToken'] = csrf_token
+            headers['Referer'] = self.base_url + path
+
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, headers=headers, timeout=self.timeout,
+                                            allow_redirects=False, **kwargs)
+        except requests.RequestException as e:
+            self.recorder.add(step, time.perf_counter() - start_time, 0, None)
+            raise FlowError(f'{step}: {e}') from e
+        seconds = time.perf_counter() - start_time
+
+        queries = response.headers.get(QUERY_COUNT_HEADER)
+        self.recorder.add(step, seconds, response.status_code, int(queries) if queries is not None else None)
+        for cookie in self.session.cookies:
+            cookie.secure = False
+
+        if response.status_code not in expected:
+            raise FlowError(f'{step}: HTTP {response.status_code}')
+        return response
+
+    def login(self, username: str, password: str):
+        self.request('login_page', 'GET', '/users/login/', expected=(200,))
+        response = self.request('login', 'POST', '/users/login/',
+                                data={'username': username, 'password': password})
+        if response.status_code != 302:
+            raise FlowError('login: wrong credentials')
+
+
+def unique_image(image: bytes) -> bytes:
+    # Байты после конца PNG не мешают его читать, но делают файл уникальным:
+    # иначе сайт узнает дубликат по хэшу и не пойдёт в бэкенд.
+    return image + uuid.uuid4().bytes
+
+
+def run_flow(base_url: str, recorder: Recorder, image: bytes, admin: Client, timeout: float):
+    client = Client(base_url, recorder, timeout)
+    username = f'bench_{uuid.uuid4().hex[:12]}'
+    password = uuid.uuid4().hex
+
+    client.request('register_page', 'GET', '/users/register/', expected=(200,))
+    client.request('register', 'POST', '/users/register/', expected=(302,),
+                   data={'username': username, 'password1': password, 'password2': password})
+    client.login(username, password)
+
+    filename = f'{username}.png'
+    client.request('upload_page', 'GET', '/upload/', expected=(200,))
+    client.request('upload', 'POST', '/upload/', expected=(302,), files={'file': (filename, image, 'image/png')})
+
+    home = client.request('home', 'GET', '/', expected=(200,))
+    match = re.search(rf'href="/media/{re.escape(filename)}".*?ID: (\d+)', home.text, re.DOTALL)
+    if match is None:
+        raise FlowError('home: uploaded document is not on the first page')
+    doc_id = match[1]
+
+    client.request('analyze_page', 'GET', f'/analyze_doc/{doc_id}', expected=(200,))
+    analyzed = client.request('analyze', 'POST', f'/analyze_doc/{doc_id}', expected=(302,),
+                              data={'payment': True})
+    client.request('analysis_status', 'GET', analyzed.headers['Location'] + '?format=json', expected=(200,))
+    client.request('get_text', 'GET', f'/doc_text/{doc_id}', expected=(200,))
+
+    if admin is not None:
+        admin.request('delete', 'POST', f'/delete/{doc_id}', expected=(302,))
+
+
+def run(base_url: str, concurrency: int, flows: int, duration: float, admin_credentials: str = None,
+        timeout: float = 30.0, image_path: str = SAMPLE_IMAGE) -> dict:
+    with open(image_path, 'rb') as f:
+        image = f.read()
+
+    recorder = Recorder()
+    admin = None
+    if admin_credentials:
+        admin = Client(base_url, recorder, timeout)
+        admin.login(*admin_credentials.split(':', 1))
+
+    counters = {'started': 0, 'completed': 0, 'failed': 0}
+    failures = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration if duration else None
+
+    def worker():
+        while True:
+            with lock:
+                if counters['started'] >= flows or (deadline and time.monotonic() >= deadline):
+                    return
+                counters['started'] += 1
+            try:
+                run_flow(base_url, recorder, unique_image(image), admin, timeout)
+                outcome = 'completed'
+            except FlowError as e:
+                outcome = 'failed'
+                with lock:
+                    failures[str(e)] = failures.get(str(e), 0) + 1
+            with lock:
+                counters[outcome] += 1
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start_time
+
+    return {
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'config': {'url': base_url, 'concurrency': concurrency, 'flows': flows, 'duration': duration,
+                   'delete': admin is not None},
+        'elapsed': round(elapsed, 3),
+        'flows': {'completed': counters['completed'], 'failed': counters['failed'],
+                  'throughput': round(counters['completed'] / elapsed, 3) if elapsed else None,
+                  'failures': failures},
+        'steps': recorder.steps(elapsed),
+    }
+
+
+def compare(report: dict, baseline: dict) -> list:
+    """
+        Строки сравнения p95 и числа запросов к БД по шагам с прошлым отчётом.
+    """
+    lines = []
+    for step, current in report['steps'].items():
+        previous = baseline.get('steps', {}).get(step)
+        if previous is None:
+            continue
+        old_p95, new_p95 = previous['latency']['p95'], current['latency']['p95']
+        change = f'{(new_p95 - old_p95) / old_p95 * 100:+.1f}%' if old_p95 else 'n/a'
+        line = f'{step:<16} p95 {old_p95 * 1000:8.1f} -> {new_p95 * 1000:8.1f} ms ({change})'
+        if previous.get('db_queries') and current.get('db_queries'):
+            line += f'  queries {previous["db_queries"]["mean"]} -> {current["db_queries"]["mean"]}'
+        lines.append(line)
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон сайта')
+    parser.add_argument('--url', default='http://localhost:8001')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--flows', type=int, default=50, help='Сколько сценариев выполнить')
+    parser.add_argument('--duration', type=float, default=0, help='Остановиться через столько секунд (0 - нет)')
+    parser.add_argument('--admin', help='login:password суперпользователя для шага delete')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--image', default=SAMPLE_IMAGE)
+    parser.add_argument('--report', default='benchmark-report.json')
+    parser.add_argument('--baseline', help='Отчёт прошлого прогона для сравнения')
+    args = parser.parse_args(argv)
+
+    report = run(args.url, args.concurrency, args.flows, args.duration, args.admin, args.timeout, args.image)
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f'{report["flows"]["completed"]} flows completed, {report["flows"]["failed"]} failed '
+          f'in {report["elapsed"]} s ({report["flows"]["throughput"]} flows/s)')
+    for step, stats in report['steps'].items():
+        queries = stats['db_queries']['mean'] if stats['db_queries'] else '-'
+        print(f'{step:<16} n={stats["count"]:<5} err={stats["errors"]:<4} '
+              f'p50={stats["latency"]["p50"] * 1000:.1f}ms p95={stats["latency"]["p95"] * 1000:.1f}ms '
+              f'p99={stats["latency"]["p99"] * 1000:.1f}ms queries={queries}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print('\n'.join(compare(report, baseline)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+    Сколько байтов экономит предобработка сканов (docs_analyze.preprocessing.reduce_image)
+    для каждого формата. По умолчанию генерирует синтетический цветной скан страницы
+    с шумом и наклоном; свои файлы - через --images.
+
+    python -m benchmarks.preprocessing --dpi 600 --target-dpi 300 --report preprocessing.json
+"""
+import argparse
+import json
+import os
+import random
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+FORMATS = {'PNG': {}, 'JPEG': {'quality': 95}, 'TIFF': {'compression': 'tiff_lzw'}, 'BMP': {},
+           'WEBP': {'lossless': True}}
+
+
+def synthetic_scan(dpi: int, width_in: float = 5.8, height_in: float = 8.3, seed: int = 1) -> Image.Image:
+    """
+        Страница A5: желтоватая бумага, шум сканера, строки "слов" и небольшой наклон.
+    """
+    rng = random.Random(seed)
+    size = (round(width_in * dpi), round(height_in * dpi))
+    noise = Image.effect_noise(size, 12).point(lambda v: v // 8)
+    page = Image.merge('RGB', [Image.new('L', size, level) for level in (246, 242, 228)])
+    page = Image.composite(page, Image.new('RGB', size, (232, 228, 214)), noise.point(lambda v: 255 - v))
+
+    draw = ImageDraw.Draw(page)
+    margin, line = dpi // 2, dpi // 6
+    for y in range(margin, size[1] - margin, line):
+        x = margin
+        while x < size[0] - margin:
+            word = rng.randint(dpi // 12, dpi // 3)
+            draw.rectangle((x, y, min(x + word, size[0] - margin), y + line // 2), fill=(40, 40, 48))
+            x += word + dpi // 20
+    return page.rotate(1.5, resample=Image.BICUBIC, expand=True, fillcolor=(246, 242, 228))
+
+
+def encode(image: Image.Image, image_format: str, dpi: int) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, dpi=(dpi, dpi), **FORMATS.get(image_format, {}))
+    return buffer.getvalue()
+
+
+def measure(name: str, data: bytes, options: dict) -> dict:
+    from docs_analyze.preprocessing import reduce_image
+
+    start_time = time.perf_counter()
+    result = reduce_image(data, **options)
+    seconds = time.perf_counter() - start_time
+    reduced = len(result[0]) if result else len(data)
+    return {'name': name, 'original_bytes': len(data), 'reduced_bytes': reduced,
+            'saved_bytes': len(data) - reduced, 'saved_percent': round((len(data) - reduced) / len(data) * 100, 1),
+            'output_format': result[1] if result else None, 'seconds': round(seconds, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Экономия байтов предобработкой сканов')
+    parser.add_argument('--images', nargs='*', help='Свои файлы вместо синтетического скана')
+    parser.add_argument('--dpi', type=int, default=600, help='DPI синтетического скана')
+    parser.add_argument('--target-dpi', type=int, default=300)
+    parser.add_argument('--assume-dpi', type=int, default=0)
+    parser.add_argument('--no-grayscale', action='store_true')
+    parser.add_argument('--jpeg-quality', type=int, default=90)
+    parser.add_argument('--hooks', nargs='*', default=[], help='Например docs_analyze.preprocessing.deskew')
+    parser.add_argument('--report', help='Записать результаты в JSON')
+    args = parser.parse_args(argv)
+
+    options = {'grayscale': not args.no_grayscale, 'target_dpi': args.target_dpi, 'assume_dpi': args.assume_dpi,
+               'jpeg_quality': args.jpeg_quality, 'hooks': tuple(args.hooks)}
+
+    if args.images:
+        samples = []
+        for path in args.images:
+            with open(path, 'rb') as f:
+                samples.append((os.path.basename(path), f.read()))
+    else:
+        page = synthetic_scan(args.dpi)
+        samples = [(f'scan-{args.dpi}dpi.{image_format.lower()}', encode(page, image_format, args.dpi))
+                   for image_format in FORMATS]
+
+    results = [measure(name, data, options) for name, data in samples]
+    for result in results:
+        print(f'{result["name"]:<22} {result["original_bytes"]:>11,} -> {result["reduced_bytes"]:>11,} bytes '
+              f'({result["saved_percent"]:>5}% saved, {result["output_format"] or "unchanged"}, '
+              f'{result["seconds"]} s)')
+
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({'options': options, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
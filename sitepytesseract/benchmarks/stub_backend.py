@@ -0,0 +1,215 @@
+"""
+    Локальная замена бэкенда (nginx + OCR) для нагрузочных прогонов.
+
+    Реализует /token/, /token/verify/, /token/refresh/, /upload_doc/, /doc_analyze/<id>,
+    /get_text/<id> и /doc_delete/<id> с настраиваемой задержкой и долей ошибок 5xx.
+    Токены - настоящие HS256 JWT с exp: сайт может проверять их локально
+    (JWT_SIGNING_KEY = --signing-key) и кэшировать результат проверки.
+
+    python -m benchmarks.stub_backend --port 9100 --latency 0.05 --error-rate 0.01
+    BACKEND_API_URL=http://localhost:9100/api/v1 python manage.py serve
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROUTES = re.compile(r'/(?P<endpoint>token/verify|token/refresh|token|upload_doc|doc_analyze|get_text|doc_delete)'
+                    r'/(?:(?P<doc_id>\d+)/?)?$')
+
+SAMPLE_TEXT = 'Lorem ipsum dolor sit amet, consectetur adipiscing elit.'
+
+
+def b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def encode_jwt(payload: dict, key: bytes) -> str:
+    header = b64url_encode(json.dumps({'alg': 'HS256', 'typ': 'JWT'}).encode())
+    body = b64url_encode(json.dumps(payload).encode())
+    signature = hmac.new(key, f'{header}.{body}'.encode(), hashlib.sha256).digest()
+    return f'{header}.{body}.{b64url_encode(signature)}'
+
+
+def decode_jwt(token: str, key: bytes):
+    try:
+        header, body, signature = token.split('.')
+        expected = hmac.new(key, f'{header}.{body}'.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, b64url_decode(signature)):
+            return None
+        payload = json.loads(b64url_decode(body))
+    except (AttributeError, ValueError, TypeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('exp', 0) < time.time():
+        return None
+    return payload
+
+
+class StubBackend:
+    """
+        Состояние заглушки: параметры задержки и ошибок, загруженные документы и счётчики запросов.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 analyze_latency: float = None, signing_key: str = 'benchmark', access_ttl: int = 300):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.analyze_latency = latency if analyze_latency is None else analyze_latency
+        self.key = signing_key.encode()
+        self.access_ttl = access_ttl
+        self.docs = set()
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def delay(self, endpoint: str):
+        latency = self.analyze_latency if endpoint == 'doc_analyze' else self.latency
+        latency += random.uniform(0, self.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+    def issue(self, username: str, token_type: str, ttl: int) -> str:
+        return encode_jwt({'token_type': token_type, 'username': username,
+                           'exp': int(time.time()) + ttl, 'jti': random.getrandbits(64)}, self.key)
+
+    def handle(self, method: str, endpoint: str, doc_id, body: bytes, headers):
+        """
+            Возвращает (статус, тело-словарь, дополнительные заголовки).
+        """
+        self.count(endpoint)
+        self.delay(endpoint)
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, {'detail': 'Stub backend error'}, {}
+
+        data = {}
+        if body and headers.get('Content-Type', '').startswith('application/json'):
+            try:
+                data = json.loads(body)
+            except ValueError:
+                return 400, {'detail': 'Bad JSON'}, {}
+
+        if endpoint == 'token':
+            username = data.get('username', '')
+            return 200, {'access': self.issue(username, 'access', self.access_ttl),
+                         'refresh': self.issue(username, 'refresh', 24 * 60 * 60)}, {}
+        if endpoint == 'token/verify':
+            if decode_jwt(data.get('token', ''), self.key) is None:
+                return 401, {'detail': 'Token is invalid or expired'}, {}
+            return 200, {}, {}
+        if endpoint == 'token/refresh':
+            payload = decode_jwt(data.get('refresh', ''), self.key)
+            if payload is None or payload.get('token_type') != 'refresh':
+                return 401, {'detail': 'Token is invalid or expired'}, {}
+            return 200, {'access': self.issue(payload.get('username', ''), 'access', self.access_ttl)}, {}
+        if endpoint == 'upload_doc':
+            return 200, {'detail': 'Uploaded', 'size': len(body)}, {}
+
+        if doc_id is None:
+            return 404, {'detail': 'Not found'}, {}
+        etag = f'"{doc_id}"'
+        if endpoint == 'doc_analyze':
+            with self.lock:
+                self.docs.add(doc_id)
+            return 200, {'text': SAMPLE_TEXT}, {'ETag': etag}
+        if endpoint == 'get_text':
+            if headers.get('If-None-Match') == etag:
+                return 304, None, {'ETag': etag}
+            return 200, {'text': SAMPLE_TEXT}, {'ETag': etag}
+        if endpoint == 'doc_delete':
+            with self.lock:
+                self.docs.discard(doc_id)
+            return 200, {'detail': 'Deleted'}, {}
+        return 404, {'detail': 'Not found'}, {}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    backend: StubBackend = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self) -> bytes:
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def dispatch(self):
+        body = self.read_body()
+        match = ROUTES.search(self.path.split('?', 1)[0])
+        if match is None:
+            status, data, headers = 404, {'detail': 'Not found'}, {}
+        else:
+            status, data, headers = self.backend.handle(self.command, match['endpoint'], match['doc_id'],
+                                                        body, self.headers)
+
+        payload = b'' if data is None else json.dumps(data).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if data is not None:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_DELETE = do_PUT = dispatch
+
+
+def make_server(host: str, port: int, backend: StubBackend) -> ThreadingHTTPServer:
+    handler = type('BoundStubHandler', (StubHandler,), {'backend': backend})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Заглушка OCR-бэкенда для нагрузочных прогонов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, с')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Случайная добавка к задержке, с')
+    parser.add_argument('--analyze-latency', type=float, help='Задержка /doc_analyze/, с (по умолчанию --latency)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 503, 0..1')
+    parser.add_argument('--signing-key', default='benchmark', help='Ключ HS256 для выдаваемых токенов')
+    parser.add_argument('--access-ttl', type=int, default=300, help='Время жизни access-токена, с')
+    args = parser.parse_args(argv)
+
+    backend = StubBackend(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                          analyze_latency=args.analyze_latency, signing_key=args.signing_key,
+                          access_ttl=args.access_ttl)
+    server = make_server(args.host, args.port, backend)
+    print(f'Stub backend on http://{args.host}:{args.port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps({'requests': backend.counts}))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,9 @@
 from django.contrib import admin
 
-from docs_analyze.models import Docs, Price
+from docs_analyze.models import AnalysisJob, DeletedFile, Docs, Price
 
 # Register your models here.
 admin.site.register(Docs)
-admin.site.register(Price)
\ No newline at end of file
+admin.site.register(Price)
+admin.site.register(AnalysisJob)
+admin.site.register(DeletedFile)
\ No newline at end of file
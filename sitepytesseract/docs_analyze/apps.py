@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DocsAnalyzeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'docs_analyze'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,162 @@
+from asgiref.sync import sync_to_async
+from django.forms.forms import Form
+from django.http.response import Http404, HttpResponseRedirect
+from django.urls import reverse
+from django.views.generic.base import TemplateResponseMixin, TemplateView
+from django.views.generic.edit import FormMixin
+
+from docs_analyze.models import AnalysisJob, Docs, Cart
+from docs_analyze.uploads import upload_digest
+from . import doc_text, jobs, preprocessing, service_api, views
+
+
+# Асинхронные версии представлений для работы под ASGI (settings.ASYNC_VIEWS).
+# Пока ждём бэкенд, воркер не блокируется и обслуживает другие запросы.
+
+class AsyncFormView(service_api.AsyncJWTView, FormMixin, TemplateResponseMixin):
+    """
+        Базовое асинхронное представление с формой и JWT-проверкой.
+    """
+
+    def test_func(self):
+        return self.request.user.is_authenticated
+
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data())
+
+    async def post(self, request, *args, **kwargs):
+        form = await sync_to_async(self.get_form)()
+        if not await sync_to_async(form.is_valid)():
+            return self.form_invalid(form)
+        return await self.form_valid(form)
+
+
+class AsyncUploadDocs(views.UploadDocsMixin, AsyncFormView):
+    """
+        Асинхронная загрузка документа.
+        Для загрузки необходимо быть авторизованным
+    """
+    form_class = views.UploadDocs.form_class
+    template_name = views.UploadDocs.template_name
+    success_url = views.UploadDocs.success_url
+    extra_context = views.UploadDocs.extra_context
+
+    async def form_valid(self, form):
+        """
+            За один проход отправляет файл в API и на диск, затем создаёт запись в базе данных.
+        """
+        uploaded_file = form.cleaned_data['file']
+        digest = await sync_to_async(upload_digest)(self.request, uploaded_file)
+
+        duplicate = await Docs.objects.filter(digest=digest).afirst()
+        if duplicate is not None:
+            await sync_to_async(self.link_user)(duplicate)
+            return HttpResponseRedirect(self.get_success_url())
+
+        upload = await sync_to_async(preprocessing.prepare_upload)(uploaded_file, digest)
+        path = upload.path
+
+        try:
+            response = await service_api.api_upload_async(upload)
+        except Exception:
+            upload.rollback()
+            raise
+
+        if response.status_code >= 400:
+            upload.rollback()
+            return service_api.api_error_handler(response.status_code, response.json()['detail'])
+
+        await sync_to_async(upload.finish)()
+
+        await sync_to_async(self.docs_create)(path, upload.size, digest)
+
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class AsyncAnalyzeDocs(AsyncFormView):
+    """
+        Асинхронный анализ документа.
+        Поиск документа идёт параллельно с проверкой токена.
+    """
+    form_class = views.AnalyzeDocs.form_class
+    template_name = views.AnalyzeDocs.template_name
+    success_url = views.AnalyzeDocs.success_url
+    extra_context = views.AnalyzeDocs.extra_context
+
+    async def prefetch(self, request, *args, **kwargs):
+        return await Docs.objects.filter(id=kwargs['doc_id']).afirst()
+
+    async def form_valid(self, form):
+        """
+            Добавляет документ в корзину и ставит задачу анализа в очередь.
+        """
+        doc = self.prefetched
+        if doc is None:
+            return service_api.api_error_handler(500, 'Такого документа для анализа нет')
+
+        try:
+            cart = await Cart.objects.acreate(user_id=self.request.user, doc_id=doc)
+        except ValueError as e:
+            return service_api.api_error_handler(500, str(e))
+
+        job = await sync_to_async(jobs.submit)(self.request.user, doc, cart)
+
+        if job.status == AnalysisJob.Status.FAILED:
+            return service_api.api_error_handler(job.response_code or 500, job.error)
+
+        return HttpResponseRedirect(reverse('analysis_status', args=[job.id]))
+
+
+class AsyncDeleteDocs(service_api.AsyncJWTView, TemplateResponseMixin):
+    """
+        Асинхронное удаление документа.
+        Для удаления необходимо быть авторизованным под админом
+    """
+    template_name = views.DeleteDocs.template_name
+    success_url = views.DeleteDocs.success_url
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+    async def prefetch(self, request, *args, **kwargs):
+        return await Docs.objects.filter(pk=kwargs['pk']).afirst()
+
+    def get_object(self):
+        if self.prefetched is None:
+            raise Http404('Документ не найден')
+        return self.prefetched
+
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response({'object': self.get_object(), 'form': Form()})
+
+    async def post(self, request, *args, **kwargs):
+        """
+            Удаляет документ через API и из базы данных.
+        """
+        doc = self.get_object()
+
+        response = await service_api.api_delete_async(doc.pk)
+
+        if response.status_code >= 400:
+            return service_api.api_error_handler(response.status_code, response.json()['detail'])
+
+        await doc.adelete()
+        return HttpResponseRedirect(self.success_url)
+
+
+class AsyncGetTextDocs(TemplateView):
+    """
+        Асинхронное получение и отображение текста документа.
+    """
+    template_name = views.GetTextDocs.template_name
+    extra_context = {
+        'title': 'Вывод текста'
+    }
+
+    async def get(self, request, *args, **kwargs):
+        text, response = await doc_text.aget_text(kwargs['docs_id'])
+
+        if response is not None:
+            return service_api.api_error_handler(response.status_code, response.json()['detail'])
+
+        return self.render_to_response(self.get_context_data(text=text, **kwargs))
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+
+from sitepytesseract.singleflight import SingleFlight, get_async_flight
+from . import service_api
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'doc_text:{}'
+
+_flight = SingleFlight()
+
+
+def text_model():
+    return apps.get_model('docs_analyze', 'DocText')
+
+
+def text_etag(text: str) -> str:
+    return '"' + hashlib.sha256(text.encode()).hexdigest() + '"'
+
+
+def cache_get(doc_id: int):
+    try:
+        return cache.get(CACHE_KEY.format(doc_id))
+    except Exception:
+        logger.warning('Document text cache is unavailable', exc_info=True)
+        return None
+
+
+def cache_set(doc_id: int, text: str):
+    try:
+        cache.set(CACHE_KEY.format(doc_id), text, settings.DOC_TEXT_CACHE_SECONDS)
+    except Exception:
+        logger.warning('Document text cache is unavailable', exc_info=True)
+
+
+def forget(doc_id: int):
+    try:
+        cache.delete(CACHE_KEY.format(doc_id))
+    except Exception:
+        logger.warning('Document text cache is unavailable', exc_info=True)
+
+
+def lookup(doc_id: int):
+    """
+        Ищет текст у себя: кэш -> таблица DocText.
+        Возвращает (text, None), если есть актуальный текст,
+        иначе (None, record) - record хранит устаревший текст и его etag или None.
+    """
+    text = cache_get(doc_id)
+    if text is not None:
+        return text, None
+
+    record = text_model().objects.filter(doc_id=doc_id).first()
+    if record is not None and not record.stale:
+        cache_set(doc_id, record.text)
+        return record.text, None
+    return None, record
+
+
+def store(doc_id: int, text: str, etag: str = None):
+    """
+        Сохраняет текст, полученный от бэкенда или переданный им вместе с результатом анализа.
+    """
+    text = text or ''
+    if not apps.get_model('docs_analyze', 'Docs').objects.filter(id=doc_id).exists():
+        return text
+    try:
+        with transaction.atomic():
+            text_model().objects.update_or_create(
+                doc_id_id=doc_id, defaults={'text': text, 'etag': etag or text_etag(text), 'stale': False})
+    except IntegrityError:
+        # Документ удалили параллельно: текст хранить не для чего.
+        logger.info('Document %s is gone, text is not stored', doc_id)
+        return text
+    cache_set(doc_id, text)
+    return text
+
+
+def save(doc_id: int, record, response) -> str:
+    """
+        Сохраняет ответ /get_text/. На 304 бэкенд подтверждает, что сохранённый текст не изменился.
+    """
+    if response.status_code == 304 and record is not None:
+        text_model().objects.filter(doc_id=doc_id).update(stale=False)
+        cache_set(doc_id, record.text)
+        return record.text
+    return store(doc_id, response.json().get('text'), response.headers.get('ETag'))
+
+
+def get_text(doc_id: int):
+    """
+        Текст документа: из кэша/БД, а к бэкенду - только если текста нет или он устарел
+        (запрос условный, с If-None-Match). Возвращает (text, None) или (None, ответ-ошибку).
+    """
+    text, record = lookup(doc_id)
+    if text is not None:
+        return text, None
+    # Параллельные промахи по одному документу ждут один запрос и одну запись в БД.
+    return _flight.do(doc_id, lambda: fetch(doc_id, record))
+
+
+def fetch(doc_id: int, record):
+    response = service_api.api_get_text(doc_id, etag=record.etag if record else None)
+    if response.status_code >= 400:
+        return None, response
+    return save(doc_id, record, response), None
+
+
+async def aget_text(doc_id: int):
+    text, record = await sync_to_async(lookup)(doc_id)
+    if text is not None:
+        return text, None
+    return await get_async_flight().do(('doc_text', doc_id), lambda: afetch(doc_id, record))
+
+
+async def afetch(doc_id: int, record):
+    response = await service_api.api_get_text_async(doc_id, etag=record.etag if record else None)
+    if response.status_code >= 400:
+        return None, response
+    return await sync_to_async(save)(doc_id, record, response), None
+
+
+def invalidate(doc_id: int):
+    """
+        Документ переанализирован: текст помечается устаревшим, etag остаётся
+        для условного запроса.
+    """
+    text_model().objects.filter(doc_id=doc_id).update(stale=True)
+    forget(doc_id)
+    transaction.on_commit(lambda: forget(doc_id))
+
+
+def refresh(doc_id: int, response):
+    """
+        После успешного анализа: если бэкенд прислал текст в ответе - сохраняем его,
+        иначе помечаем сохранённый текст устаревшим.
+    """
+    try:
+        text = response.json().get('text')
+    except (ValueError, AttributeError, TypeError):
+        text = None
+
+    if isinstance(text, str):
+        store(doc_id, text, response.headers.get('ETag'))
+    else:
+        invalidate(doc_id)
@@ -1,10 +1,29 @@
+import re
+
 from django import forms
+from django.conf import settings
 
 from docs_analyze.models import Cart
+from docs_analyze.validators import validate_image_header
 
 
 class UploadDocsForm(forms.Form):
-    file = forms.ImageField(label='Файл')
+    file = forms.FileField(label='Файл', validators=[validate_image_header])
+
+    def __init__(self, *args, upload_errors: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Причина, по которой ImageLimitsUploadHandler оборвал приём файла.
+        self.upload_error = (upload_errors or {}).get('file')
+        if self.upload_error:
+            self.fields['file'].required = False
+
+    def clean_file(self):
+        if self.upload_error:
+            raise forms.ValidationError(self.upload_error)
+        file = self.cleaned_data['file']
+        if settings.UPLOAD_FULL_DECODE:
+            file = forms.ImageField().to_python(file)
+        return file
 
 
 class AnalyzeDocsForm(forms.Form):
@@ -12,4 +31,22 @@ class AnalyzeDocsForm(forms.Form):
 
     class Meta:
         model = Cart
-        fields = ['payment',]
\ No newline at end of file
+        fields = ['payment',]
+
+
+class BatchAnalyzeDocsForm(forms.Form):
+    docs = forms.CharField(label='ID документов', help_text='Через запятую или пробел')
+    payment = forms.BooleanField(label='Оплата')
+
+    def clean_docs(self):
+        values = re.split(r'[\s,;]+', self.cleaned_data['docs'].strip())
+        try:
+            ids = list(dict.fromkeys(int(value) for value in values if value))
+        except ValueError:
+            raise forms.ValidationError('ID документов должны быть числами')
+        if not ids:
+            raise forms.ValidationError('Укажите хотя бы один документ')
+        if len(ids) > settings.ANALYSIS_BATCH_MAX_DOCS:
+            raise forms.ValidationError(
+                f'За раз можно отправить не больше {settings.ANALYSIS_BATCH_MAX_DOCS} документов')
+        return ids
@@ -0,0 +1,221 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from docs_analyze.models import AnalysisJob
+from . import doc_text, service_api
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_producer = None
+_lock = threading.Lock()
+
+
+def submit_many(user, carts) -> list:
+    """
+        Пакетная постановка задач: одна вставка bulk_create на все документы.
+        В режиме inline вызовы API идут параллельно, не более ANALYSIS_BATCH_CONCURRENCY.
+    """
+    batch = AnalysisJob.objects.bulk_create(
+        [AnalysisJob(user_id=user, doc_id=cart.doc_id, cart_id=cart) for cart in carts])
+
+    backend = settings.ANALYSIS_QUEUE
+    if backend == 'inline':
+        run_inline_batch(batch)
+    else:
+        for job in batch:
+            enqueue(job)
+    return batch
+
+
+def run_inline_batch(batch: list):
+    claimed = [job for job in batch if claim(job.id)]
+    with ThreadPoolExecutor(max_workers=settings.ANALYSIS_BATCH_CONCURRENCY) as pool:
+        responses = list(pool.map(lambda job: service_api.api_analyze(job.doc_id_id), claimed))
+    for job, response in zip(claimed, responses):
+        save_result(job, response)
+    for job in batch:
+        job.refresh_from_db()
+
+
+def submit(user, doc, cart=None) -> AnalysisJob:
+    """
+        Создаёт задачу анализа и ставит её в очередь settings.ANALYSIS_QUEUE.
+        В режиме inline задача выполняется сразу и возвращается уже завершённой.
+    """
+    job = AnalysisJob.objects.create(user_id=user, doc_id=doc, cart_id=cart)
+    enqueue(job)
+    return job
+
+
+def enqueue(job: AnalysisJob):
+    backend = settings.ANALYSIS_QUEUE
+    if backend == 'inline':
+        if claim(job.id):
+            run_job(job)
+        job.refresh_from_db()
+    elif backend == 'thread':
+        transaction.on_commit(lambda: get_executor().submit(run_job_by_id, job.id))
+    elif backend == 'kafka':
+        transaction.on_commit(lambda: publish(job.id))
+    elif backend != 'db':
+        raise ValueError(f'Unknown ANALYSIS_QUEUE backend: {backend}')
+
+
+def claim(job_id: int) -> bool:
+    """
+        Переводит задачу из очереди в работу. Условный UPDATE гарантирует,
+        что одну задачу не возьмут два воркера.
+    """
+    return bool(AnalysisJob.objects
+                .filter(id=job_id, status=AnalysisJob.Status.QUEUED)
+                .update(status=AnalysisJob.Status.RUNNING, attempts=F('attempts') + 1,
+                        updated_at=timezone.now()))
+
+
+def claim_next():
+    """
+        Берёт следующую задачу из БД-очереди. Зависшие в работе дольше
+        ANALYSIS_JOB_TIMEOUT задачи возвращаются в работу, пока не кончатся попытки,
+        а после этого помечаются FAILED.
+    """
+    stale = timezone.now() - timedelta(seconds=settings.ANALYSIS_JOB_TIMEOUT)
+    fail_exhausted(stale)
+    with transaction.atomic():
+        job = (AnalysisJob.objects
+               .select_for_update(skip_locked=True)
+               .filter(Q(status=AnalysisJob.Status.QUEUED)
+                       | Q(status=AnalysisJob.Status.RUNNING, updated_at__lt=stale))
+               .filter(attempts__lt=settings.ANALYSIS_MAX_ATTEMPTS)
+               .order_by('id')
+               .first())
+        if job is None:
+            return None
+        job.status = AnalysisJob.Status.RUNNING
+        job.attempts += 1
+        job.save(update_fields=['status', 'attempts', 'updated_at'])
+    return job
+
+
+def fail_exhausted(stale) -> int:
+    """
+        Зависшие задачи без оставшихся попыток (воркер упал на последней)
+        иначе навсегда остались бы в работе.
+    """
+    failed = (AnalysisJob.objects
+              .filter(status=AnalysisJob.Status.RUNNING, updated_at__lt=stale,
+                      attempts__gte=settings.ANALYSIS_MAX_ATTEMPTS)
+              .update(status=AnalysisJob.Status.FAILED,
+                      error=f'Задача не завершилась за {settings.ANALYSIS_MAX_ATTEMPTS} попыток',
+                      updated_at=timezone.now()))
+    if failed:
+        logger.warning('%s stale analysis jobs failed after %s attempts', failed, settings.ANALYSIS_MAX_ATTEMPTS)
+    return failed
+
+
+def run_job(job: AnalysisJob):
+    """
+        Вызывает анализ документа в API и сохраняет результат в задаче.
+    """
+    response = service_api.api_analyze(job.doc_id_id)
+    return save_result(job, response)
+
+
+def save_result(job: AnalysisJob, response):
+    job.response_code = response.status_code
+    if response.status_code >= 400:
+        try:
+            job.error = response.json()['detail']
+        except (ValueError, KeyError, TypeError):
+            job.error = f'Backend error {response.status_code}'
+        job.status = AnalysisJob.Status.FAILED
+    else:
+        job.error = ''
+        job.status = AnalysisJob.Status.DONE
+        doc_text.refresh(job.doc_id_id, response)
+    job.save(update_fields=['status', 'response_code', 'error', 'updated_at'])
+    return job
+
+
+def release_connections():
+    # Вне запроса Django не закрывает устаревшие соединения сам.
+    # Внутри открытой транзакции (например, в тестах) закрывать нельзя.
+    if not connection.in_atomic_block:
+        close_old_connections()
+
+
+def run_job_by_id(job_id: int):
+    release_connections()
+    try:
+        if not claim(job_id):
+            return None
+        return run_job(AnalysisJob.objects.get(id=job_id))
+    except Exception:
+        logger.exception('Analysis job %s crashed', job_id)
+    finally:
+        release_connections()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.ANALYSIS_THREAD_WORKERS,
+                                           thread_name_prefix='analysis')
+    return _executor
+
+
+def get_producer():
+    global _producer
+    with _lock:
+        if _producer is None:
+            from kafka import KafkaProducer
+            _producer = KafkaProducer(bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+                                      value_serializer=lambda value: json.dumps(value).encode())
+    return _producer
+
+
+def publish(job_id: int):
+    try:
+        get_producer().send(settings.KAFKA_ANALYSIS_TOPIC, {'job_id': job_id})
+    except Exception:
+        # Задача остаётся в БД в статусе queued: её подберёт воркер в режиме db.
+        logger.exception('Could not publish analysis job %s to Kafka', job_id)
+
+
+def run_db_worker(poll_interval: float = 1.0, once: bool = False):
+    """
+        Цикл воркера БД-очереди: забирает задачи по одной через SKIP LOCKED.
+    """
+    while True:
+        release_connections()
+        job = claim_next()
+        if job is not None:
+            try:
+                run_job(job)
+            except Exception:
+                logger.exception('Analysis job %s crashed', job.id)
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+def run_kafka_worker(group_id: str = 'analysis-workers'):
+    from kafka import KafkaConsumer
+
+    consumer = KafkaConsumer(settings.KAFKA_ANALYSIS_TOPIC,
+                             bootstrap_servers=settings.KAFKA_BOOTSTRAP_SERVERS,
+                             group_id=group_id,
+                             value_deserializer=lambda value: json.loads(value.decode()))
+    for message in consumer:
+        run_job_by_id(message.value['job_id'])
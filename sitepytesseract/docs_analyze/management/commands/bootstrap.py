@@ -0,0 +1,113 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.migrations.executor import MigrationExecutor
+
+from docs_analyze import pricing
+from docs_analyze.models import Price
+from users import tokens
+
+# Ключ advisory-блокировки Postgres: миграции применяет только один запущенный bootstrap.
+MIGRATE_LOCK_ID = 7_401_002
+
+
+def parse_prices(value: str) -> dict:
+    """
+        '.png:0.001,.jpg:0.001' -> {'.png': 0.001, '.jpg': 0.001}
+    """
+    prices = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        file_type, price = item.rsplit(':', 1)
+        prices[file_type.strip()] = float(price)
+    return prices
+
+
+class Command(BaseCommand):
+    help = ('Готовит окружение к запуску: база данных, миграции (только если есть новые), '
+            'администратор, цены и прогрев кэшей. Повторный запуск ничего не меняет')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--skip-warmup', action='store_true', help='Не прогревать кэши')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        self.ensure_database(connection)
+        self.migrate(connection, options['database'])
+        self.ensure_admin()
+        self.seed_prices()
+        if not options['skip_warmup']:
+            self.warm_up()
+
+    def ensure_database(self, connection):
+        try:
+            connection.ensure_connection()
+            return
+        except OperationalError:
+            if connection.vendor != 'postgresql':
+                raise
+        name = connection.settings_dict['NAME']
+        with connection._nodb_cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_database WHERE datname = %s', [name])
+            if cursor.fetchone() is None:
+                cursor.execute('CREATE DATABASE ' + connection.ops.quote_name(name))
+                self.stdout.write(f'Bootstrap: created database {name}')
+        connection.ensure_connection()
+
+    def pending_migrations(self, connection) -> list:
+        executor = MigrationExecutor(connection)
+        return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+    def migrate(self, connection, database: str):
+        if not self.pending_migrations(connection):
+            self.stdout.write('Bootstrap: no pending migrations')
+            return
+
+        locked = connection.vendor == 'postgresql'
+        if locked:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_lock(%s)', [MIGRATE_LOCK_ID])
+        try:
+            # Пока ждали блокировку, миграции мог применить другой bootstrap.
+            if self.pending_migrations(connection):
+                call_command('migrate', database=database, interactive=False, verbosity=1)
+        finally:
+            if locked:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [MIGRATE_LOCK_ID])
+
+    def ensure_admin(self):
+        username = settings.BOOTSTRAP_ADMIN_USERNAME
+        if not username:
+            return
+        user_model = get_user_model()
+        if user_model.objects.filter(username=username).exists():
+            return
+        user_model.objects.create_superuser(username, settings.BOOTSTRAP_ADMIN_EMAIL,
+                                            settings.BOOTSTRAP_ADMIN_PASSWORD)
+        self.stdout.write(f'Bootstrap: created superuser {username}')
+
+    def seed_prices(self):
+        # Существующие цены не перезаписываются: их могли поменять в админке.
+        prices = parse_prices(settings.BOOTSTRAP_PRICES)
+        existing = set(Price.objects.filter(file_type__in=prices).values_list('file_type', flat=True))
+        missing = [Price(file_type=file_type, price=price)
+                   for file_type, price in prices.items() if file_type not in existing]
+        if missing:
+            Price.objects.bulk_create(missing)
+            pricing.invalidate()
+            self.stdout.write(f'Bootstrap: added prices for {", ".join(p.file_type for p in missing)}')
+
+    def warm_up(self):
+        try:
+            pricing.invalidate()
+            pricing.get_price_table()
+            if settings.JWT_JWKS_URL:
+                tokens.fetch_key_set()
+        except Exception as e:
+            # Кэш (Redis) может подняться позже приложения: это не повод не стартовать.
+            self.stderr.write(f'Bootstrap: cache warm-up skipped: {e}')
+            return
+        self.stdout.write('Bootstrap: caches warmed up')
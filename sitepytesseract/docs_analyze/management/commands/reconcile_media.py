@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from docs_analyze import storage_gc
+
+
+class Command(BaseCommand):
+    help = ('Сверяет файлы в MEDIA_ROOT с Docs.file_path: файлы без документа помечаются к удалению '
+            '(их уберёт sweep_media)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--root', default=str(settings.MEDIA_ROOT), help='Каталог для сверки')
+        parser.add_argument('--min-age', type=float, default=settings.MEDIA_ORPHAN_MIN_AGE,
+                            help='Не трогать файлы моложе стольких секунд (идущие загрузки)')
+        parser.add_argument('--dry-run', action='store_true', help='Только вывести найденное')
+        parser.add_argument('--missing', action='store_true',
+                            help='Также вывести документы, файла которых нет на диске')
+
+    def handle(self, *args, **options):
+        orphans = 0
+        for chunk in storage_gc.chunks(storage_gc.find_orphans(options['root'], options['min_age']),
+                                       settings.MEDIA_SWEEP_BATCH_SIZE):
+            orphans += len(chunk)
+            if options['verbosity'] > 1 or options['dry_run']:
+                for path in chunk:
+                    self.stdout.write(f'Orphan: {path}')
+            if not options['dry_run']:
+                storage_gc.mark(*chunk)
+        action = 'found' if options['dry_run'] else 'marked for removal'
+        self.stdout.write(f'Reconcile: {orphans} orphaned files {action}')
+
+        if options['missing']:
+            missing = 0
+            for doc_id, path in storage_gc.find_missing():
+                missing += 1
+                self.stdout.write(f'Missing: document {doc_id} -> {path}')
+            self.stdout.write(f'Reconcile: {missing} documents without a file')
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from docs_analyze import jobs
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркер, выполняющий задачи анализа документов из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', choices=['db', 'kafka'],
+                            help='Очередь, из которой брать задачи (по умолчанию ANALYSIS_QUEUE)')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Пауза между опросами пустой БД-очереди, секунды')
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить все задачи из БД-очереди и завершиться')
+        parser.add_argument('--group-id', default='analysis-workers',
+                            help='Kafka consumer group')
+
+    def handle(self, *args, **options):
+        queue = options['queue'] or settings.ANALYSIS_QUEUE
+        if queue == 'kafka':
+            self.stdout.write('Analysis worker: consuming Kafka topic ' + settings.KAFKA_ANALYSIS_TOPIC)
+            jobs.run_kafka_worker(group_id=options['group_id'])
+        else:
+            self.stdout.write('Analysis worker: polling database queue')
+            jobs.run_db_worker(poll_interval=options['poll_interval'], once=options['once'])
@@ -0,0 +1,95 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from sitepytesseract import process_pool
+from sitepytesseract.db.pool import close_pools
+
+ASYNC_WORKER_CLASS = 'uvicorn.workers.UvicornWorker'
+
+
+def build_application(worker_class: str):
+    """
+        Загружает Django и URL-конфигурацию в мастер-процессе (preload):
+        воркеры получают их готовыми через fork и начинают отвечать сразу.
+    """
+    from django.urls import get_resolver
+
+    if worker_class == ASYNC_WORKER_CLASS:
+        from django.core.asgi import get_asgi_application
+        application = get_asgi_application()
+    else:
+        from django.core.wsgi import get_wsgi_application
+        application = get_wsgi_application()
+
+    get_resolver().url_patterns
+    return application
+
+
+def pre_fork(server, worker):
+    # Соединения с БД мастера не должны достаться воркерам.
+    connections.close_all()
+    close_pools()
+
+
+def worker_exit(server, worker):
+    process_pool.shutdown()
+
+
+class Command(BaseCommand):
+    help = 'Запускает сайт под gunicorn: предзагрузка, несколько воркеров, их перезапуск и мягкая остановка'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bind', default=settings.SERVER_BIND,
+                            help='Адрес и порт, например 0.0.0.0:8001')
+        parser.add_argument('--workers', type=int, default=settings.SERVER_WORKERS or None,
+                            help='Число воркеров (по умолчанию 2 * CPU + 1)')
+        parser.add_argument('--threads', type=int, default=settings.SERVER_THREADS,
+                            help='Потоков на воркер для синхронного режима')
+        parser.add_argument('--worker-class',
+                            help='Класс воркера gunicorn (по умолчанию gthread, при ASYNC_VIEWS - uvicorn)')
+        parser.add_argument('--max-requests', type=int, default=settings.SERVER_MAX_REQUESTS,
+                            help='Перезапускать воркер после стольких запросов (0 - никогда)')
+        parser.add_argument('--max-requests-jitter', type=int, default=settings.SERVER_MAX_REQUESTS_JITTER,
+                            help='Случайная добавка к max-requests, чтобы воркеры не перезапускались разом')
+        parser.add_argument('--graceful-timeout', type=int, default=settings.SERVER_GRACEFUL_TIMEOUT,
+                            help='Сколько секунд после SIGTERM ждать завершения текущих запросов')
+        parser.add_argument('--timeout', type=int, default=settings.SERVER_TIMEOUT,
+                            help='Перезапускать воркер, не отвечающий столько секунд')
+
+    def gunicorn_options(self, options) -> dict:
+        worker_class = options['worker_class'] or (ASYNC_WORKER_CLASS if settings.ASYNC_VIEWS else 'gthread')
+        return {
+            'bind': options['bind'],
+            'workers': options['workers'] or multiprocessing.cpu_count() * 2 + 1,
+            'threads': options['threads'],
+            'worker_class': worker_class,
+            'max_requests': options['max_requests'],
+            'max_requests_jitter': options['max_requests_jitter'],
+            'graceful_timeout': options['graceful_timeout'],
+            'timeout': options['timeout'],
+            'preload_app': True,
+            'pre_fork': pre_fork,
+            'worker_exit': worker_exit,
+            'accesslog': None,
+        }
+
+    def handle(self, *args, **options):
+        from gunicorn.app.base import BaseApplication
+
+        gunicorn_options = self.gunicorn_options(options)
+        application = build_application(gunicorn_options['worker_class'])
+
+        class Server(BaseApplication):
+
+            def load_config(self):
+                for key, value in gunicorn_options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return application
+
+        self.stdout.write('Serving on {bind}: {workers} x {worker_class}'.format(**gunicorn_options))
+        Server().run()
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from docs_analyze import storage_gc
+
+
+class Command(BaseCommand):
+    help = 'Запускает сборщик, удаляющий с диска файлы удалённых документов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll-interval', type=float, default=settings.MEDIA_SWEEP_INTERVAL,
+                            help='Пауза между проверками, когда удалять нечего, секунды')
+        parser.add_argument('--once', action='store_true',
+                            help='Удалить всё помеченное и завершиться')
+
+    def handle(self, *args, **options):
+        self.stdout.write('Media sweeper: removing files of deleted documents')
+        storage_gc.run_sweeper(poll_interval=options['poll_interval'], once=options['once'])
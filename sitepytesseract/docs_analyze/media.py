@@ -0,0 +1,141 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http.response import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from docs_analyze.models import UsersToDocs
+
+RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def can_view(user, file_path: str) -> bool:
+    """
+        MEDIA_ACCESS: public - всем, authenticated - вошедшим,
+        owner - суперпользователю и тем, кто загрузил документ с этим файлом (UsersToDocs).
+    """
+    access = settings.MEDIA_ACCESS
+    if access == 'public':
+        return True
+    if not user.is_authenticated:
+        return False
+    if access == 'authenticated' or user.is_superuser:
+        return True
+    return UsersToDocs.objects.filter(username=user.username, doc_id__file_path=str(file_path)).exists()
+
+
+def cache_control(max_age: int) -> str:
+    # Файлы с проверкой доступа не должны оседать в общих кэшах.
+    scope = 'public' if settings.MEDIA_ACCESS == 'public' else 'private'
+    return f'{scope}, max-age={max_age}'
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def parse_range(header: str, size: int):
+    """
+        Разбирает Range с одним диапазоном байтов.
+        Возвращает (start, end) включительно, None - отдать файл целиком
+        (нет заголовка, несколько диапазонов, другая единица), ValueError - диапазон вне файла.
+    """
+    match = RANGE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match['start'], match['end']
+    if not start and not end:
+        return None
+    if not start:
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def if_range_matches(request, etag: str, last_modified: int) -> bool:
+    value = request.headers.get('If-Range')
+    if not value:
+        return True
+    if value.startswith('"') or value.startswith('W/'):
+        return value == etag
+    return parse_http_date_safe(value) == last_modified
+
+
+def read_range(file, start: int, length: int):
+    try:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        file.close()
+
+
+def accel_response(path: str, content_type: str):
+    """
+        Отдачу файла берёт на себя фронт-прокси, воркер отвечает только заголовками.
+        nginx: X-Accel-Redirect на internal-location, смотрящий в MEDIA_ROOT;
+        sendfile: X-Sendfile с абсолютным путём (Apache mod_xsendfile, lighttpd).
+    """
+    response = HttpResponse(content_type=content_type)
+    if settings.MEDIA_ACCEL == 'nginx':
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(settings.MEDIA_ROOT))
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative)
+    else:
+        response['X-Sendfile'] = os.path.abspath(path)
+    return response
+
+
+def serve(request, path: str, max_age: int = None):
+    """
+        Отдаёт файл: через фронт-прокси (MEDIA_ACCEL), иначе сами с ETag/Last-Modified,
+        ответом 304 на If-None-Match/If-Modified-Since и поддержкой Range.
+    """
+    max_age = settings.MEDIA_CACHE_SECONDS if max_age is None else max_age
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if settings.MEDIA_ACCEL:
+        response = accel_response(path, content_type)
+        response['Cache-Control'] = cache_control(max_age)
+        return response
+
+    stat = os.stat(path)
+    etag = file_etag(stat)
+    last_modified = int(stat.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+            return response
+
+        if byte_range is not None and if_range_matches(request, etag, last_modified):
+            start, end = byte_range
+            response = StreamingHttpResponse(read_range(open(path, 'rb'), start, end - start + 1),
+                                             status=206, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            # Целиком - через FileResponse: gunicorn отдаёт его sendfile(), не читая в Python.
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = cache_control(max_age)
+    return response
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs_analyze', '0002_delete_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='docs',
+            name='digest',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
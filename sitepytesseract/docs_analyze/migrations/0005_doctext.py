@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs_analyze', '0004_analysisjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocText',
+            fields=[
+                ('doc_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='text', serialize=False, to='docs_analyze.docs')),
+                ('text', models.TextField(blank=True)),
+                ('etag', models.CharField(blank=True, max_length=128)),
+                ('stale', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
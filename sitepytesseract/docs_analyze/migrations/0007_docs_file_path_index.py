@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('docs_analyze', '0006_deletedfile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='docs',
+            name='file_path',
+            field=models.CharField(db_index=True),
+        ),
+    ]
@@ -1,27 +1,37 @@
-import os
-
 from django.db import models
+from django.utils import timezone
 from django.http.response import Http404, HttpResponse
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
 from django.template.loader import render_to_string
 
-from . import service_api
+from . import pricing, service_api, thumbnails
 
 # Create your models here.
 
+UNSUPPORTED_FILE_TYPE = "Наш сайт не поддерживает такой формат файла, если это формат картинки, сообщите админу"
+
 
 class Docs(models.Model):
 
-    file_path = models.CharField()
+    file_path = models.CharField(db_index=True)
     size = models.IntegerField()
+    digest = models.CharField(max_length=64, unique=True, null=True, blank=True)
 
     def __str__(self):
         return f"File: {self.file_path}"
 
-    def delete(self, *args, **kwargs):
-        os.remove(str(self.file_path)) if os.path.exists(str(self.file_path)) else None
-        return super().delete(*args, **kwargs)
+    @property
+    def analysis_price(self):
+        return pricing.price_for(self)
+
+    @property
+    def thumbnail_url(self):
+        return thumbnails.url(self.id)
+
+    @property
+    def thumbnail_srcset(self):
+        return thumbnails.srcset(self.id)
 
 
 class UsersToDocs(models.Model):
@@ -53,11 +63,63 @@ class Cart(models.Model):
         return f"Cart for {self.user_id}, {self.doc_id}"
 
     def save(self, *args, **kwargs):
-        file_type = os.path.splitext(self.doc_id.file_path)[1]
-        try:
-            price = get_object_or_404(Price, file_type=file_type)
-        except Http404:
-            raise ValueError("Наш сайт не поддерживает такой формат файла, если это формат картинки, сообщите админу")
-        self.order_price = price.price * self.doc_id.size
-
-        super().save(*args, **kwargs)
\ No newline at end of file
+        order_price = pricing.price_for(self.doc_id)
+        if order_price is None:
+            raise ValueError(UNSUPPORTED_FILE_TYPE)
+        self.order_price = order_price
+
+        super().save(*args, **kwargs)
+
+
+class AnalysisJob(models.Model):
+
+    class Status(models.TextChoices):
+        QUEUED = 'queued', 'В очереди'
+        RUNNING = 'running', 'Выполняется'
+        DONE = 'done', 'Готово'
+        FAILED = 'failed', 'Ошибка'
+
+    user_id = models.ForeignKey(User, on_delete=models.CASCADE)
+    doc_id = models.ForeignKey('Docs', on_delete=models.CASCADE)
+    cart_id = models.ForeignKey('Cart', on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=16, choices=Status.choices, default=Status.QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    response_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='analysis_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"AnalysisJob {self.id}: {self.doc_id}, {self.status}"
+
+    @property
+    def finished(self):
+        return self.status in (self.Status.DONE, self.Status.FAILED)
+
+
+class DocText(models.Model):
+
+    doc_id = models.OneToOneField('Docs', on_delete=models.CASCADE, primary_key=True, related_name='text')
+    text = models.TextField(blank=True)
+    etag = models.CharField(max_length=128, blank=True)
+    stale = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Text of {self.doc_id}"
+
+
+class DeletedFile(models.Model):
+
+    path = models.CharField(unique=True)
+    deleted_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    def __str__(self):
+        return f"Deleted file: {self.path}"
@@ -0,0 +1,146 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.utils.module_loading import import_string
+from PIL import Image, ImageChops, ImageOps
+
+from sitepytesseract import process_pool
+from .uploads import StreamingUpload
+
+logger = logging.getLogger(__name__)
+
+# JPEG остаётся JPEG (повторное сжатие с PREPROCESS_JPEG_QUALITY), остальное - в PNG без потерь.
+OUTPUT_FORMATS = {'JPEG': ('JPEG', '.jpg', 'image/jpeg')}
+DEFAULT_OUTPUT = ('PNG', '.png', 'image/png')
+
+
+def crop_borders(image: Image.Image, threshold: int = 16) -> Image.Image:
+    """
+        Обрезает однотонные поля по цвету левого верхнего пикселя.
+    """
+    background = Image.new(image.mode, image.size, image.getpixel((0, 0)))
+    difference = ImageChops.difference(image, background).convert('L').point(lambda v: 255 if v > threshold else 0)
+    box = difference.getbbox()
+    return image.crop(box) if box and box != (0, 0, *image.size) else image
+
+
+def deskew(image: Image.Image, max_angle: float = 5.0, step: float = 0.5) -> Image.Image:
+    """
+        Выравнивает наклон скана по профилю строк: при верном угле средние
+        яркости строк различаются сильнее всего. Угол ищется на уменьшенной копии.
+    """
+    sample = image.convert('L')
+    sample.thumbnail((800, 800))
+    sample = ImageOps.invert(sample)
+
+    def score(angle: float) -> float:
+        rotated = sample.rotate(angle, resample=Image.BILINEAR, expand=False)
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        return sum((row - mean) ** 2 for row in rows)
+
+    steps = int(max_angle / step)
+    best = max((i * step for i in range(-steps, steps + 1)), key=score)
+    if best == 0:
+        return image
+    fill = 255 if image.mode in ('L', '1') else (255,) * len(image.getbands())
+    return image.rotate(best, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+
+def reduce_image(source, grayscale: bool = True, target_dpi: int = 300, assume_dpi: int = 0,
+                 jpeg_quality: int = 90, hooks: tuple = ()):
+    """
+        Уменьшает скан перед отправкой на OCR: хуки (deskew, обрезка полей),
+        перевод в оттенки серого, уменьшение до target_dpi, пересжатие.
+        source - путь к файлу или его байты. Выполняется в пуле процессов,
+        поэтому получает все параметры аргументами.
+        Возвращает (данные, формат Pillow) или None, если уменьшить не удалось.
+    """
+    original_size = os.path.getsize(source) if isinstance(source, str) else len(source)
+    with Image.open(source if isinstance(source, str) else BytesIO(source)) as opened:
+        source_format = opened.format
+        dpi = opened.info.get('dpi', (assume_dpi, assume_dpi))[0] or assume_dpi
+        image = ImageOps.exif_transpose(opened)
+        image.load()
+
+    for hook in hooks:
+        image = import_string(hook)(image)
+
+    if grayscale and image.mode not in ('L', '1'):
+        image = image.convert('L')
+    elif image.mode not in ('L', '1', 'RGB'):
+        image = image.convert('RGB')
+
+    if target_dpi and dpi and dpi > target_dpi:
+        scale = target_dpi / dpi
+        image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                             Image.LANCZOS)
+        dpi = target_dpi
+
+    output_format = OUTPUT_FORMATS.get(source_format, DEFAULT_OUTPUT)[0]
+    options = {'dpi': (dpi, dpi)} if dpi else {}
+    if output_format == 'JPEG':
+        options.update(quality=jpeg_quality, optimize=True)
+    else:
+        options.update(optimize=True)
+
+    buffer = BytesIO()
+    image.save(buffer, format=output_format, **options)
+    data = buffer.getvalue()
+    if len(data) >= original_size:
+        return None
+    return data, output_format
+
+
+def reduce_args() -> dict:
+    return {'grayscale': settings.PREPROCESS_GRAYSCALE,
+            'target_dpi': settings.PREPROCESS_TARGET_DPI,
+            'assume_dpi': settings.PREPROCESS_ASSUME_DPI,
+            'jpeg_quality': settings.PREPROCESS_JPEG_QUALITY,
+            'hooks': tuple(settings.PREPROCESS_HOOKS)}
+
+
+def reduce(uploaded_file):
+    """
+        Уменьшенная копия загруженного файла (SimpleUploadedFile) или None:
+        предобработка не помогла, не уложилась в PREPROCESS_TIMEOUT или упала.
+    """
+    if hasattr(uploaded_file, 'temporary_file_path'):
+        source = uploaded_file.temporary_file_path()
+    else:
+        uploaded_file.seek(0)
+        source = uploaded_file.read()
+        uploaded_file.seek(0)
+
+    try:
+        future = process_pool.get_pool().submit(reduce_image, source, **reduce_args())
+        result = future.result(timeout=settings.PREPROCESS_TIMEOUT)
+    except Exception:
+        logger.warning('Could not preprocess %s, sending the original', uploaded_file.name, exc_info=True)
+        return None
+    if result is None:
+        return None
+
+    data, output_format = result
+    _, extension, content_type = OUTPUT_FORMATS.get(output_format, DEFAULT_OUTPUT)
+    name = os.path.splitext(uploaded_file.name)[0] + extension
+    return SimpleUploadedFile(name, data, content_type=content_type)
+
+
+def prepare_upload(uploaded_file, digest: str, media_dir: str = 'media/') -> StreamingUpload:
+    """
+        Загрузка для бэкенда с предобработкой (PREPROCESS_ENABLED): в бэкенд уходит
+        уменьшенный файл, у себя сохраняется оригинал (PREPROCESS_KEEP_ORIGINAL) или тоже уменьшенный.
+        Файл кладётся в каталог по sha256 оригинала (media/<digest>/<имя>): загрузка с тем же
+        именем, но другим содержимым не перезапишет чужой документ.
+    """
+    directory = os.path.join(media_dir, digest)
+    reduced = reduce(uploaded_file) if settings.PREPROCESS_ENABLED else None
+    if reduced is None:
+        return StreamingUpload(uploaded_file, os.path.join(directory, uploaded_file.name))
+    if settings.PREPROCESS_KEEP_ORIGINAL:
+        return StreamingUpload(reduced, os.path.join(directory, uploaded_file.name), original=uploaded_file)
+    return StreamingUpload(reduced, os.path.join(directory, reduced.name))
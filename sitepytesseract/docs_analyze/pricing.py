@@ -0,0 +1,86 @@
+import logging
+import os
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+CACHE_KEY = 'prices:table'
+
+_local = {'table': None, 'expires': 0.0}
+_lock = threading.Lock()
+
+
+def load_price_table() -> dict:
+    price_model = apps.get_model('docs_analyze', 'Price')
+    return dict(price_model.objects.values_list('file_type', 'price'))
+
+
+def get_price_table() -> dict:
+    """
+        Справочник цен {расширение: цена за байт}.
+        Порядок поиска: память процесса -> Redis -> одна выборка из БД.
+        Копия в памяти живёт PRICE_LOCAL_CACHE_SECONDS: так изменения цен,
+        сделанные в другом процессе, доходят до всех воркеров.
+    """
+    now = time.monotonic()
+    table = _local['table']
+    if table is not None and _local['expires'] > now:
+        return table
+
+    with _lock:
+        try:
+            table = cache.get(CACHE_KEY)
+        except Exception:
+            logger.warning('Price cache is unavailable', exc_info=True)
+            table = None
+
+        if table is None:
+            table = load_price_table()
+            try:
+                cache.set(CACHE_KEY, table, settings.PRICE_CACHE_SECONDS)
+            except Exception:
+                logger.warning('Price cache is unavailable', exc_info=True)
+
+        _local.update(table=table, expires=now + settings.PRICE_LOCAL_CACHE_SECONDS)
+    return table
+
+
+def file_type(file_path: str) -> str:
+    return os.path.splitext(file_path)[1]
+
+
+def get_price(file_path: str):
+    return get_price_table().get(file_type(file_path))
+
+
+def price_for(doc):
+    """
+        Стоимость анализа документа или None, если формат не поддерживается.
+    """
+    price = get_price(doc.file_path)
+    return None if price is None else price * doc.size
+
+
+def clear_local():
+    _local.update(table=None, expires=0.0)
+
+
+def invalidate():
+    clear_local()
+    try:
+        cache.delete(CACHE_KEY)
+    except Exception:
+        logger.warning('Price cache is unavailable', exc_info=True)
+
+
+def invalidate_on_commit(**kwargs):
+    # Сбрасываем сразу и ещё раз после коммита: иначе параллельный запрос
+    # успеет закэшировать старые цены до фиксации транзакции.
+    invalidate()
+    transaction.on_commit(invalidate)
@@ -1,35 +1,134 @@
-import requests
-from django.core.files.uploadedfile import UploadedFile
+import asyncio
+import hashlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.mixins import AccessMixin
 
 from django.http import HttpResponse
 from django.template.loader import render_to_string
 from django.views.generic.base import View
 
+from sitepytesseract.backend import (async_response_from_snapshot, get_async_client, get_client,
+                                     response_from_snapshot, response_snapshot)
+from sitepytesseract.resilience import is_failure
+from sitepytesseract.singleflight import CacheFlight, SingleFlight, get_async_flight
+from users import token_cache, tokens
 from users.views import LogoutUser
+from .uploads import StreamingUpload
+
+
+_flight = SingleFlight()
+
+# Ответы /token/verify/, после которых отказ можно кэшировать. 5xx, таймауты и отказы
+# предохранителя говорят о сбое бэкенда, а не о токене: их не запоминаем.
+DEFINITE_REJECTIONS = (400, 401)
+
+
+def get_cache_flight():
+    if not settings.SINGLE_FLIGHT_DISTRIBUTED:
+        return None
+    return CacheFlight(lock_seconds=settings.SINGLE_FLIGHT_LOCK_SECONDS,
+                       result_seconds=settings.SINGLE_FLIGHT_RESULT_SECONDS,
+                       poll_interval=settings.SINGLE_FLIGHT_POLL_INTERVAL)
+
+
+def flight_key(path: str, headers: dict = None) -> str:
+    return hashlib.sha256(repr(('GET', path, sorted((headers or {}).items()))).encode()).hexdigest()
+
+
+def coalesced_get(path: str, headers: dict = None):
+    """
+        Идемпотентный GET к бэкенду со склейкой одинаковых запросов:
+        в процессе - через SingleFlight, между воркерами - через блокировку в Redis.
+        Все ждущие получают один и тот же ответ.
+    """
+    key = flight_key(path, headers)
+    cache_flight = get_cache_flight()
+
+    def fetch():
+        return get_client().get(path, headers=headers)
+
+    if cache_flight is None:
+        return _flight.do(key, fetch)
+    return _flight.do(key, lambda: cache_flight.do(key, fetch, response_snapshot, response_from_snapshot))
+
+
+async def coalesced_get_async(path: str, headers: dict = None):
+    key = flight_key(path, headers)
+    cache_flight = get_cache_flight()
+
+    async def fetch():
+        return await get_async_client().get(path, headers=headers)
+
+    async def fetch_shared():
+        return await cache_flight.ado(key, fetch, response_snapshot, async_response_from_snapshot)
+
+    return await get_async_flight().do(key, fetch if cache_flight is None else fetch_shared)
 
-base_url = 'http://nginx:80/api/v1'
 
-def api_upload(file: UploadedFile):
-    response = requests.post(base_url + '/upload_doc/', files={'file': file})
+def api_upload(upload: StreamingUpload):
+    response = get_client().post('/upload_doc/', data=upload, headers=upload.headers)
     return response
 
 def api_delete(file_id: int):
-    response = requests.delete(base_url + f'/doc_delete/{file_id}')
+    response = get_client().delete(f'/doc_delete/{file_id}')
     return response
 
 def api_analyze(file_id: int):
-    response = requests.post(base_url + f'/doc_analyze/{file_id}')
+    response = get_client().post(f'/doc_analyze/{file_id}')
     return response
 
-def api_get_text(file_id: int):
-    response = requests.get(base_url + f'/get_text/{file_id}')
+def api_get_text(file_id: int, etag: str = None):
+    headers = {'If-None-Match': etag} if etag else None
+    response = coalesced_get(f'/get_text/{file_id}', headers=headers)
     return response
 
+async def api_upload_async(upload: StreamingUpload):
+    response = await get_async_client().post('/upload_doc/', content=upload.__aiter__(), headers=upload.headers)
+    return response
+
+async def api_delete_async(file_id: int):
+    response = await get_async_client().delete(f'/doc_delete/{file_id}')
+    return response
+
+async def api_analyze_async(file_id: int):
+    response = await get_async_client().post(f'/doc_analyze/{file_id}')
+    return response
+
+async def api_get_text_async(file_id: int, etag: str = None):
+    headers = {'If-None-Match': etag} if etag else None
+    response = await coalesced_get_async(f'/get_text/{file_id}', headers=headers)
+    return response
+
+def verify_token_offline(token, token_type='access'):
+    """
+        Проверка токена без запроса к бэкенду: локально по ключу или по кэшу.
+        None означает, что нужна проверка через /token/verify/.
+    """
+    if not token:
+        return False
+
+    local_result = tokens.verify_locally(token, token_type)
+    if local_result is not None:
+        return local_result
+
+    return token_cache.get(token, token_type)
+
 def api_error_handler(status_code, message):
     context_error = {'status_code': status_code, 'message': message}
     html = render_to_string('docs_analyze/error_message.html', context_error)
     return HttpResponse(html, status=status_code)
 
+
+def auth_unavailable():
+    """
+        Ответ при недоступном сервисе авторизации (5xx, таймаут, открытый предохранитель).
+        Токен при этом не признан недействительным, поэтому сессию не сбрасываем.
+    """
+    return api_error_handler(503, 'Authorization service is temporarily unavailable, please try again later.')
+
+
 class JWTView(View):
 
     def assigning_access_token(self, jwt_proxi_json, response):
@@ -40,17 +139,31 @@ class JWTView(View):
         logout_view = LogoutUser.as_view()
         logout_view(request)
 
-    def verify_jwt_token(self, token):
-        verify_response = requests.post(base_url + '/token/verify/', json={'token': token})
-        return True if verify_response.status_code == 200 else False
+    def verify_jwt_token(self, token, token_type='access'):
+        offline_result = verify_token_offline(token, token_type)
+        if offline_result is not None:
+            return offline_result
+
+        verify_response = get_client().post('/token/verify/', json={'token': token})
+        if is_failure(verify_response.status_code):
+            return None
+        verified = True if verify_response.status_code == 200 else False
+        if verified or verify_response.status_code in DEFINITE_REJECTIONS:
+            token_cache.store(token, token_type, verified)
+        return verified
 
     def check_jwt(self, access_bool, refresh_token):
 
         if not refresh_token:
             return api_error_handler(500, 'Something went wrong on our server')
 
+        if access_bool is None:
+            return auth_unavailable()
+
         if not access_bool:
-            refresh_bool = self.verify_jwt_token(refresh_token)
+            refresh_bool = self.verify_jwt_token(refresh_token, token_type='refresh')
+            if refresh_bool is None:
+                return auth_unavailable()
             if not refresh_bool:
                 return api_error_handler(401, 'Please log in.')
 
@@ -62,15 +175,18 @@ class JWTView(View):
 
         jwt_errors = self.check_jwt(access_bool, refresh_token)
         if jwt_errors:
-            self.logout_user(request)
+            # 503 - бэкенд авторизации недоступен: пользователь остаётся в системе.
+            if jwt_errors.status_code != 503:
+                self.logout_user(request)
             return jwt_errors
 
         if not access_bool:
-            jwt_proxi_response = requests.post(base_url + '/token/refresh/',
-                                               json={'refresh': refresh_token})
+            jwt_proxi_response = get_client().post('/token/refresh/',
+                                                   json={'refresh': refresh_token})
             jwt_data = jwt_proxi_response.json()
             if jwt_proxi_response.status_code != 200:
-                self.logout_user(request)
+                if not is_failure(jwt_proxi_response.status_code):
+                    self.logout_user(request)
                 return api_error_handler(jwt_proxi_response.status_code, 'Something went wrong on our server')
             response = super().dispatch(request, *args, **kwargs)
             self.assigning_access_token(jwt_data, response)
@@ -78,3 +194,86 @@ class JWTView(View):
 
         return super().dispatch(request, *args, **kwargs)
 
+
+class AsyncJWTView(AccessMixin, JWTView):
+    """
+        Асинхронный вариант JWTView для ASGI.
+        Проверка токена, загрузка пользователя и prefetch() выполняются параллельно.
+    """
+
+    def test_func(self):
+        return True
+
+    async def prefetch(self, request, *args, **kwargs):
+        """
+            Независимые от авторизации запросы (например, поиск документа).
+            Результат доступен обработчику как self.prefetched.
+        """
+        return None
+
+    async def logout_user(self, request):
+        logout_view = LogoutUser.as_view()
+        await sync_to_async(logout_view)(request)
+
+    async def verify_jwt_token(self, token, token_type='access'):
+        offline_result = await sync_to_async(verify_token_offline)(token, token_type)
+        if offline_result is not None:
+            return offline_result
+
+        verify_response = await get_async_client().post('/token/verify/', json={'token': token})
+        if is_failure(verify_response.status_code):
+            return None
+        verified = True if verify_response.status_code == 200 else False
+        if verified or verify_response.status_code in DEFINITE_REJECTIONS:
+            await sync_to_async(token_cache.store)(token, token_type, verified)
+        return verified
+
+    async def check_jwt(self, access_bool, refresh_token):
+
+        if not refresh_token:
+            return api_error_handler(500, 'Something went wrong on our server')
+
+        if access_bool is None:
+            return auth_unavailable()
+
+        if not access_bool:
+            refresh_bool = await self.verify_jwt_token(refresh_token, token_type='refresh')
+            if refresh_bool is None:
+                return auth_unavailable()
+            if not refresh_bool:
+                return api_error_handler(401, 'Please log in.')
+
+    async def dispatch(self, request, *args, **kwargs):
+        refresh_token = request.COOKIES.get('refresh_token')
+        access_token = request.COOKIES.get('access_token')
+
+        # request.user ленивый и ходит в БД: вычисляем его в потоке заранее.
+        access_bool, _, self.prefetched = await asyncio.gather(
+            self.verify_jwt_token(access_token),
+            sync_to_async(lambda: request.user.is_authenticated)(),
+            self.prefetch(request, *args, **kwargs),
+        )
+
+        jwt_errors = await self.check_jwt(access_bool, refresh_token)
+        if jwt_errors:
+            # 503 - бэкенд авторизации недоступен: пользователь остаётся в системе.
+            if jwt_errors.status_code != 503:
+                await self.logout_user(request)
+            return jwt_errors
+
+        if not self.test_func():
+            return self.handle_no_permission()
+
+        if not access_bool:
+            jwt_proxi_response = await get_async_client().post('/token/refresh/',
+                                                               json={'refresh': refresh_token})
+            jwt_data = jwt_proxi_response.json()
+            if jwt_proxi_response.status_code != 200:
+                if not is_failure(jwt_proxi_response.status_code):
+                    await self.logout_user(request)
+                return api_error_handler(jwt_proxi_response.status_code, 'Something went wrong on our server')
+            response = await View.dispatch(self, request, *args, **kwargs)
+            self.assigning_access_token(jwt_data, response)
+            return response
+
+        return await View.dispatch(self, request, *args, **kwargs)
@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import doc_text, pricing, storage_gc
+from .models import Docs, Price
+
+
+@receiver(post_save, sender=Price)
+@receiver(post_delete, sender=Price)
+def price_changed(sender, **kwargs):
+    pricing.invalidate_on_commit()
+
+
+@receiver(post_delete, sender=Docs)
+def doc_deleted(sender, instance, **kwargs):
+    # Строка DocText удаляется каскадом, остаётся убрать текст из кэша.
+    doc_id = instance.pk
+    doc_text.forget(doc_id)
+    transaction.on_commit(lambda: doc_text.forget(doc_id))
+    # Сигнал приходит и при удалении через QuerySet и каскадом (админка), в отличие от Docs.delete.
+    # Файл удалит сборщик (sweep_media), запрос на диск не ждёт.
+    storage_gc.mark(instance.file_path)
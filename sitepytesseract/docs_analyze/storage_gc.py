@@ -0,0 +1,204 @@
+import logging
+import os
+import re
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from PIL import Image
+
+from docs_analyze.models import DeletedFile, Docs
+from . import pricing, thumbnails
+from .jobs import release_connections
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_NAME = re.compile(r'^(?P<root>.+)\.thumb\d+\.[a-z]+$')
+PARTIAL_SUFFIX = '.part'
+
+
+def absolute_path(path: str) -> str:
+    """
+        Docs.file_path и DeletedFile.path хранятся относительно BASE_DIR,
+        а сборщик и сверка могут быть запущены из любого каталога.
+    """
+    return os.path.join(str(settings.BASE_DIR), str(path))
+
+
+def mark(*paths):
+    """
+        Помечает файлы к удалению. Вызывается в транзакции удаления документа:
+        если удаление откатится, пометка откатится вместе с ним.
+    """
+    now = timezone.now()
+    DeletedFile.objects.bulk_create([DeletedFile(path=str(path), deleted_at=now) for path in paths if path],
+                                    update_conflicts=True, unique_fields=['path'],
+                                    update_fields=['deleted_at', 'attempts', 'error'])
+
+
+def remove_file(path: str, deleted_at: float) -> bool:
+    """
+        Удаляет файл и его миниатюры. Файл, изменённый после пометки, не трогается:
+        под тем же именем успели загрузить новый документ.
+        Возвращает False, если файл остался на месте из-за этого.
+    """
+    path = absolute_path(path)
+    try:
+        if os.stat(path).st_mtime > deleted_at:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    thumbnails.remove(path)
+    return True
+
+
+def sweep(batch_size: int = None) -> int:
+    """
+        Удаляет с диска одну пачку помеченных файлов. Несколько сборщиков могут
+        работать одновременно: строки пачки блокируются через SKIP LOCKED.
+        Файл, на который снова ссылается документ, не удаляется.
+        Возвращает число обработанных пометок.
+    """
+    batch_size = batch_size or settings.MEDIA_SWEEP_BATCH_SIZE
+    with transaction.atomic():
+        batch = list(DeletedFile.objects
+                     .select_for_update(skip_locked=True)
+                     .filter(attempts__lt=settings.MEDIA_SWEEP_MAX_ATTEMPTS)
+                     .order_by('id')[:batch_size])
+        if not batch:
+            return 0
+
+        in_use = set(Docs.objects.filter(file_path__in=[item.path for item in batch])
+                     .values_list('file_path', flat=True))
+        done, failed = [], []
+        for item in batch:
+            if item.path in in_use:
+                done.append(item.id)
+                continue
+            try:
+                remove_file(item.path, item.deleted_at.timestamp())
+            except OSError as e:
+                logger.warning('Could not remove %s: %s', item.path, e)
+                item.error = str(e)
+                failed.append(item)
+                continue
+            done.append(item.id)
+
+        DeletedFile.objects.filter(id__in=done).delete()
+        for item in failed:
+            DeletedFile.objects.filter(id=item.id).update(attempts=F('attempts') + 1, error=item.error)
+    return len(batch)
+
+
+def run_sweeper(poll_interval: float = None, once: bool = False):
+    """
+        Цикл сборщика: удаляет пачки, пока они есть, затем ждёт poll_interval.
+    """
+    poll_interval = settings.MEDIA_SWEEP_INTERVAL if poll_interval is None else poll_interval
+    while True:
+        release_connections()
+        if sweep():
+            continue
+        if once:
+            return
+        time.sleep(poll_interval)
+
+
+def scan(root: str):
+    """
+        Потоковый обход каталога через os.scandir: в памяти только текущий
+        каталог стека, а не список всех файлов.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+
+
+def chunks(iterable, size: int):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def known_paths(paths: list) -> set:
+    return set(Docs.objects.filter(file_path__in=paths).values_list('file_path', flat=True))
+
+
+def source_extensions() -> set:
+    """
+        Расширения, с которыми могут храниться оригиналы: форматы UPLOAD_IMAGE_FORMATS
+        по таблице Pillow и типы файлов из прайса, в нижнем и верхнем регистре.
+    """
+    formats = set(settings.UPLOAD_IMAGE_FORMATS)
+    extensions = {ext for ext, fmt in Image.registered_extensions().items() if fmt in formats}
+    extensions.update(pricing.get_price_table())
+    return extensions | {ext.upper() for ext in extensions}
+
+
+def known_roots(roots: list, extensions: set) -> set:
+    """
+        Корни имён (без расширения), у которых есть документ: для проверки миниатюр.
+        Ищем точные пути корень + расширение: сравнение на равенство использует индекс
+        по file_path при любой collation, в отличие от LIKE 'корень.%'.
+    """
+    candidates = {root + ext: root for root in roots for ext in extensions}
+    if not candidates:
+        return set()
+    return {candidates[path] for path in known_paths(list(candidates))}
+
+
+def find_orphans(root: str, min_age: float, chunk_size: int = 1000):
+    """
+        Файлы в root, на которые не ссылается ни один документ: оригиналы, миниатюры
+        и брошенные недокачанные .part. Файлы моложе min_age секунд пропускаются -
+        они могут принадлежать загрузке, которая ещё не создала запись в БД.
+        Пути возвращаются относительно BASE_DIR, как в Docs.file_path, независимо
+        от текущего каталога процесса.
+    """
+    base_dir = str(settings.BASE_DIR)
+    extensions = source_extensions()
+    cutoff = time.time() - min_age
+    entries = (entry for entry in scan(absolute_path(root))
+               if entry.stat(follow_symlinks=False).st_mtime < cutoff)
+    for chunk in chunks(entries, chunk_size):
+        paths = [os.path.relpath(entry.path, base_dir) for entry in chunk]
+        originals, thumbs = [], {}
+        for path in paths:
+            match = THUMBNAIL_NAME.match(path)
+            if match:
+                thumbs[path] = match['root']
+            elif not path.endswith(PARTIAL_SUFFIX):
+                originals.append(path)
+                # Нестандартные расширения (.Jpg и т.п.) берём из встреченных оригиналов.
+                extensions.add(os.path.splitext(path)[1])
+
+        known = known_paths(originals)
+        roots = known_roots(list(set(thumbs.values())), extensions)
+        for path in paths:
+            if path in thumbs:
+                if thumbs[path] not in roots:
+                    yield path
+            elif path not in known:
+                yield path
+
+
+def find_missing(chunk_size: int = 1000):
+    """
+        Документы, файла которых нет на диске.
+    """
+    for doc_id, path in Docs.objects.values_list('id', 'file_path').iterator(chunk_size=chunk_size):
+        if not os.path.exists(absolute_path(path)):
+            yield doc_id, path
@@ -1,15 +1,54 @@
+import asyncio
+import base64
+import glob
+import hashlib
+import hmac
+import json
+import logging
 import os
-from unittest.mock import patch, MagicMock
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch, AsyncMock, MagicMock
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import MemoryFileUploadHandler, StopUpload
 from django.http.response import HttpResponse
-from django.test import TestCase, RequestFactory
-
-from .forms import UploadDocsForm, AnalyzeDocsForm
-from .models import Docs, UsersToDocs, Price, Cart
+from django.test import AsyncRequestFactory, TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from prometheus_client import REGISTRY
+
+from .management.commands import serve
+from .forms import UploadDocsForm, AnalyzeDocsForm, BatchAnalyzeDocsForm
+from .models import AnalysisJob, DeletedFile, Docs, DocText, UsersToDocs, Price, Cart
+from . import doc_text, jobs, preprocessing, pricing, service_api, storage_gc, thumbnails, validators
+from .async_views import AsyncAnalyzeDocs, AsyncGetTextDocs
 from .service_api import JWTView
-from .views import DocsHome, UploadDocs, GetTextDocs, AnalyzeDocs, DeleteDocs
+from .upload_handlers import ImageLimitsUploadHandler
+from .uploads import StreamingUpload
+from .views import DocsHome, UploadDocs, GetTextDocs, AnalyzeDocs, DeleteDocs, BatchAnalyzeDocs
+from sitepytesseract.backend import (AsyncBackendClient, BackendClient, InstrumentedAdapter, endpoint_label, get_client,
+                                     response_from_snapshot)
+from sitepytesseract.db.pool import ConnectionPool, PoolTimeout
+from sitepytesseract import process_pool
+from sitepytesseract.middleware import QueryCountMiddleware
+from sitepytesseract.resilience import Bulkhead, CircuitBreaker, CircuitBreakers
+from sitepytesseract.singleflight import AsyncSingleFlight, SingleFlight
+from users import token_cache
+from users.views import LogoutUser
 
 
 class JWTViewTest(TestCase):
@@ -18,21 +57,34 @@ class JWTViewTest(TestCase):
         self.user = User.objects.create_user(username='testuser', email='<EMAIL>', password='<PASSWORD>')
         self.view = JWTView.as_view()
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_verify_jwt(self, mock_post):
         mock_post.return_value = MagicMock(status_code=200)
 
         view = JWTView()
         self.assertTrue(view.verify_jwt_token("valid_token"))
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_verify_jwt_negative(self, mock_post):
         mock_post.return_value = MagicMock(status_code=401)
 
         view = JWTView()
         self.assertFalse(view.verify_jwt_token("valid_token"))
 
-    @patch('requests.post')
+    @patch('users.token_cache.store')
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_verify_jwt_outage_not_cached(self, mock_post, mock_store):
+        view = JWTView()
+        for status_code in (500, 503, 504):
+            mock_post.return_value = MagicMock(status_code=status_code)
+            view.verify_jwt_token('valid_token')
+        self.assertFalse(mock_store.called)
+
+        mock_post.return_value = MagicMock(status_code=401)
+        view.verify_jwt_token('valid_token')
+        mock_store.assert_called_once_with('valid_token', 'access', False)
+
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_check_jwt(self, mock_post):
         mock_post.return_value = MagicMock(status_code=200)
 
@@ -40,7 +92,7 @@ class JWTViewTest(TestCase):
         response = view.check_jwt(True, "valid_token")
         self.assertEqual(response, None)
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_check_jwt_negative_logout(self, mock_post):
         mock_post.return_value = MagicMock(status_code=401)
 
@@ -49,7 +101,7 @@ class JWTViewTest(TestCase):
         self.assertEqual(response.status_code, 401)
         self.assertIn('Please log in.', response.content.decode())
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_check_jwt_negative_internal(self, mock_post):
         mock_post.return_value = MagicMock(status_code=401)
 
@@ -58,6 +110,42 @@ class JWTViewTest(TestCase):
         self.assertEqual(response.status_code, 500)
         self.assertIn('Something went wrong on our server', response.content.decode())
 
+    @patch('requests.Session.request')
+    @patch('docs_analyze.service_api.JWTView.logout_user')
+    def test_dispatch_breaker_open_keeps_session(self, mock_logout_user, mock_request):
+        cache.clear()
+        client_api = BackendClient('http://backend:80/api/v1/', breakers=CircuitBreakers(failures=1, open_seconds=60))
+        client_api.breakers['/token/verify/'].trip()
+        request = self.factory.get('/')
+        request.COOKIES['access_token'] = 'test_access_token'
+        request.COOKIES['refresh_token'] = 'test_refresh_token'
+
+        with patch('docs_analyze.service_api.get_client', return_value=client_api):
+            response = self.view(request)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(mock_logout_user.called)
+        self.assertFalse(mock_request.called)
+
+    @patch('requests.Session.request')
+    @patch('docs_analyze.service_api.JWTView.logout_user')
+    def test_dispatch_transport_errors_keep_session(self, mock_logout_user, mock_request):
+        cache.clear()
+        client_api = BackendClient('http://backend:80/api/v1/', retries=0, backoff=0, jitter=0)
+        request = self.factory.get('/')
+        request.COOKIES['access_token'] = 'test_access_token'
+        request.COOKIES['refresh_token'] = 'test_refresh_token'
+
+        with patch('docs_analyze.service_api.get_client', return_value=client_api):
+            mock_request.side_effect = requests.Timeout()
+            self.assertEqual(self.view(request).status_code, 503)
+
+            mock_request.side_effect = [MagicMock(status_code=401), MagicMock(status_code=200),
+                                        requests.ConnectionError()]
+            self.assertEqual(self.view(request).status_code, 503)
+
+        self.assertFalse(mock_logout_user.called)
+
     def test_asigning_access_token(self):
         view = JWTView()
         response = HttpResponse({'message': 'response'})
@@ -69,7 +157,7 @@ class JWTViewTest(TestCase):
         self.assertTrue(response.cookies['access_token']['httponly'])
         self.assertTrue(response.cookies['access_token']['secure'])
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     @patch('docs_analyze.service_api.JWTView.check_jwt')
     @patch('docs_analyze.service_api.JWTView.logout_user')
     def test_dispatch_jwt_error(self, mock_logout_user, mock_check_jwt, mock_post):
@@ -85,7 +173,7 @@ class JWTViewTest(TestCase):
         self.assertEqual(response.status_code, 401)
         self.assertIn('Logging Error', response.message)
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     @patch('docs_analyze.service_api.JWTView.check_jwt')
     @patch('docs_analyze.service_api.JWTView.logout_user')
     @patch('docs_analyze.service_api.JWTView.verify_jwt_token')
@@ -103,7 +191,7 @@ class JWTViewTest(TestCase):
         self.assertEqual(response.status_code, 599)
         self.assertIn('Something went wrong on our server', response.content.decode())
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     @patch('docs_analyze.service_api.JWTView.check_jwt')
     def test_dispatch_jwt_response_refresh(self, mock_check_jwt, mock_post):
         request = self.factory.get('/some-url/')
@@ -131,6 +219,184 @@ class JWTViewTest(TestCase):
         self.assertEqual(response.status_code, 405)
 
 
+def make_jwt(payload, key='test-key', alg='HS256', header=None):
+    def b64(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).rstrip(b'=').decode()
+
+    signing_input = f"{b64(dict({'alg': alg, 'typ': 'JWT'}, **(header or {})))}.{b64(payload)}"
+    signature = hmac.new(key.encode(), signing_input.encode(), hashlib.sha256).digest()
+    return signing_input + '.' + base64.urlsafe_b64encode(signature).rstrip(b'=').decode()
+
+
+@override_settings(JWT_SIGNING_KEY='test-key')
+class LocalJWTTest(TestCase):
+    def setUp(self):
+        self.view = JWTView()
+
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_local_verify_positive(self, mock_post):
+        token = make_jwt({'token_type': 'access', 'exp': time.time() + 60})
+
+        self.assertTrue(self.view.verify_jwt_token(token))
+        self.assertFalse(mock_post.called)
+
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_local_verify_expired(self, mock_post):
+        token = make_jwt({'token_type': 'access', 'exp': time.time() - 60})
+
+        self.assertFalse(self.view.verify_jwt_token(token))
+        self.assertFalse(mock_post.called)
+
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_local_verify_bad_signature_and_type(self, mock_post):
+        forged = make_jwt({'token_type': 'access', 'exp': time.time() + 60}, key='other-key')
+        refresh = make_jwt({'token_type': 'refresh', 'exp': time.time() + 60})
+
+        self.assertFalse(self.view.verify_jwt_token(forged))
+        self.assertFalse(self.view.verify_jwt_token(refresh))
+        self.assertTrue(self.view.verify_jwt_token(refresh, token_type='refresh'))
+        self.assertFalse(mock_post.called)
+
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_local_verify_unknown_key_fallback(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=200)
+        token = make_jwt({'token_type': 'access', 'exp': time.time() + 60}, header={'kid': 'rotated'})
+
+        self.assertTrue(self.view.verify_jwt_token(token))
+        self.assertTrue(mock_post.called)
+
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = JWTView()
+        token_cache.clear()
+        self.token = make_jwt({'token_type': 'access', 'exp': time.time() + 60})
+
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_cached_positive(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=200)
+
+        self.assertTrue(self.view.verify_jwt_token(self.token))
+        self.assertTrue(self.view.verify_jwt_token(self.token))
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_cached_negative(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=401)
+
+        self.assertFalse(self.view.verify_jwt_token(self.token))
+        self.assertFalse(self.view.verify_jwt_token(self.token))
+        self.assertEqual(mock_post.call_count, 1)
+
+    @patch('sitepytesseract.backend.BackendClient.post')
+    def test_evict_on_logout(self, mock_post):
+        mock_post.return_value = MagicMock(status_code=200)
+        self.assertTrue(self.view.verify_jwt_token(self.token))
+
+        request = self.factory.get('logout/')
+        request.session = self.client.session
+        request.COOKIES['access_token'] = self.token
+        LogoutUser.as_view()(request)
+
+        self.assertIsNone(token_cache.get(self.token))
+        self.assertTrue(self.view.verify_jwt_token(self.token))
+        self.assertEqual(mock_post.call_count, 2)
+
+
+class BackendClientTest(TestCase):
+    def setUp(self):
+        self.client_api = BackendClient('http://backend:80/api/v1/', pool_size=4, retries=3)
+
+    def test_url_and_pool(self):
+        adapter = self.client_api.session.get_adapter('http://backend:80/')
+
+        self.assertEqual(self.client_api.url('/get_text/1'), 'http://backend:80/api/v1/get_text/1')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        self.assertEqual(adapter.max_retries.total, 3)
+        self.assertNotIn('POST', adapter.max_retries.allowed_methods)
+        self.assertIs(get_client(), get_client())
+
+    @patch('requests.Session.request')
+    def test_default_timeout(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=200)
+
+        self.client_api.get('/get_text/1')
+        self.assertEqual(mock_request.call_args.kwargs['timeout'], self.client_api.timeout)
+
+    @patch('requests.Session.request')
+    def test_connection_error_response(self, mock_request):
+        import requests
+        mock_request.side_effect = requests.ConnectionError()
+
+        response = self.client_api.post('/doc_analyze/1')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('detail', response.json())
+
+    @patch('requests.Session.request')
+    def test_call_metrics(self, mock_request):
+        mock_request.return_value = MagicMock(status_code=200, raw=MagicMock(retries=MagicMock(history=[1, 2])))
+        labels = {'method': 'GET', 'endpoint': '/get_text/{id}'}
+
+        def sample(name, **extra):
+            return REGISTRY.get_sample_value(name, {**labels, **extra}) or 0
+
+        before = sample('backend_responses_total', status='200'), sample('backend_retries_total')
+        self.client_api.get('/get_text/17')
+        self.client_api.get('/get_text/18')
+
+        self.assertEqual(endpoint_label('token/verify/'), '/token/verify/')
+        self.assertEqual(sample('backend_responses_total', status='200'), before[0] + 2)
+        self.assertEqual(sample('backend_retries_total'), before[1] + 4)
+        self.assertEqual(REGISTRY.get_sample_value('backend_requests_in_flight', {'endpoint': '/get_text/{id}'}), 0)
+        self.assertIsInstance(self.client_api.session.get_adapter('http://backend:80/'), InstrumentedAdapter)
+
+    @patch('requests.Session.request')
+    def test_circuit_breaker(self, mock_request):
+        cache.clear()
+        client_api = BackendClient('http://backend:80/api/v1/', breakers=CircuitBreakers(failures=2, open_seconds=60))
+        breaker = client_api.breakers['/doc_analyze/{id}']
+        mock_request.return_value = MagicMock(status_code=502)
+
+        client_api.post('/doc_analyze/1')
+        client_api.post('/doc_analyze/2')
+        self.assertEqual(breaker.state(), CircuitBreaker.OPEN)
+
+        response = client_api.post('/doc_analyze/3')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(mock_request.call_count, 2)
+        self.assertEqual(client_api.breakers['/get_text/{id}'].state(), CircuitBreaker.CLOSED)
+
+        cache.set(breaker.open_key, time.time() - 1)
+        mock_request.return_value = MagicMock(status_code=200)
+        self.assertEqual(client_api.post('/doc_analyze/4').status_code, 200)
+        self.assertEqual(breaker.state(), CircuitBreaker.CLOSED)
+
+    def test_circuit_breaker_counts_failures_in_window(self):
+        cache.clear()
+        breaker = CircuitBreaker('/mixed', failures=3, window=30, open_seconds=60)
+
+        states = []
+        for _ in range(3):
+            breaker.record(CircuitBreaker.CLOSED, success=False)
+            for _ in range(100):
+                breaker.record(CircuitBreaker.CLOSED, success=True)
+            states.append(breaker.state())
+
+        # Успешные ответы между ошибками не сбрасывают счётчик окна.
+        self.assertEqual(states, [CircuitBreaker.CLOSED, CircuitBreaker.CLOSED, CircuitBreaker.OPEN])
+
+    @patch('requests.Session.request')
+    def test_bulkhead_full(self, mock_request):
+        client_api = BackendClient('http://backend:80/api/v1/', bulkhead=Bulkhead({'analyze': 1}, wait=0))
+        mock_request.return_value = MagicMock(status_code=200)
+
+        with client_api.bulkhead.slot('analyze'):
+            self.assertEqual(client_api.post('/doc_analyze/1').status_code, 503)
+            self.assertEqual(client_api.post('/token/verify/').status_code, 200)
+        self.assertEqual(client_api.post('/doc_analyze/1').status_code, 200)
+
+
 class TestDocsHome(TestCase):
     def setUp(self):
         self.factory = RequestFactory()
@@ -148,6 +414,27 @@ class TestDocsHome(TestCase):
         response = self.view(request)
         self.assertEqual(response.status_code, 405)
 
+    @override_settings(DOCS_PAGE_SIZE=2)
+    def test_keyset_pages(self):
+        ids = [Docs.objects.create(file_path=f'page{i}.png', size=1).id for i in range(5)]
+
+        first = self.view(self.factory.get('/')).context_data
+        self.assertEqual([doc.id for doc in first['docs']], [ids[4], ids[3]])
+        self.assertIsNone(first['previous_cursor'])
+
+        second = self.view(self.factory.get('/', {'after': first['next_cursor']})).context_data
+        self.assertEqual([doc.id for doc in second['docs']], [ids[2], ids[1]])
+        self.assertEqual(second['previous_cursor'], ids[2])
+
+        back = self.view(self.factory.get('/', {'before': second['previous_cursor']})).context_data
+        self.assertEqual(back['docs'], first['docs'])
+        self.assertIsNone(back['previous_cursor'])
+        self.assertEqual(back['next_cursor'], first['next_cursor'])
+
+        last = self.view(self.factory.get('/', {'after': ids[1]})).context_data
+        self.assertEqual([doc.id for doc in last['docs']], [ids[0]])
+        self.assertIsNone(last['next_cursor'])
+
 
 class TestUploadDocs(TestCase):
 
@@ -161,14 +448,21 @@ class TestUploadDocs(TestCase):
         self.client.login(username='testuser', password='<PASSWORD>')
 
         self.static_path = 'docs_analyze/static/docs_analyze/test_images/image_for_analyzing.png'
-        self.test_path = 'media/test.png'
         with open(self.static_path, 'rb+') as file:
-            file_test = SimpleUploadedFile('test.png', file.read(), content_type='image/png')
+            content = file.read()
+            file_test = SimpleUploadedFile('test.png', content, content_type='image/png')
             self.form = UploadDocsForm(files={'file': file_test})
+        self.test_path = f'media/{hashlib.sha256(content).hexdigest()}/test.png'
+
+    def tearDown(self):
+        for path in glob.glob('media/*/test.png'):
+            os.remove(path)
+            os.rmdir(os.path.dirname(path))
 
 
     @patch('docs_analyze.service_api.api_upload')
     def test_negative_response_upload(self, mock_upload):
+        self.view.request = self.factory.post('/upload/')
         mock_upload.return_value = MagicMock(status_code=402, json=lambda: {'detail': 'Test Error'})
         self.assertTrue(self.form.is_valid())
 
@@ -193,7 +487,219 @@ class TestUploadDocs(TestCase):
 
         self.assertTrue(os.path.isfile(self.test_path))
 
-        os.remove(self.test_path)
+    @patch('docs_analyze.service_api.api_upload')
+    def test_same_name_different_content(self, mock_upload):
+        request = self.factory.post('/upload/')
+        request.user = self.user
+        self.view.request = request
+        mock_upload.return_value = MagicMock(status_code=200)
+        buffer = BytesIO()
+        Image.new('RGB', (20, 20), 'blue').save(buffer, 'PNG')
+        other = UploadDocsForm(files={'file': SimpleUploadedFile('test.png', buffer.getvalue())})
+        self.assertTrue(self.form.is_valid())
+        self.assertTrue(other.is_valid())
+
+        self.view.form_valid(self.form)
+        self.view.form_valid(other)
+
+        self.assertEqual(Docs.objects.count(), 2)
+        for doc in Docs.objects.all():
+            with open(doc.file_path, 'rb') as f:
+                self.assertEqual(hashlib.sha256(f.read()).hexdigest(), doc.digest)
+
+    @patch('docs_analyze.service_api.api_upload')
+    def test_duplicate_upload_is_linked(self, mock_upload):
+        other_user = User.objects.create_user(username='otheruser', password='<PASSWORD>')
+        with open(self.static_path, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        doc = Docs.objects.create(file_path='media/existing.png', size=10, digest=digest)
+
+        request = self.factory.post('/upload/')
+        request.user = other_user
+        self.view.request = request
+        self.assertTrue(self.form.is_valid())
+
+        response = self.view.form_valid(self.form)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertFalse(mock_upload.called)
+        self.assertFalse(os.path.exists(self.test_path))
+        self.assertEqual(Docs.objects.count(), 1)
+        self.assertTrue(UsersToDocs.objects.filter(username='otheruser', doc_id=doc).exists())
+
+    def test_digest_upload_handler(self):
+        with open(self.static_path, 'rb') as file:
+            content = file.read()
+
+        request = self.factory.post('/upload/', {'file': SimpleUploadedFile('test.png', content)})
+
+        self.assertEqual(request.FILES['file'].read(), content)
+        self.assertEqual(request.upload_digests['file'], hashlib.sha256(content).hexdigest())
+
+
+class TestStatisticsMiddleware(TestCase):
+    def sample(self, route, status):
+        return REGISTRY.get_sample_value('request_total', {'method': 'GET', 'route': route, 'status': status}) or 0
+
+    def test_bounded_labels(self):
+        home, unmatched = self.sample('home', '2xx'), self.sample('<unmatched>', '4xx')
+
+        self.client.get('/', HTTP_USER_AGENT='agent-1')
+        self.client.get('/?after=100', HTTP_USER_AGENT='agent-2')
+        self.client.get('/no/such/page')
+
+        self.assertEqual(self.sample('home', '2xx'), home + 2)
+        self.assertEqual(self.sample('<unmatched>', '4xx'), unmatched + 1)
+
+    @override_settings(REQUEST_LOG_SAMPLE_RATE=1.0)
+    def test_sampled_request_log(self):
+        logger = logging.getLogger('sitepytesseract.requests')
+        self.assertTrue(logger.isEnabledFor(logging.INFO))
+        self.assertTrue(logger.handlers)
+
+        with self.assertLogs(logger, 'INFO') as logs:
+            self.client.get('/', HTTP_USER_AGENT='agent-1', HTTP_REFERER='http://example.com/')
+
+        self.assertIn('ip=127.0.0.1', logs.output[0])
+        self.assertIn('user_agent="agent-1"', logs.output[0])
+        self.assertIn('referrer="http://example.com/"', logs.output[0])
+
+    def test_query_count_header(self):
+        def view(request):
+            list(Docs.objects.all())
+            list(Price.objects.all())
+            return HttpResponse()
+
+        response = QueryCountMiddleware(view)(RequestFactory().get('/'))
+
+        self.assertEqual(response['X-DB-Queries'], '2')
+
+
+class TestStreamingUpload(TestCase):
+    def setUp(self):
+        self.content = os.urandom(200 * 1024)
+        self.path = 'media/test_stream.bin'
+        self.file = SimpleUploadedFile('test_stream.bin', self.content, content_type='image/png')
+
+    def tearDown(self):
+        for path in [self.path] + glob.glob(f'{self.path}.*.part'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_single_pass_tee(self):
+        upload = StreamingUpload(self.file, self.path)
+
+        body = b''.join(upload)
+        upload.finish()
+
+        self.assertEqual(len(body), int(upload.headers['Content-Length']))
+        self.assertIn(self.content, body)
+        self.assertTrue(body.endswith(f'--{upload.boundary}--\r\n'.encode()))
+        self.assertEqual(upload.size, len(self.content))
+        self.assertEqual(upload.sha256, hashlib.sha256(self.content).hexdigest())
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+    async def test_async_iteration_off_loop(self):
+        loop_thread = threading.get_ident()
+        threads = set()
+        chunks = self.file.chunks
+
+        def tracked_chunks(*args, **kwargs):
+            for chunk in chunks(*args, **kwargs):
+                threads.add(threading.get_ident())
+                yield chunk
+
+        upload = StreamingUpload(self.file, self.path)
+        with patch.object(self.file, 'chunks', tracked_chunks):
+            body = b''.join([chunk async for chunk in upload])
+        await sync_to_async(upload.finish)()
+
+        self.assertIn(self.content, body)
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+        self.assertEqual(upload.sha256, hashlib.sha256(self.content).hexdigest())
+
+    def test_rollback_partial_copy(self):
+        upload = StreamingUpload(self.file, self.path)
+        body = iter(upload)
+        next(body)
+        next(body)
+
+        upload.rollback()
+        self.assertFalse(os.path.exists(upload.part_path))
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_same_name_uploads_do_not_share_part(self):
+        failed = StreamingUpload(SimpleUploadedFile('test_stream.bin', b'other'), self.path)
+        upload = StreamingUpload(self.file, self.path)
+        body, failed_body = iter(upload), iter(failed)
+        for _ in range(2):
+            next(body)
+            next(failed_body)
+
+        self.assertNotEqual(upload.part_path, failed.part_path)
+        self.assertTrue(upload.part_path.endswith(storage_gc.PARTIAL_SUFFIX))
+        failed.rollback()
+        upload.finish()
+
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+
+@override_settings(THUMBNAIL_SIZES=[40, 80], THUMBNAIL_FORMAT='webp', MEDIA_ACCESS='public')
+class TestThumbnails(TestCase):
+    def setUp(self):
+        self.path = 'media/test_thumb.png'
+        os.makedirs('media', exist_ok=True)
+        Image.new('RGB', (400, 200), 'red').save(self.path)
+        self.doc = Docs.objects.create(file_path=self.path, size=os.path.getsize(self.path))
+
+    def tearDown(self):
+        for path in [self.path] + [thumbnails.thumbnail_path(self.path, width) for width in (40, 80)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_render_sizes(self):
+        created = thumbnails.render(*thumbnails.render_args(self.path))
+
+        self.assertEqual(created, [thumbnails.thumbnail_path(self.path, 80), thumbnails.thumbnail_path(self.path, 40)])
+        with Image.open(created[-1]) as thumb:
+            self.assertEqual((thumb.format, thumb.size), ('WEBP', (40, 20)))
+
+    def test_render_in_process_pool(self):
+        try:
+            pool = process_pool.get_pool()
+            self.assertEqual(pool._mp_context.get_start_method(), 'forkserver')
+            created = pool.submit(thumbnails.render, *thumbnails.render_args(self.path)).result(timeout=60)
+        finally:
+            process_pool.shutdown()
+
+        self.assertTrue(all(os.path.exists(path) for path in created))
+
+    @patch('sitepytesseract.process_pool.get_pool')
+    def test_lazy_view(self, mock_pool):
+        mock_pool.return_value = ThreadPoolExecutor(max_workers=1)
+
+        response = self.client.get(reverse('thumbnail', args=[self.doc.id, 80]))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(os.path.exists(thumbnails.thumbnail_path(self.path, 80)))
+        self.assertEqual(self.client.get(reverse('thumbnail', args=[self.doc.id, 99])).status_code, 404)
+
+        self.doc.delete()
+        storage_gc.sweep()
+        self.assertFalse(os.path.exists(thumbnails.thumbnail_path(self.path, 80)))
+
+    @patch('sitepytesseract.process_pool.submit')
+    def test_scheduled_after_commit(self, mock_submit):
+        view = UploadDocs()
+        view.request = RequestFactory().post('/upload/')
+        view.request.user = User.objects.create_user(username='thumbuser', password='<PASSWORD>')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            view.docs_create('media/new_thumb.png', 10)
+
+        mock_submit.assert_called_once_with(thumbnails.render, 'media/new_thumb.png', [40, 80], 'webp', 80)
 
 
 class TestGetText(TestCase):
@@ -205,6 +711,7 @@ class TestGetText(TestCase):
         self.factory = RequestFactory()
         self.view = GetTextDocs()
         self.client.login(username='testuser', password='<PASSWORD>')
+        cache.clear()
 
     @patch('docs_analyze.service_api.api_get_text')
     def test_negative_get_text(self, mock_get):
@@ -216,15 +723,158 @@ class TestGetText(TestCase):
 
     @patch('docs_analyze.service_api.api_get_text')
     def test_positive_get_text(self, mock_get):
-        mock_get.return_value = MagicMock(status_code=200, json=lambda: {'text': 'Test Text'})
+        mock_get.return_value = MagicMock(status_code=200, headers={}, json=lambda: {'text': 'Test Text'})
         request = self.factory.get('/doc_text/1')
         self.view.request = request
 
         response = self.view.get(request, docs_id=1)
-        self.assertEqual(self.view.extra_context['text'], 'Test Text')
+        self.assertEqual(response.context_data['text'], 'Test Text')
+        self.assertNotIn('text', GetTextDocs.extra_context)
         self.assertEqual(response.status_code, 200)
 
+    @patch('docs_analyze.service_api.api_get_text')
+    def test_text_stored_and_revalidated(self, mock_get):
+        doc = Docs.objects.create(file_path='text.png', size=1)
+        mock_get.return_value = MagicMock(status_code=200, headers={'ETag': '"v1"'}, json=lambda: {'text': 'Stored'})
+
+        self.assertEqual(doc_text.get_text(doc.id), ('Stored', None))
+        cache.clear()
+        self.assertEqual(doc_text.get_text(doc.id), ('Stored', None))
+        mock_get.assert_called_once_with(doc.id, etag=None)
+
+        doc_text.invalidate(doc.id)
+        mock_get.return_value = MagicMock(status_code=304, headers={})
+        self.assertEqual(doc_text.get_text(doc.id), ('Stored', None))
+        mock_get.assert_called_with(doc.id, etag='"v1"')
+        self.assertFalse(DocText.objects.get(doc_id=doc).stale)
+
+        doc.delete()
+        self.assertFalse(DocText.objects.exists())
+        self.assertIsNone(cache.get(doc_text.CACHE_KEY.format(doc.id)))
+
+
+@override_settings(BOOTSTRAP_PRICES='.png:0.5, .pdf:2')
+class TestBootstrap(TestCase):
+    def test_idempotent(self):
+        Price.objects.create(file_type='.png', price=12.0)
+
+        call_command('bootstrap', stdout=StringIO())
+        output = StringIO()
+        call_command('bootstrap', stdout=output)
+
+        self.assertIn('no pending migrations', output.getvalue())
+        self.assertEqual(User.objects.filter(username='admin', is_superuser=True).count(), 1)
+        self.assertEqual(dict(Price.objects.values_list('file_type', 'price')), {'.png': 12.0, '.pdf': 2.0})
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.info = MagicMock(transaction_status=0)
+        self.cursor = MagicMock()
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool(TestCase):
+    def test_reuse_limit_and_lifetime(self):
+        pool = ConnectionPool(FakeConnection, name='fake', min_size=1, max_size=2,
+                              max_lifetime=60, check_after=60, timeout=0.05)
+
+        first, second = pool.getconn(), pool.getconn()
+        self.assertRaises(PoolTimeout, pool.getconn)
+
+        pool.putconn(first)
+        self.assertIs(pool.getconn(), first)
+
+        first.closed = 1
+        pool.putconn(first)
+        pool.max_lifetime = 0
+        pool.putconn(second)
+        self.assertTrue(second.closed)
+        self.assertNotIn(pool.getconn(), (first, second))
+
+    def test_health_check_on_checkout(self):
+        pool = ConnectionPool(FakeConnection, name='fake', check_after=0)
+        broken = pool.getconn()
+        pool.putconn(broken)
+        broken.cursor.side_effect = Exception('server closed the connection')
+
+        self.assertIsNot(pool.getconn(), broken)
+        self.assertTrue(broken.closed)
+
+
+class TestServeCommand(TestCase):
+    def test_gunicorn_options(self):
+        command = serve.Command()
+        options = vars(command.create_parser('manage.py', 'serve').parse_args(['--workers', '3']))
+
+        with override_settings(ASYNC_VIEWS=False):
+            sync_options = command.gunicorn_options(options)
+        with override_settings(ASYNC_VIEWS=True):
+            async_options = command.gunicorn_options(options)
 
+        self.assertEqual((sync_options['workers'], sync_options['worker_class']), (3, 'gthread'))
+        self.assertTrue(sync_options['preload_app'])
+        self.assertEqual(async_options['worker_class'], serve.ASYNC_WORKER_CLASS)
+
+
+class TestSingleFlight(TestCase):
+    def test_concurrent_calls_share_one_fetch(self):
+        flight, calls, release = SingleFlight(), [], threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return 'text'
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(flight.do, 'doc:1', fetch) for _ in range(8)]
+            time.sleep(0.2)
+            release.set()
+            results = [future.result() for future in futures]
+
+        self.assertEqual(results, ['text'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    async def test_async_leader_cancelled(self):
+        flight, calls, release = AsyncSingleFlight(), [], asyncio.Event()
+
+        async def fetch():
+            calls.append(1)
+            await release.wait()
+            return 'text'
+
+        leader = asyncio.ensure_future(flight.do('doc:1', fetch))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do('doc:1', fetch))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+
+        self.assertEqual(await follower, 'text')
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.flights, {})
+
+    @patch('sitepytesseract.backend.BackendClient.get')
+    def test_cross_worker_result_shared(self, mock_get):
+        cache.clear()
+        mock_get.return_value = response_from_snapshot(
+            {'status_code': 200, 'headers': {}, 'content': b'{"text": "shared"}'})
+
+        first = service_api.api_get_text(5)
+        # Следующий запрос (например, из другого воркера) берёт общий ответ из кэша.
+        second = service_api.api_get_text(5)
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(second.json(), first.json())
+
+
+@override_settings(ANALYSIS_QUEUE='inline')
 class TestAnalyzeDoc(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -236,6 +886,7 @@ class TestAnalyzeDoc(TestCase):
         self.view = AnalyzeDocs()
         self.client.login(username='testuser', password='<PASSWORD>')
         self.form = AnalyzeDocsForm(data={'payment': True})
+        pricing.invalidate()
 
     @patch('docs_analyze.service_api.api_analyze')
     def test_negative_create_cart_get_text(self, mock_analyze):
@@ -301,6 +952,164 @@ class TestAnalyzeDoc(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+@override_settings(ANALYSIS_QUEUE='db')
+class TestJobQueue(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='<EMAIL>', password='<PASSWORD>')
+        cls.doc = Docs.objects.create(file_path='test.png', size=123)
+        Price.objects.create(file_type='.png', price=12.0)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.view = AnalyzeDocs()
+        pricing.invalidate()
+
+    @patch('docs_analyze.service_api.api_analyze')
+    def test_submit_returns_immediately(self, mock_analyze):
+        request = self.factory.post(f'/doc_analyze/{self.doc.id}')
+        request.user = self.user
+        self.view.request = request
+        self.view.kwargs = {'doc_id': self.doc.id}
+
+        response = self.view.form_valid(AnalyzeDocsForm(data={'payment': True}))
+
+        job = AnalysisJob.objects.get(doc_id=self.doc)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.url, f'/analysis/{job.id}')
+        self.assertEqual(job.status, AnalysisJob.Status.QUEUED)
+        self.assertFalse(mock_analyze.called)
+
+    @patch('docs_analyze.service_api.api_analyze')
+    def test_db_worker(self, mock_analyze):
+        mock_analyze.side_effect = [MagicMock(status_code=200),
+                                    MagicMock(status_code=402, json=lambda: {'detail': 'Test Error'})]
+        done = jobs.submit(self.user, self.doc)
+        failed = jobs.submit(self.user, self.doc)
+
+        jobs.run_db_worker(once=True)
+
+        done.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(done.status, AnalysisJob.Status.DONE)
+        self.assertEqual(failed.status, AnalysisJob.Status.FAILED)
+        self.assertEqual(failed.error, 'Test Error')
+        self.assertEqual(done.attempts, 1)
+        self.assertIsNone(jobs.claim_next())
+
+    @override_settings(ANALYSIS_JOB_TIMEOUT=60, ANALYSIS_MAX_ATTEMPTS=2)
+    def test_stale_job_attempts_exhausted(self):
+        retried = jobs.submit(self.user, self.doc)
+        exhausted = jobs.submit(self.user, self.doc)
+        long_ago = timezone.now() - timedelta(seconds=120)
+        AnalysisJob.objects.filter(id=retried.id).update(status=AnalysisJob.Status.RUNNING, attempts=1,
+                                                         updated_at=long_ago)
+        AnalysisJob.objects.filter(id=exhausted.id).update(status=AnalysisJob.Status.RUNNING, attempts=2,
+                                                           updated_at=long_ago)
+
+        self.assertEqual(jobs.claim_next().id, retried.id)
+        self.assertIsNone(jobs.claim_next())
+
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, AnalysisJob.Status.FAILED)
+        self.assertIn('2', exhausted.error)
+
+    def test_status_endpoint(self):
+        job = jobs.submit(self.user, self.doc)
+        self.client.force_login(self.user)
+
+        response = self.client.get(f'/analysis/{job.id}', {'format': 'json'})
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertFalse(response.json()['finished'])
+
+        response = self.client.get(f'/analysis/{job.id}')
+        self.assertContains(response, 'В очереди')
+
+        other = User.objects.create_user(username='otheruser', password='<PASSWORD>')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/analysis/{job.id}').status_code, 404)
+
+
+class TestBatchAnalyze(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='<EMAIL>', password='<PASSWORD>')
+        cls.png = Docs.objects.create(file_path='a.png', size=10)
+        cls.tif = Docs.objects.create(file_path='b.tif', size=10)
+        Price.objects.create(file_type='.png', price=2.0)
+
+    def setUp(self):
+        request = RequestFactory().post('/analyze_batch/')
+        request.user = self.user
+        self.view = BatchAnalyzeDocs()
+        self.view.setup(request)
+        pricing.invalidate()
+
+    def make_form(self, *doc_ids):
+        form = BatchAnalyzeDocsForm(data={'docs': ', '.join(map(str, doc_ids)), 'payment': True})
+        self.assertTrue(form.is_valid())
+        return form
+
+    @override_settings(ANALYSIS_QUEUE='db')
+    def test_batch_queries(self):
+        form = self.make_form(self.png.id, 999999, self.tif.id)
+        pricing.get_price_table()
+
+        with self.assertNumQueries(3):
+            response = self.view.form_valid(form)
+
+        results = response.context_data['results']
+        self.assertEqual([r['doc_id'] for r in results], [self.png.id, 999999, self.tif.id])
+        self.assertEqual(results[0]['price'], 20.0)
+        self.assertEqual(results[0]['job'].status, AnalysisJob.Status.QUEUED)
+        self.assertIn('error', results[1])
+        self.assertIn('error', results[2])
+        self.assertEqual(Cart.objects.count(), 1)
+
+    @override_settings(ANALYSIS_QUEUE='inline')
+    @patch('docs_analyze.service_api.api_analyze')
+    def test_batch_inline(self, mock_analyze):
+        second = Docs.objects.create(file_path='c.png', size=5)
+        mock_analyze.side_effect = lambda doc_id: MagicMock(
+            status_code=200 if doc_id == self.png.id else 402, json=lambda: {'detail': 'Test Error'})
+
+        response = self.view.form_valid(self.make_form(self.png.id, second.id))
+
+        statuses = [r['job'].status for r in response.context_data['results']]
+        self.assertEqual(statuses, [AnalysisJob.Status.DONE, AnalysisJob.Status.FAILED])
+        self.assertEqual(mock_analyze.call_count, 2)
+
+    def test_batch_form_limits(self):
+        self.assertFalse(BatchAnalyzeDocsForm(data={'docs': '1, x', 'payment': True}).is_valid())
+        with override_settings(ANALYSIS_BATCH_MAX_DOCS=2):
+            self.assertFalse(BatchAnalyzeDocsForm(data={'docs': '1 2 3', 'payment': True}).is_valid())
+
+
+class TestPricing(TestCase):
+    def setUp(self):
+        pricing.invalidate()
+
+    def test_price_table_cached(self):
+        Price.objects.create(file_type='.png', price=2.0)
+        doc = Docs(file_path='media/a.png', size=10)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(pricing.price_for(doc), 20.0)
+            self.assertEqual(doc.analysis_price, 20.0)
+            self.assertIsNone(pricing.get_price('media/a.tif'))
+
+    def test_invalidated_on_change(self):
+        price = Price.objects.create(file_type='.png', price=2.0)
+        self.assertEqual(pricing.get_price('a.png'), 2.0)
+
+        price.price = 3.0
+        price.save()
+        self.assertEqual(pricing.get_price('a.png'), 3.0)
+
+        price.delete()
+        self.assertIsNone(pricing.get_price('a.png'))
+
+
 class TestDeleteDocs(TestCase):
     @classmethod
     def setUpTestData(cls):
@@ -330,11 +1139,8 @@ class TestDeleteDocs(TestCase):
 
     @patch('docs_analyze.service_api.api_delete')
     @patch('os.remove')
-    @patch('os.path.exists')
-    def test_negative_delete_docs(self, mock_path_exist, mock_remove, mock_delete):
+    def test_negative_delete_docs(self, mock_remove, mock_delete):
         mock_delete.return_value = MagicMock(status_code=200, json=lambda: {'detail': 'Test All Good'})
-        mock_path_exist.return_value = True
-        mock_remove.return_value = None
 
         self.assertTrue(self.form.is_valid())
 
@@ -350,10 +1156,379 @@ class TestDeleteDocs(TestCase):
 
         self.assertRaises(Docs.DoesNotExist, Docs.objects.get, size=123)
 
-        self.assertTrue(mock_remove.called)
+        # Файл удаляется не в запросе, а сборщиком по пометке.
+        self.assertFalse(mock_remove.called)
+        self.assertTrue(DeletedFile.objects.filter(path='test.png').exists())
 
 
+class TestAsyncViews(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='<EMAIL>', password='<PASSWORD>')
+        cls.doc = Docs.objects.create(file_path='test.png', size=123)
+        Price.objects.create(file_type='.png', price=12.0)
 
+    def setUp(self):
+        self.factory = AsyncRequestFactory()
+        pricing.invalidate()
 
+    @patch('docs_analyze.service_api.get_async_client')
+    async def test_async_analyze(self, mock_client):
+        mock_client.return_value.post = AsyncMock(return_value=MagicMock(status_code=200))
+        request = self.factory.post(f'/analyze_doc/{self.doc.id}', data={'payment': True})
+        request.COOKIES['access_token'] = 'test_access_token'
+        request.COOKIES['refresh_token'] = 'test_refresh_token'
+        request.user = self.user
+
+        response = await AsyncAnalyzeDocs.as_view()(request, doc_id=self.doc.id)
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await Cart.objects.filter(doc_id=self.doc, order_price=12.0 * 123).aexists())
+        self.assertTrue(await AnalysisJob.objects.filter(doc_id=self.doc, status='queued').aexists())
+        self.assertEqual([c.args[0] for c in mock_client.return_value.post.call_args_list],
+                         ['/token/verify/'])
+
+    @patch('docs_analyze.service_api.AsyncJWTView.logout_user')
+    @patch('docs_analyze.service_api.get_async_client')
+    async def test_async_auth_outage_keeps_session(self, mock_client, mock_logout_user):
+        await sync_to_async(cache.clear)()
+        mock_client.return_value.post = AsyncMock(return_value=httpx.Response(503, json={'detail': 'open'}))
+        request = self.factory.post(f'/analyze_doc/{self.doc.id}', data={'payment': True})
+        request.COOKIES['access_token'] = 'test_access_token'
+        request.COOKIES['refresh_token'] = 'test_refresh_token'
+        request.user = self.user
+
+        response = await AsyncAnalyzeDocs.as_view()(request, doc_id=self.doc.id)
+
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(mock_logout_user.called)
+        self.assertFalse(await Cart.objects.filter(doc_id=self.doc).aexists())
+
+    @patch('docs_analyze.service_api.get_async_client')
+    async def test_async_analyze_missing_doc(self, mock_client):
+        mock_client.return_value.post = AsyncMock(return_value=MagicMock(status_code=200))
+        request = self.factory.post('/analyze_doc/999', data={'payment': True})
+        request.COOKIES['access_token'] = 'test_access_token'
+        request.COOKIES['refresh_token'] = 'test_refresh_token'
+        request.user = self.user
+
+        response = await AsyncAnalyzeDocs.as_view()(request, doc_id=999)
+        self.assertEqual(response.status_code, 500)
+
+    @patch('docs_analyze.service_api.get_async_client')
+    async def test_async_get_text(self, mock_client):
+        mock_client.return_value.get = AsyncMock(
+            return_value=MagicMock(status_code=200, headers={}, content=b'', json=lambda: {'text': 'Test Text'}))
+        request = self.factory.get('/doc_text/1')
+
+        response = await AsyncGetTextDocs.as_view()(request, docs_id=1)
+        self.assertEqual(response.context_data['text'], 'Test Text')
+
+    async def test_async_client_retries_idempotent(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.method)
+            return httpx.Response(503 if len(calls) == 1 else 200, json={'text': 'ok'})
+
+        api = AsyncBackendClient('http://backend/api/v1', backoff=0, jitter=0)
+        api.client._transport = httpx.MockTransport(handler)
+
+        self.assertEqual((await api.get('/get_text/1')).status_code, 200)
+        self.assertEqual((await api.post('/doc_analyze/1')).status_code, 200)
+        calls.clear()
+        self.assertEqual((await api.post('/doc_analyze/1')).status_code, 503)
+        self.assertEqual(calls, ['POST'])
+
+
+class TestStorageGC(TestCase):
+    def setUp(self):
+        self.root = 'media/gc_test'
+        os.makedirs(self.root, exist_ok=True)
+
+    def tearDown(self):
+        for entry in os.scandir(self.root):
+            os.remove(entry.path)
+        os.rmdir(self.root)
+
+    def make_file(self, name: str, age: float = 0) -> str:
+        path = f'{self.root}/{name}'
+        with open(path, 'wb') as f:
+            f.write(b'data')
+        mtime = time.time() - age
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def test_queryset_delete_marks_files(self):
+        path = self.make_file('bulk.png', age=60)
+        thumb = self.make_file('bulk.thumb160.webp', age=60)
+        Docs.objects.create(file_path=path, size=4)
+
+        Docs.objects.filter(file_path=path).delete()
+
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(storage_gc.sweep(), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(thumb))
+        self.assertFalse(DeletedFile.objects.exists())
+
+    def test_sweep_and_missing_independent_of_cwd(self):
+        path = self.make_file('elsewhere.png', age=60)
+        thumb = self.make_file('elsewhere.thumb160.webp', age=60)
+        kept = self.make_file('kept.png', age=60)
+        storage_gc.mark(path)
+        Docs.objects.create(file_path=kept, size=4)
+        Docs.objects.create(file_path=f'{self.root}/gone.png', size=4)
+
+        cwd = os.getcwd()
+        os.chdir('/')
+        try:
+            self.assertEqual(storage_gc.sweep(), 1)
+            missing = [path for _, path in storage_gc.find_missing()]
+        finally:
+            os.chdir(cwd)
+
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(thumb))
+        self.assertIn(f'{self.root}/gone.png', missing)
+        self.assertNotIn(kept, missing)
+
+    def test_sweep_keeps_reused_path(self):
+        path = self.make_file('reused.png')
+        storage_gc.mark(path)
+        Docs.objects.create(file_path=path, size=4)
+
+        storage_gc.sweep()
+
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(DeletedFile.objects.exists())
+
+    def test_reconcile_marks_orphans(self):
+        known = self.make_file('known.png', age=7200)
+        self.make_file('known.thumb160.webp', age=7200)
+        orphan = self.make_file('orphan.png', age=7200)
+        orphan_thumb = self.make_file('orphan.thumb160.webp', age=7200)
+        partial = self.make_file('upload.png.part', age=7200)
+        self.make_file('fresh.png')
+        Docs.objects.create(file_path=known, size=4)
+
+        call_command('reconcile_media', root=self.root, stdout=StringIO())
+
+        self.assertEqual(set(DeletedFile.objects.values_list('path', flat=True)),
+                         {orphan, orphan_thumb, partial})
+
+
+    def test_thumbnails_matched_by_exact_source_path(self):
+        moved = self.make_file('moved.thumb160.webp', age=7200)
+        odd = self.make_file('odd.Jpeg', age=7200)
+        odd_thumb = self.make_file('odd.thumb160.webp', age=7200)
+        self.make_file('lost.thumb160.webp', age=7200)
+        Docs.objects.create(file_path=f'{self.root}/lost.tif', size=4)
+        Docs.objects.create(file_path=odd, size=4)
+
+        with CaptureQueriesContext(connection) as queries:
+            orphans = set(storage_gc.find_orphans(self.root, min_age=3600))
+
+        self.assertEqual(orphans, {moved})
+        self.assertFalse([query for query in queries.captured_queries if 'LIKE' in query['sql']])
+        self.assertNotIn(odd_thumb, orphans)
+
+    def test_reconcile_independent_of_cwd(self):
+        known = self.make_file('known.png', age=7200)
+        orphan = self.make_file('orphan.png', age=7200)
+        Docs.objects.create(file_path=known, size=4)
+
+        cwd = os.getcwd()
+        os.chdir('/')
+        try:
+            orphans = set(storage_gc.find_orphans(self.root, min_age=3600))
+            orphans_abs = set(storage_gc.find_orphans(os.path.join(cwd, self.root), min_age=3600))
+        finally:
+            os.chdir(cwd)
+
+        self.assertEqual(orphans, {orphan})
+        self.assertEqual(orphans_abs, {orphan})
+
+@override_settings(MEDIA_ACCESS='owner', MEDIA_ACCEL='')
+class TestMediaFile(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='<PASSWORD>')
+        cls.other = User.objects.create_user(username='other', password='<PASSWORD>')
+
+    def setUp(self):
+        self.path = 'media/test_media.png'
+        self.content = bytes(range(256)) * 4
+        with open(self.path, 'wb') as f:
+            f.write(self.content)
+        self.doc = Docs.objects.create(file_path=self.path, size=len(self.content))
+        UsersToDocs.objects.create(username='owner', doc_id=self.doc)
+        self.url = '/' + self.path
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_access(self):
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Cache-Control'], 'private, max-age=3600')
 
+    def test_conditional_and_range(self):
+        self.client.force_login(self.owner)
+        etag = self.client.get(self.url)['ETag']
 
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.content[-5:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-19', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=5000-').status_code, 416)
+
+    @override_settings(MEDIA_ACCEL='nginx', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        self.client.force_login(self.owner)
+
+        with override_settings(MEDIA_ROOT=os.path.abspath('media')):
+            response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/test_media.png')
+        self.assertEqual(response.content, b'')
+
+
+@override_settings(UPLOAD_MAX_BYTES=50_000, UPLOAD_MAX_PIXELS=10_000, UPLOAD_SNIFF_BYTES=1024)
+class TestUploadLimits(TestCase):
+    def image(self, size, fmt='PNG') -> bytes:
+        buffer = BytesIO()
+        Image.new('RGB', size, 'white').save(buffer, fmt)
+        return buffer.getvalue()
+
+    def parse(self, content: bytes, name='scan.png', chunk_size=None):
+        request = RequestFactory().post('/upload/', {'file': SimpleUploadedFile(name, content)})
+        limits = ImageLimitsUploadHandler(request)
+        if chunk_size:
+            limits.chunk_size = chunk_size
+        request.upload_handlers = [limits, MemoryFileUploadHandler(request)]
+        form = UploadDocsForm(data=request.POST, files=request.FILES, upload_errors=request.upload_errors)
+        return request, form
+
+    def test_valid_image(self):
+        request, form = self.parse(self.image((50, 50)))
+
+        self.assertEqual(request.upload_errors, {})
+        self.assertTrue(form.is_valid())
+
+    def test_rejected_while_streaming(self):
+        cases = [
+            (self.image((200, 200)), 'мегапикселей'),
+            (os.urandom(60_000), 'МБ'),
+            (b'%PDF-1.4' + b'x' * 2000, 'не похож на изображение'),
+        ]
+        for content, message in cases:
+            with self.subTest(message=message):
+                request, form = self.parse(content)
+
+                self.assertNotIn('file', request.FILES)
+                self.assertIn(message, request.upload_errors['file'])
+                self.assertFalse(form.is_valid())
+                self.assertIn(message, form.errors['file'][0])
+
+    @patch('docs_analyze.service_api.JWTView.verify_jwt_token', return_value=True)
+    def test_user_sees_rejection(self, mock_verify):
+        user = User.objects.create_user(username='uploader', password='<PASSWORD>')
+        self.client.force_login(user)
+        self.client.cookies['refresh_token'] = 'test_refresh_token'
+
+        response = self.client.post(reverse('upload'), {'file': SimpleUploadedFile('big.bin', os.urandom(60_000))})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'МБ')
+        self.assertFalse(Docs.objects.exists())
+
+        handler = ImageLimitsUploadHandler()
+        handler.field_name = 'file'
+        with self.assertRaises(StopUpload) as raised:
+            handler.reject('Файл больше 0 МБ')
+        self.assertFalse(raised.exception.connection_reset)
+
+    def test_metadata_past_head(self):
+        buffer = BytesIO()
+        Image.effect_noise((100, 90), 60).convert('RGB').save(buffer, 'TIFF', compression='tiff_lzw')
+        content = buffer.getvalue()
+        self.assertIsNone(validators.sniff(content[:1024]))
+
+        request, form = self.parse(content, name='scan.tif', chunk_size=1024)
+
+        self.assertEqual(request.upload_errors, {})
+        self.assertTrue(form.is_valid())
+
+        buffer = BytesIO()
+        Image.effect_noise((120, 100), 60).convert('RGB').save(buffer, 'TIFF', compression='tiff_lzw')
+        request, form = self.parse(buffer.getvalue(), name='big.tif', chunk_size=1024)
+
+        self.assertEqual(request.upload_errors, {})
+        self.assertFalse(form.is_valid())
+        self.assertIn('мегапикселей', form.errors['file'][0])
+
+    @override_settings(UPLOAD_FULL_DECODE=True)
+    def test_optional_full_decode(self):
+        content = self.image((50, 50))
+        form = UploadDocsForm(files={'file': SimpleUploadedFile('scan.png', content[:len(content) // 2])})
+
+        self.assertFalse(form.is_valid())
+
+
+@override_settings(PREPROCESS_ENABLED=True, PREPROCESS_GRAYSCALE=True, PREPROCESS_TARGET_DPI=100,
+                   PREPROCESS_ASSUME_DPI=0, PREPROCESS_HOOKS=[], PREPROCESS_TIMEOUT=10.0)
+class TestPreprocessing(TestCase):
+    def setUp(self):
+        buffer = BytesIO()
+        Image.effect_noise((400, 400), 60).convert('RGB').save(buffer, 'PNG', dpi=(400, 400))
+        self.content = buffer.getvalue()
+        self.digest = hashlib.sha256(self.content).hexdigest()
+        self.path = f'media/{self.digest}/test_scan.png'
+
+    def tearDown(self):
+        for path in [self.path] + glob.glob(f'{self.path}.*.part'):
+            if os.path.exists(path):
+                os.remove(path)
+        if os.path.isdir(os.path.dirname(self.path)):
+            os.rmdir(os.path.dirname(self.path))
+
+    def test_reduce_image(self):
+        data, output_format = preprocessing.reduce_image(self.content, grayscale=True, target_dpi=100)
+
+        self.assertEqual(output_format, 'PNG')
+        self.assertLess(len(data), len(self.content))
+        with Image.open(BytesIO(data)) as image:
+            self.assertEqual((image.mode, image.size), ('L', (100, 100)))
+
+    @patch('sitepytesseract.process_pool.get_pool')
+    def test_reduced_upstream_original_kept(self, mock_pool):
+        mock_pool.return_value = ThreadPoolExecutor(max_workers=1)
+        uploaded = SimpleUploadedFile('test_scan.png', self.content, content_type='image/png')
+
+        with override_settings(PREPROCESS_KEEP_ORIGINAL=True):
+            upload = preprocessing.prepare_upload(uploaded, self.digest)
+        body = b''.join(upload)
+        upload.finish()
+
+        self.assertLess(len(body), len(self.content))
+        self.assertNotIn(self.content, body)
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(upload.sha256, hashlib.sha256(self.content).hexdigest())
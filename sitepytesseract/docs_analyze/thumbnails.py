@@ -0,0 +1,93 @@
+import logging
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image, ImageOps
+
+from sitepytesseract import process_pool
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def thumbnail_path(file_path: str, width: int, fmt: str = None) -> str:
+    """
+        Миниатюра лежит рядом с оригиналом: media/scan.png -> media/scan.thumb320.webp
+    """
+    fmt = fmt or settings.THUMBNAIL_FORMAT
+    root, _ = os.path.splitext(str(file_path))
+    return f'{root}.thumb{width}.{EXTENSIONS[fmt]}'
+
+
+def render(file_path: str, widths: list, fmt: str, quality: int) -> list:
+    """
+        Генерирует миниатюры всех ширин за одно чтение оригинала.
+        Выполняется в пуле процессов, поэтому получает все параметры аргументами.
+    """
+    created = []
+    root, _ = os.path.splitext(file_path)
+    with Image.open(file_path) as image:
+        # Для JPEG декодер сразу уменьшает картинку кратно 1/2..1/8.
+        image.draft('RGB', (max(widths), max(widths)))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+
+        for width in sorted(widths, reverse=True):
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            path = f'{root}.thumb{width}.{EXTENSIONS[fmt]}'
+            tmp_path = path + '.part'
+            image.save(tmp_path, format=fmt.upper(), quality=quality)
+            os.replace(tmp_path, path)
+            created.append(path)
+    return created
+
+
+def render_args(file_path: str, widths: list = None) -> tuple:
+    return (str(file_path), list(widths or settings.THUMBNAIL_SIZES),
+            settings.THUMBNAIL_FORMAT, settings.THUMBNAIL_QUALITY)
+
+
+def schedule(file_path: str):
+    """
+        Ставит генерацию миниатюр в фоновый пул после фиксации транзакции,
+        чтобы не занимать поток запроса.
+    """
+    transaction.on_commit(lambda: process_pool.submit(render, *render_args(file_path)))
+
+
+def ensure(file_path: str, width: int):
+    """
+        Возвращает путь к миниатюре, при отсутствии генерирует её (лениво).
+        None - если оригинал не читается как изображение.
+    """
+    path = thumbnail_path(file_path, width)
+    if os.path.exists(path):
+        return path
+    if not os.path.exists(str(file_path)):
+        return None
+    try:
+        future = process_pool.get_pool().submit(render, *render_args(file_path, [width]))
+        future.result(timeout=settings.THUMBNAIL_TIMEOUT)
+    except Exception:
+        logger.warning('Could not render thumbnail for %s', file_path, exc_info=True)
+        return None
+    return path
+
+
+def remove(file_path: str):
+    for width in settings.THUMBNAIL_SIZES:
+        path = thumbnail_path(file_path, width)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def url(doc_id: int, width: int = None) -> str:
+    return reverse('thumbnail', args=[doc_id, width or min(settings.THUMBNAIL_SIZES)])
+
+
+def srcset(doc_id: int) -> str:
+    return ', '.join(f'{url(doc_id, width)} {width}w' for width in sorted(settings.THUMBNAIL_SIZES))
@@ -0,0 +1,96 @@
+import hashlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from . import validators
+
+# Запас на остальные поля формы и заголовки частей multipart.
+BODY_OVERHEAD = 64 * 1024
+
+
+class DigestUploadHandler(FileUploadHandler):
+    """
+        Считает sha256 загружаемых файлов прямо во время приёма тела запроса.
+        Чанки передаются дальше без изменений, сам файл сохраняют следующие
+        обработчики из FILE_UPLOAD_HANDLERS. Результат: request.upload_digests[field_name].
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if self.request is not None:
+            self.request.upload_digests = {}
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.checksum = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.checksum.update(raw_data)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.request is not None:
+            self.request.upload_digests[self.field_name] = self.checksum.hexdigest()
+        return None
+
+
+class ImageLimitsUploadHandler(FileUploadHandler):
+    """
+        Проверяет загружаемое изображение, пока тело запроса ещё принимается:
+        формат и размеры - по первым UPLOAD_SNIFF_BYTES байтам, размер файла - по
+        Content-Length и по мере поступления чанков. TIFF и JPEG, которые по началу
+        файла не распознаются, не отклоняются: их целиком проверяет валидатор формы
+        (validate_image_header), когда файл уже принят. При нарушении файл
+        больше не сохраняется (остаток тела дочитывается вхолостую, соединение не рвётся),
+        причина - в request.upload_errors[field_name], её показывает форма загрузки.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        if self.request is not None:
+            self.request.upload_errors = {}
+        self.body_too_large = content_length > settings.UPLOAD_MAX_BYTES + BODY_OVERHEAD
+
+    def new_file(self, field_name, file_name, content_type, content_length, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, content_length, *args, **kwargs)
+        self.head = b''
+        self.sniffed = False
+        if self.body_too_large or (content_length or 0) > settings.UPLOAD_MAX_BYTES:
+            self.reject(validators.too_large())
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.UPLOAD_MAX_BYTES:
+            self.reject(validators.too_large())
+        if not self.sniffed:
+            self.head += raw_data
+            self.inspect(final=False)
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.sniffed:
+            self.inspect(final=True)
+        return None
+
+    def inspect(self, final: bool):
+        try:
+            info = validators.sniff(self.head)
+            if info is None:
+                if final:
+                    raise ValidationError(validators.NOT_AN_IMAGE)
+                if len(self.head) < settings.UPLOAD_SNIFF_BYTES:
+                    return
+                if not validators.needs_full_file(self.head):
+                    raise ValidationError(validators.NOT_AN_IMAGE)
+                # Метаданные дальше начала файла: файл целиком проверит валидатор формы.
+            else:
+                validators.check_image(*info)
+        except ValidationError as e:
+            self.reject(e.messages[0])
+        self.sniffed = True
+        self.head = b''
+
+    def reject(self, message: str):
+        if self.request is not None:
+            self.request.upload_errors[self.field_name] = message
+        # Без connection_reset: иначе браузер показывает обрыв соединения вместо ошибки формы.
+        raise StopUpload()
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import UploadedFile
+
+
+def file_digest(file: UploadedFile) -> str:
+    checksum = hashlib.sha256()
+    for chunk in file.chunks():
+        checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def upload_digest(request, file: UploadedFile, field_name: str = 'file') -> str:
+    """
+        sha256 загруженного файла: берётся из DigestUploadHandler,
+        а если он не подключён - считается отдельным проходом по файлу.
+    """
+    digest = getattr(request, 'upload_digests', {}).get(field_name)
+    return digest or file_digest(file)
+
+
+class StreamingUpload:
+    """
+        Однопроходная загрузка файла: каждый чанк UploadedFile одновременно
+        пишется на диск и уходит в тело multipart-запроса к бэкенду.
+        Размер и sha256 считаются на лету.
+
+        Файл пишется во временный path.<boundary>.part (у каждой загрузки свой, даже
+        при одинаковых именах файлов) и переносится на место в finish();
+        rollback() удаляет только свою частичную копию.
+        Если задан original, в бэкенд уходит file, а на диск в finish() пишется
+        original (например, оригинал скана, когда отправляется уменьшенная копия).
+    """
+
+    def __init__(self, file: UploadedFile, path: str, field_name: str = 'file', original: UploadedFile = None):
+        self.file = file
+        self.original = original
+        self.path = path
+        self.boundary = uuid.uuid4().hex
+        self.part_path = f'{path}.{self.boundary}.part'
+        self.size = 0
+        self.checksum = hashlib.sha256()
+        self.completed = False
+        self._chunks = None
+
+        filename = (file.name or 'upload').replace('"', '%22')
+        content_type = file.content_type or 'application/octet-stream'
+        self._head = (f'--{self.boundary}\r\n'
+                      f'Content-Disposition: form-data; name="{field_name}"; filename="{filename}"\r\n'
+                      f'Content-Type: {content_type}\r\n\r\n').encode()
+        self._tail = f'\r\n--{self.boundary}--\r\n'.encode()
+
+    @property
+    def content_type(self) -> str:
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    @property
+    def sha256(self) -> str:
+        return self.checksum.hexdigest()
+
+    def __len__(self):
+        # Размер тела известен заранее: отправляем с Content-Length,
+        # но сами данные всё равно идут потоком по чанкам.
+        return len(self._head) + self.file.size + len(self._tail)
+
+    @property
+    def headers(self) -> dict:
+        return {'Content-Type': self.content_type, 'Content-Length': str(len(self))}
+
+    def _write_chunks(self):
+        if self.original is not None:
+            yield from self.file.chunks()
+            self.completed = True
+            return
+        os.makedirs(os.path.dirname(self.part_path) or '.', exist_ok=True)
+        with open(self.part_path, 'wb') as destination:
+            for chunk in self.file.chunks():
+                destination.write(chunk)
+                self.checksum.update(chunk)
+                self.size += len(chunk)
+                yield chunk
+        self.completed = True
+
+    def _write_original(self):
+        os.makedirs(os.path.dirname(self.part_path) or '.', exist_ok=True)
+        with open(self.part_path, 'wb') as destination:
+            for chunk in self.original.chunks():
+                destination.write(chunk)
+                self.checksum.update(chunk)
+                self.size += len(chunk)
+
+    def chunks(self):
+        if self._chunks is None:
+            self._chunks = self._write_chunks()
+        return self._chunks
+
+    def __iter__(self):
+        yield self._head
+        yield from self.chunks()
+        yield self._tail
+
+    async def __aiter__(self):
+        # Чтение UploadedFile и запись на диск блокируют: каждый шаг идёт в потоке,
+        # а цикл событий тем временем обслуживает другие запросы.
+        chunks = self.chunks()
+        next_chunk = sync_to_async(next, thread_sensitive=False)
+        yield self._head
+        while (chunk := await next_chunk(chunks, None)) is not None:
+            yield chunk
+        yield self._tail
+
+    def finish(self):
+        """
+            Дописывает на диск то, что транспорт не прочитал, и переносит файл на место.
+        """
+        for _ in self.chunks():
+            pass
+        if self.original is not None:
+            self._write_original()
+        os.replace(self.part_path, self.path)
+
+    def rollback(self):
+        if self._chunks is not None:
+            self._chunks.close()
+        if os.path.exists(self.part_path):
+            os.remove(self.part_path)
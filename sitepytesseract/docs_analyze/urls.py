@@ -1,13 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from django.views.decorators.cache import cache_page
 
 
-from . import views
+from . import async_views, views
+
+if settings.ASYNC_VIEWS:
+    upload_view = async_views.AsyncUploadDocs.as_view()
+    get_text_view = async_views.AsyncGetTextDocs.as_view()
+    delete_view = async_views.AsyncDeleteDocs.as_view()
+    analyze_view = async_views.AsyncAnalyzeDocs.as_view()
+else:
+    upload_view = views.UploadDocs.as_view()
+    get_text_view = views.GetTextDocs.as_view()
+    delete_view = views.DeleteDocs.as_view()
+    analyze_view = views.AnalyzeDocs.as_view()
 
 urlpatterns = [
     path('', views.DocsHome.as_view(), name='home'),
-    path('upload/', views.UploadDocs.as_view(), name='upload'),
-    path('doc_text/<int:docs_id>', cache_page(60 * 15)(views.GetTextDocs.as_view()), name='get_text'),
-    path('delete/<int:pk>', views.DeleteDocs.as_view(), name='delete'),
-    path('analyze_doc/<int:doc_id>', views.AnalyzeDocs.as_view(), name='analyze_doc'),
-]
\ No newline at end of file
+    path('upload/', upload_view, name='upload'),
+    path('doc_text/<int:docs_id>', get_text_view, name='get_text'),
+    path('delete/<int:pk>', delete_view, name='delete'),
+    path('analyze_doc/<int:doc_id>', analyze_view, name='analyze_doc'),
+    path('analyze_batch/', views.BatchAnalyzeDocs.as_view(), name='analyze_batch'),
+    path('analysis/<int:job_id>', views.AnalysisStatus.as_view(), name='analysis_status'),
+    path('thumbnail/<int:doc_id>/<int:width>', views.DocThumbnail.as_view(), name='thumbnail'),
+    path('media/<path:name>', views.MediaFile.as_view(), name='media'),
+]
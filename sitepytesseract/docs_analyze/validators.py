@@ -0,0 +1,81 @@
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from PIL import Image
+
+NOT_AN_IMAGE = 'Файл не похож на изображение поддерживаемого формата'
+
+
+# Сигнатуры форматов, метаданные которых могут лежать дальше первых UPLOAD_SNIFF_BYTES байт:
+# у TIFF от libtiff (LZW/deflate) IFD пишется в конец файла, у JPEG перед SOF бывают
+# большие сегменты APP1/APP2 (EXIF, ICC-профиль). Такие файлы проверяются целиком.
+DEFERRED_SIGNATURES = (b'II*\x00', b'MM\x00*', b'\xff\xd8')
+
+
+def sniff(head: bytes):
+    """
+        Определяет формат и размеры изображения по первым байтам файла.
+        Pillow при открытии читает только заголовок, пиксели не декодируются.
+        Возвращает (format, width, height) или None, если заголовок не распознан
+        (в том числе если байтов пока не хватает).
+    """
+    return sniff_file(BytesIO(head))
+
+
+def sniff_file(file):
+    """
+        То же, что sniff(), но по файловому объекту: Pillow сам дочитывает
+        нужные части (например, IFD в конце TIFF).
+    """
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+            with Image.open(file) as image:
+                return image.format, image.width, image.height
+    except Image.DecompressionBombError:
+        raise ValidationError(too_many_pixels())
+    except Exception:
+        return None
+
+
+def needs_full_file(head: bytes) -> bool:
+    return head.startswith(DEFERRED_SIGNATURES)
+
+
+def too_large() -> str:
+    return f'Файл больше {settings.UPLOAD_MAX_BYTES // (1024 * 1024)} МБ'
+
+
+def too_many_pixels() -> str:
+    return f'Изображение больше {settings.UPLOAD_MAX_PIXELS // 1_000_000} мегапикселей'
+
+
+def check_image(image_format: str, width: int, height: int):
+    if image_format not in settings.UPLOAD_IMAGE_FORMATS:
+        raise ValidationError(NOT_AN_IMAGE)
+    if width * height > settings.UPLOAD_MAX_PIXELS:
+        raise ValidationError(too_many_pixels())
+
+
+def validate_image_header(file):
+    """
+        Проверяет размер файла, формат и число пикселей по заголовку,
+        не декодируя изображение целиком.
+    """
+    if file.size is not None and file.size > settings.UPLOAD_MAX_BYTES:
+        raise ValidationError(too_large())
+
+    position = file.tell()
+    file.seek(0)
+    head = file.read(settings.UPLOAD_SNIFF_BYTES)
+    info = sniff(head)
+    if info is None and len(head) >= settings.UPLOAD_SNIFF_BYTES and needs_full_file(head):
+        file.seek(0)
+        info = sniff_file(file)
+    file.seek(position)
+
+    if info is None:
+        raise ValidationError(NOT_AN_IMAGE)
+    check_image(*info)
@@ -1,19 +1,25 @@
+import os
+
 import requests
 
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.core.files.uploadedfile import UploadedFile
 from django.core.handlers.wsgi import WSGIRequest
+from django.db import IntegrityError, transaction
 from django.forms.forms import Form
-from django.http.response import HttpResponseNotFound, Http404
+from django.http.response import HttpResponseNotFound, HttpResponseRedirect, Http404, JsonResponse
 from django.shortcuts import get_object_or_404
-from django.urls.base import reverse_lazy
-from django.views.generic.base import TemplateView
+from django.urls.base import reverse, reverse_lazy
+from django.views.generic.base import TemplateView, View
+from django.views.generic.detail import DetailView
 from django.views.generic.edit import FormView, DeleteView
 from django.views.generic.list import ListView
 
-from docs_analyze.models import Docs, UsersToDocs, Cart
-from docs_analyze.forms import UploadDocsForm, AnalyzeDocsForm
-from . import service_api
+from docs_analyze.models import AnalysisJob, Docs, UsersToDocs, Cart, UNSUPPORTED_FILE_TYPE
+from docs_analyze.forms import UploadDocsForm, AnalyzeDocsForm, BatchAnalyzeDocsForm
+from docs_analyze.uploads import upload_digest
+from . import doc_text, jobs, media, preprocessing, pricing, service_api, thumbnails
 
 
 # Create your views here.
@@ -21,6 +27,9 @@ from . import service_api
 class DocsHome(ListView):
     """
        Главная страница отображения списка документов.
+       Keyset-пагинация по id (новые сверху): ?after=<id> - следующая страница,
+       ?before=<id> - предыдущая. Любая страница стоит одного прохода по
+       индексу первичного ключа, без OFFSET.
     """
     template_name = 'docs_analyze/index.html'
     context_object_name = 'docs'
@@ -29,8 +38,77 @@ class DocsHome(ListView):
     }
     model = Docs
 
+    def get_cursor(self, name: str):
+        try:
+            return int(self.request.GET[name])
+        except (KeyError, ValueError):
+            return None
+
+    def get_queryset(self):
+        page_size = settings.DOCS_PAGE_SIZE
+        after = self.get_cursor('after')
+        before = self.get_cursor('before') if after is None else None
+        queryset = Docs.objects.all()
+
+        if before is not None:
+            docs = list(queryset.filter(id__gt=before).order_by('id')[:page_size + 1])
+            self.has_previous = len(docs) > page_size
+            docs = docs[:page_size][::-1]
+            self.has_next = bool(docs)
+        else:
+            if after is not None:
+                queryset = queryset.filter(id__lt=after)
+            docs = list(queryset.order_by('-id')[:page_size + 1])
+            self.has_next = len(docs) > page_size
+            docs = docs[:page_size]
+            self.has_previous = after is not None and bool(docs)
+        return docs
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        docs = context['docs']
+        context['next_cursor'] = docs[-1].id if docs and self.has_next else None
+        context['previous_cursor'] = docs[0].id if docs and self.has_previous else None
+        return context
+
+
+class UploadDocsMixin:
+    """
+        Сохранение загруженных документов, общее для синхронного и асинхронного представлений.
+    """
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs['upload_errors'] = getattr(self.request, 'upload_errors', None)
+        return kwargs
+
+    def docs_create(self, path: str, size: int, digest: str = None):
+        """
+            Создает запись о документе в базе данных и связывает его с пользователем.
+            Если такой же файл параллельно успел загрузить другой запрос,
+            пользователь связывается с уже существующим документом.
+            Путь лежит в каталоге по digest, поэтому удаляемая копия не может
+            принадлежать документу с другим содержимым.
+        """
+        try:
+            with transaction.atomic():
+                doc = Docs.objects.create(file_path=path, size=size, digest=digest)
+            thumbnails.schedule(path)
+        except IntegrityError:
+            doc = Docs.objects.get(digest=digest)
+            if doc.file_path != path and os.path.exists(path):
+                os.remove(path)
+        self.link_user(doc)
+
+    def link_user(self, doc: Docs):
+        """
+            Связывает документ с пользователем. Повторная загрузка того же файла
+            не создаёт новый документ: текст и анализ берутся у существующего.
+        """
+        UsersToDocs.objects.get_or_create(username=self.request.user.username, doc_id=doc)
+
 
-class UploadDocs(service_api.JWTView, LoginRequiredMixin, FormView):
+class UploadDocs(service_api.JWTView, LoginRequiredMixin, UploadDocsMixin, FormView):
     """
         Представление для загрузки документа.
         Для загрузки необходимо быть авторизованным
@@ -44,36 +122,34 @@ class UploadDocs(service_api.JWTView, LoginRequiredMixin, FormView):
 
     def form_valid(self, form: UploadDocsForm):
         """
-            Обрабатывает загруженный файл, отправляет его в API и сохраняет в базу данных.
+            Обрабатывает загруженный файл: за один проход отправляет его в API
+            и сохраняет на диск, затем создаёт запись в базе данных.
         """
         uploaded_file = form.cleaned_data['file']
-        response = service_api.api_upload(uploaded_file)
+        digest = upload_digest(self.request, uploaded_file)
 
-        if response.status_code >= 400:
-            return service_api.api_error_handler(response.status_code, response.json()['detail'])
+        duplicate = Docs.objects.filter(digest=digest).first()
+        if duplicate is not None:
+            self.link_user(duplicate)
+            return super().form_valid(form)
 
-        path = 'media/' + uploaded_file.name
-        self.handled_upload_file(uploaded_file, path)
+        upload = preprocessing.prepare_upload(uploaded_file, digest)
+        path = upload.path
 
-        self.docs_create(path, uploaded_file.size)
+        try:
+            response = service_api.api_upload(upload)
+        except Exception:
+            upload.rollback()
+            raise
 
-        return super().form_valid(form)
+        if response.status_code >= 400:
+            upload.rollback()
+            return service_api.api_error_handler(response.status_code, response.json()['detail'])
 
-    def handled_upload_file(self, f: UploadedFile, path: str):
-        """
-            Сохраняет загруженный файл в указанную директорию.
-        """
-        with open(path, 'wb+') as destination:
-            for chunk in f.chunks():
-                destination.write(chunk)
+        upload.finish()
+        self.docs_create(path, upload.size, digest)
 
-    def docs_create(self, path: str, size: int):
-        """
-            Создает запись о документе в базе данных и связывает его с пользователем.
-        """
-        doc = Docs.objects.create(file_path=path, size=size)
-        doc.save()
-        UsersToDocs.objects.create(username=self.request.user.username, doc_id=doc).save()
+        return super().form_valid(form)
 
 
 class GetTextDocs(TemplateView):
@@ -90,16 +166,17 @@ class GetTextDocs(TemplateView):
     def get(self, request: WSGIRequest, *args, **kwargs):
         """
             Получает текст документа по его ID и передает его в шаблон.
+            Текст хранится у нас, к бэкенду идём только за новым или устаревшим текстом.
         """
         doc_id = kwargs['docs_id']
 
-        response = service_api.api_get_text(doc_id)
+        text, response = doc_text.get_text(doc_id)
 
-        if response.status_code >= 400:
+        if response is not None:
             return service_api.api_error_handler(response.status_code, response.json()['detail'])
 
-        self.extra_context['text'] = response.json().get('text')
-        return super().get(request, *args, **kwargs)
+        # extra_context общий для всех запросов: текст передаётся только в контекст этого ответа.
+        return self.render_to_response(self.get_context_data(text=text, **kwargs))
 
 
 class DeleteDocs(service_api.JWTView, UserPassesTestMixin, DeleteView):
@@ -143,7 +220,8 @@ class AnalyzeDocs(service_api.JWTView, LoginRequiredMixin, FormView):
 
     def form_valid(self, form: AnalyzeDocsForm):
         """
-            Запускает анализ документа, добавляет его в корзину и вызывает API.
+            Добавляет документ в корзину и ставит задачу анализа в очередь.
+            Страница не ждёт OCR: пользователь попадает на страницу статуса задачи.
         """
         doc_id = self.kwargs['doc_id']
 
@@ -153,17 +231,125 @@ class AnalyzeDocs(service_api.JWTView, LoginRequiredMixin, FormView):
             return service_api.api_error_handler(500, 'Такого документа для анализа нет')
 
         try:
-            Cart.objects.all().create(user_id=self.request.user, doc_id=doc).save()
+            cart = Cart.objects.all().create(user_id=self.request.user, doc_id=doc)
         except ValueError as e:
             return service_api.api_error_handler(500, str(e))
 
-        response = service_api.api_analyze(doc_id)
+        self.job = jobs.submit(self.request.user, doc, cart)
 
-        if response.status_code >= 400:
-            return service_api.api_error_handler(response.status_code, response.json()['detail'])
+        if self.job.status == AnalysisJob.Status.FAILED:
+            return service_api.api_error_handler(self.job.response_code or 500, self.job.error)
 
         return super().form_valid(form)
 
+    def get_success_url(self):
+        return reverse('analysis_status', args=[self.job.id])
+
+
+class BatchAnalyzeDocs(service_api.JWTView, LoginRequiredMixin, FormView):
+    """
+        Пакетный анализ: много документов за одну отправку формы.
+        Документы загружаются одним запросом, цены берутся из кэша справочника,
+        корзины и задачи создаются через bulk_create.
+    """
+    template_name = 'docs_analyze/batch_analyze.html'
+    form_class = BatchAnalyzeDocsForm
+    extra_context = {
+        'title': 'Пакетный анализ'
+    }
+
+    def form_valid(self, form: BatchAnalyzeDocsForm):
+        """
+            Ставит в очередь анализ всех найденных документов и показывает результат по каждому.
+        """
+        doc_ids = form.cleaned_data['docs']
+        docs = Docs.objects.in_bulk(doc_ids)
+
+        results = {}
+        carts = []
+        for doc_id in doc_ids:
+            doc = docs.get(doc_id)
+            if doc is None:
+                results[doc_id] = {'doc_id': doc_id, 'error': 'Такого документа для анализа нет'}
+                continue
+            order_price = pricing.price_for(doc)
+            if order_price is None:
+                results[doc_id] = {'doc_id': doc_id, 'error': UNSUPPORTED_FILE_TYPE}
+                continue
+            carts.append(Cart(user_id=self.request.user, doc_id=doc, order_price=order_price))
+
+        carts = Cart.objects.bulk_create(carts)
+        batch = jobs.submit_many(self.request.user, carts)
+
+        for cart, job in zip(carts, batch):
+            results[cart.doc_id.id] = {'doc_id': cart.doc_id.id, 'price': cart.order_price, 'job': job}
+
+        return self.render_to_response(self.get_context_data(
+            form=form, results=[results[doc_id] for doc_id in doc_ids]))
+
+
+class AnalysisStatus(LoginRequiredMixin, DetailView):
+    """
+        Статус задачи анализа. Страница опрашивает этот же адрес с ?format=json,
+        пока задача не завершится.
+    """
+    model = AnalysisJob
+    pk_url_kwarg = 'job_id'
+    template_name = 'docs_analyze/analysis_status.html'
+    context_object_name = 'job'
+    extra_context = {
+        'title': 'Статус анализа'
+    }
+
+    def get_queryset(self):
+        queryset = AnalysisJob.objects.all()
+        if not self.request.user.is_superuser:
+            queryset = queryset.filter(user_id=self.request.user)
+        return queryset
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get('format') == 'json':
+            job = self.object
+            return JsonResponse({'id': job.id, 'doc_id': job.doc_id_id, 'status': job.status,
+                                 'finished': job.finished, 'error': job.error})
+        return super().render_to_response(context, **response_kwargs)
+
 
 def page_not_found(request, exception):
-    return HttpResponseNotFound('<h1>Страница не найдена</h1>')
\ No newline at end of file
+    return HttpResponseNotFound('<h1>Страница не найдена</h1>')
+
+
+class DocThumbnail(View):
+    """
+        Отдаёт миниатюру документа заданной ширины, при необходимости генерирует её.
+        Если оригинал не удаётся прочитать как изображение, перенаправляет на него.
+    """
+
+    def get(self, request: WSGIRequest, *args, **kwargs):
+        if kwargs['width'] not in settings.THUMBNAIL_SIZES:
+            raise Http404('Нет миниатюры такого размера')
+
+        doc = get_object_or_404(Docs, id=kwargs['doc_id'])
+        if not media.can_view(request.user, doc.file_path):
+            raise Http404('Нет доступа к документу')
+        path = thumbnails.ensure(doc.file_path, kwargs['width'])
+        if path is None:
+            return HttpResponseRedirect('/' + str(doc.file_path))
+
+        return media.serve(request, path, max_age=86400)
+
+
+class MediaFile(View):
+    """
+        Отдаёт загруженный файл документа с проверкой доступа (MEDIA_ACCESS).
+        Сами байты по возможности отдаёт фронт-прокси (MEDIA_ACCEL), воркер их не читает.
+    """
+
+    def get(self, request: WSGIRequest, *args, **kwargs):
+        file_path = 'media/' + kwargs['name']
+        if (os.path.normpath(file_path) != file_path
+                or not Docs.objects.filter(file_path=file_path).exists()
+                or not media.can_view(request.user, file_path)
+                or not os.path.isfile(file_path)):
+            raise Http404('Файл не найден')
+        return media.serve(request, file_path)
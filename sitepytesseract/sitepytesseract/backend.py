@@ -0,0 +1,367 @@
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+import weakref
+from contextlib import nullcontext
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from prometheus_client import Counter, Gauge, Histogram
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import MaxRetryError
+from urllib3.util.retry import Retry
+
+from .resilience import AsyncBulkhead, Bulkhead, CircuitBreakers, endpoint_group, is_failure
+
+# Повторять можно только запросы, которые бэкенд обрабатывает идемпотентно.
+# Ошибки соединения urllib3 повторяет для любых методов: запрос до бэкенда не дошёл.
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = (502, 503, 504)
+
+# Метрики вызовов бэкенда. Эндпоинт в метках нормализован: /get_text/15 -> /get_text/{id}.
+backend_request_time = Histogram('backend_request_seconds',
+                                 'Time spent waiting for the OCR backend, retries included',
+                                 ['method', 'endpoint'],
+                                 buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0])
+backend_responses = Counter('backend_responses_total',
+                            'Backend responses by status code (timeout/unavailable - no response)',
+                            ['method', 'endpoint', 'status'])
+backend_in_flight = Gauge('backend_requests_in_flight',
+                          'Backend requests currently waiting for a response',
+                          ['endpoint'])
+backend_retries = Counter('backend_retries_total',
+                          'Repeated backend requests',
+                          ['method', 'endpoint'])
+backend_rejected = Counter('backend_rejected_total',
+                           'Backend requests rejected locally: circuit breaker open or bulkhead full',
+                           ['endpoint', 'reason'])
+backend_connections = Counter('backend_connections_total',
+                              'Connections taken from the backend pool: reused keep-alive or newly opened',
+                              ['state'])
+
+ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def endpoint_label(path: str) -> str:
+    return ID_SEGMENT.sub('/{id}', '/' + path.split('?', 1)[0].lstrip('/'))
+
+
+def error_response(status_code: int, detail: str) -> requests.Response:
+    """
+        Ответ-заглушка в формате бэкенда ({'detail': ...}),
+        чтобы представления обрабатывали сбои сети тем же кодом, что и ошибки API.
+    """
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers['Content-Type'] = 'application/json'
+    response._content = json.dumps({'detail': detail}).encode()
+    return response
+
+
+def response_snapshot(response) -> dict:
+    """
+        Ответ бэкенда в виде, пригодном для кэша (склейка запросов между воркерами).
+    """
+    return {'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'content': response.content}
+
+
+def response_from_snapshot(snapshot: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = snapshot['status_code']
+    response.headers.update(snapshot['headers'])
+    response._content = snapshot['content']
+    return response
+
+
+class ConnectionCountingMixin:
+    """
+        Считает, взято ли соединение из keep-alive пула или открыто заново.
+        У нового (или закрытого как оборванное) соединения ещё нет сокета.
+    """
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        backend_connections.labels('reused' if conn.sock is not None else 'new').inc()
+        return conn
+
+
+class CountingHTTPConnectionPool(ConnectionCountingMixin, HTTPConnectionPool):
+    pass
+
+
+class CountingHTTPSConnectionPool(ConnectionCountingMixin, HTTPSConnectionPool):
+    pass
+
+
+class InstrumentedAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {'http': CountingHTTPConnectionPool,
+                                                   'https': CountingHTTPSConnectionPool}
+
+
+class BackendClient:
+    """
+        Общий HTTP-клиент для обращений к бэкенду (nginx -> OCR API).
+        Держит keep-alive пул соединений, таймауты и ограниченные повторы с джиттером.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = 10, connect_timeout: float = 3.0,
+                 read_timeout: float = 30.0, retries: int = 2, backoff: float = 0.2, jitter: float = 0.2,
+                 breakers: CircuitBreakers = None, bulkhead: Bulkhead = None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.breakers = breakers
+        self.bulkhead = bulkhead
+
+        retry = Retry(total=retries,
+                      allowed_methods=IDEMPOTENT_METHODS,
+                      status_forcelist=RETRY_STATUSES,
+                      backoff_factor=backoff,
+                      backoff_jitter=jitter,
+                      raise_on_status=False)
+        adapter = InstrumentedAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def url(self, path: str) -> str:
+        return self.base_url + '/' + path.lstrip('/')
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+            Запрос к бэкенду через предохранитель эндпоинта и bulkhead его группы.
+            Отказ без обращения к бэкенду возвращается как ответ 503.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        endpoint = endpoint_label(path)
+
+        breaker = self.breakers[endpoint] if self.breakers is not None else None
+        state = breaker.allow() if breaker is not None else None
+        if breaker is not None and state is None:
+            backend_rejected.labels(endpoint, 'open').inc()
+            return error_response(503, 'Backend is temporarily unavailable')
+
+        slot = self.bulkhead.slot(endpoint_group(endpoint)) if self.bulkhead is not None else nullcontext(True)
+        with slot as acquired:
+            if not acquired:
+                backend_rejected.labels(endpoint, 'busy').inc()
+                return error_response(503, 'Backend is busy')
+            response = self.send(method, path, endpoint, **kwargs)
+
+        if breaker is not None:
+            breaker.record(state, not is_failure(response.status_code))
+        return response
+
+    def send(self, method: str, path: str, endpoint: str, **kwargs) -> requests.Response:
+        backend_in_flight.labels(endpoint).inc()
+        start_time = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+            status = str(response.status_code)
+            retries = len(getattr(getattr(response.raw, 'retries', None), 'history', ()))
+        except requests.Timeout:
+            response, status, retries = error_response(504, 'Backend did not respond in time'), 'timeout', 0
+        except requests.ConnectionError as e:
+            response, status = error_response(503, 'Backend is unavailable'), 'unavailable'
+            retries = self.retries if e.args and isinstance(e.args[0], MaxRetryError) else 0
+        finally:
+            backend_in_flight.labels(endpoint).dec()
+            backend_request_time.labels(method, endpoint).observe(time.perf_counter() - start_time)
+
+        backend_responses.labels(method, endpoint, status).inc()
+        if retries:
+            backend_retries.labels(method, endpoint).inc(retries)
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_breakers() -> CircuitBreakers:
+    return CircuitBreakers(failures=settings.BACKEND_BREAKER_FAILURES,
+                           window=settings.BACKEND_BREAKER_WINDOW,
+                           open_seconds=settings.BACKEND_BREAKER_OPEN_SECONDS)
+
+
+def get_client() -> BackendClient:
+    """
+        Клиент создаётся лениво, один на процесс: после fork сокеты
+        родительского пула не переиспользуются.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = BackendClient(settings.BACKEND_API_URL,
+                                        pool_size=settings.BACKEND_POOL_SIZE,
+                                        connect_timeout=settings.BACKEND_CONNECT_TIMEOUT,
+                                        read_timeout=settings.BACKEND_READ_TIMEOUT,
+                                        retries=settings.BACKEND_RETRIES,
+                                        backoff=settings.BACKEND_RETRY_BACKOFF,
+                                        jitter=settings.BACKEND_RETRY_JITTER,
+                                        breakers=get_breakers(),
+                                        bulkhead=Bulkhead(settings.BACKEND_BULKHEADS,
+                                                          wait=settings.BACKEND_BULKHEAD_WAIT))
+                _client_pid = pid
+    return _client
+
+
+def async_error_response(status_code: int, detail: str) -> httpx.Response:
+    return httpx.Response(status_code, json={'detail': detail})
+
+
+def async_response_from_snapshot(snapshot: dict) -> httpx.Response:
+    headers = {name: value for name, value in snapshot['headers'].items()
+               if name.lower() not in ('content-encoding', 'transfer-encoding')}
+    return httpx.Response(snapshot['status_code'], headers=headers, content=snapshot['content'])
+
+
+class AsyncBackendClient:
+    """
+        Асинхронный вариант BackendClient на httpx.AsyncClient с тем же пулом,
+        таймаутами и политикой повторов.
+    """
+
+    def __init__(self, base_url: str, pool_size: int = 100, connect_timeout: float = 3.0,
+                 read_timeout: float = 30.0, retries: int = 2, backoff: float = 0.2, jitter: float = 0.2,
+                 breakers: CircuitBreakers = None, bulkhead: AsyncBulkhead = None):
+        self.retries = retries
+        self.breakers = breakers
+        self.bulkhead = bulkhead
+        self.backoff = backoff
+        self.jitter = jitter
+        self.client = httpx.AsyncClient(
+            base_url=base_url.rstrip('/') + '/',
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def _sleep(self, attempt: int):
+        await asyncio.sleep(self.backoff * (2 ** attempt) + random.uniform(0, self.jitter))
+
+    async def request(self, method: str, path: str, **kwargs) -> httpx.Response:
+        endpoint = endpoint_label(path)
+
+        breaker = self.breakers[endpoint] if self.breakers is not None else None
+        state = await sync_to_async(breaker.allow, thread_sensitive=False)() if breaker is not None else None
+        if breaker is not None and state is None:
+            backend_rejected.labels(endpoint, 'open').inc()
+            return async_error_response(503, 'Backend is temporarily unavailable')
+
+        slot = self.bulkhead.slot(endpoint_group(endpoint)) if self.bulkhead is not None else nullcontext(True)
+        async with slot as acquired:
+            if not acquired:
+                backend_rejected.labels(endpoint, 'busy').inc()
+                return async_error_response(503, 'Backend is busy')
+            response = await self.send(method, path, endpoint, **kwargs)
+
+        if breaker is not None:
+            await sync_to_async(breaker.record, thread_sensitive=False)(state, not is_failure(response.status_code))
+        return response
+
+    async def send(self, method: str, path: str, endpoint: str, **kwargs) -> httpx.Response:
+        backend_in_flight.labels(endpoint).inc()
+        start_time = time.perf_counter()
+        try:
+            response, status = await self._request(method, path, endpoint, **kwargs)
+        finally:
+            backend_in_flight.labels(endpoint).dec()
+            backend_request_time.labels(method, endpoint).observe(time.perf_counter() - start_time)
+        backend_responses.labels(method, endpoint, status).inc()
+        return response
+
+    async def _retry(self, method: str, endpoint: str, attempt: int):
+        backend_retries.labels(method, endpoint).inc()
+        await self._sleep(attempt)
+
+    async def _request(self, method: str, path: str, endpoint: str, **kwargs):
+        attempts = self.retries + 1
+        for attempt in range(attempts):
+            last_attempt = attempt + 1 == attempts
+            try:
+                response = await self.client.request(method, path.lstrip('/'), **kwargs)
+            except httpx.ConnectError:
+                if not last_attempt:
+                    await self._retry(method, endpoint, attempt)
+                    continue
+                return async_error_response(503, 'Backend is unavailable'), 'unavailable'
+            except httpx.TimeoutException:
+                if method in IDEMPOTENT_METHODS and not last_attempt:
+                    await self._retry(method, endpoint, attempt)
+                    continue
+                return async_error_response(504, 'Backend did not respond in time'), 'timeout'
+            except httpx.TransportError:
+                if method in IDEMPOTENT_METHODS and not last_attempt:
+                    await self._retry(method, endpoint, attempt)
+                    continue
+                return async_error_response(503, 'Backend is unavailable'), 'unavailable'
+
+            if (response.status_code in RETRY_STATUSES and method in IDEMPOTENT_METHODS
+                    and not last_attempt):
+                await response.aclose()
+                await self._retry(method, endpoint, attempt)
+                continue
+            return response, str(response.status_code)
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', path, **kwargs)
+
+    async def delete(self, path: str, **kwargs) -> httpx.Response:
+        return await self.request('DELETE', path, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+# Пул httpx привязан к event loop, поэтому асинхронный клиент создаётся на каждый цикл.
+# Под ASGI-сервером цикл один на процесс и пул переиспользуется всеми запросами.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> AsyncBackendClient:
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = AsyncBackendClient(settings.BACKEND_API_URL,
+                                    pool_size=settings.BACKEND_ASYNC_POOL_SIZE,
+                                    connect_timeout=settings.BACKEND_CONNECT_TIMEOUT,
+                                    read_timeout=settings.BACKEND_READ_TIMEOUT,
+                                    retries=settings.BACKEND_RETRIES,
+                                    backoff=settings.BACKEND_RETRY_BACKOFF,
+                                    jitter=settings.BACKEND_RETRY_JITTER,
+                                    breakers=get_breakers(),
+                                    bulkhead=AsyncBulkhead(settings.BACKEND_ASYNC_BULKHEADS,
+                                                           wait=settings.BACKEND_BULKHEAD_WAIT))
+        _async_clients[loop] = client
+    return client
@@ -0,0 +1,228 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+pool_connections = Gauge('db_pool_connections',
+                         'Connections held by the pool',
+                         ['database', 'state'])
+pool_checkouts = Counter('db_pool_checkouts_total',
+                         'Connections handed out by the pool',
+                         ['database'])
+pool_wait_time = Histogram('db_pool_wait_seconds',
+                           'Time spent waiting for a pooled connection',
+                           ['database'],
+                           buckets=[0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0])
+pool_timeouts = Counter('db_pool_timeouts_total',
+                        'Checkouts that gave up waiting for a free connection',
+                        ['database'])
+pool_discarded = Counter('db_pool_discarded_total',
+                         'Connections closed by the pool',
+                         ['database', 'reason'])
+
+TRANSACTION_IDLE = 0
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class PooledConnection:
+    __slots__ = ('connection', 'created_at', 'returned_at')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.returned_at = self.created_at
+
+
+class ConnectionPool:
+    """
+        Пул соединений с PostgreSQL для одного процесса.
+
+        min_size соединений открываются при первом обращении и не закрываются по простою,
+        больше max_size не открывается - ждём свободное не дольше timeout секунд.
+        Соединение старше max_lifetime закрывается при возврате; простоявшее
+        дольше check_after секунд проверяется SELECT 1 перед выдачей.
+    """
+
+    def __init__(self, connect, name: str, min_size: int = 1, max_size: int = 10,
+                 max_lifetime: float = 1800, check_after: float = 10, timeout: float = 10):
+        self.connect = connect
+        self.name = name
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+        self.timeout = timeout
+
+        self.idle = deque()
+        self.in_use = {}
+        self.opening = 0
+        self.condition = threading.Condition()
+        self.filled = False
+
+    @property
+    def size(self) -> int:
+        return len(self.idle) + len(self.in_use) + self.opening
+
+    def _open(self) -> PooledConnection:
+        try:
+            return PooledConnection(self.connect())
+        except BaseException:
+            with self.condition:
+                self.opening -= 1
+                self.condition.notify()
+            raise
+
+    def _fill(self):
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    self.filled = True
+                    return
+                self.opening += 1
+            pooled = self._open()
+            with self.condition:
+                self.opening -= 1
+                self.idle.append(pooled)
+                self.condition.notify()
+            pool_connections.labels(self.name, 'idle').inc()
+
+    def getconn(self):
+        if not self.filled:
+            self._fill()
+
+        start_time = time.monotonic()
+        deadline = start_time + self.timeout
+        while True:
+            pooled = None
+            with self.condition:
+                while not self.idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        pool_timeouts.labels(self.name).inc()
+                        raise PoolTimeout(f'No free connection in pool {self.name} after {self.timeout} s')
+                    self.condition.wait(remaining)
+                if self.idle:
+                    pooled = self.idle.pop()
+                    pool_connections.labels(self.name, 'idle').dec()
+                else:
+                    self.opening += 1
+
+            if pooled is None:
+                pooled = self._open()
+                with self.condition:
+                    self.opening -= 1
+            elif not self._healthy(pooled):
+                continue
+
+            with self.condition:
+                self.in_use[id(pooled.connection)] = pooled
+            pool_connections.labels(self.name, 'in_use').inc()
+            pool_checkouts.labels(self.name).inc()
+            pool_wait_time.labels(self.name).observe(time.monotonic() - start_time)
+            return pooled.connection
+
+    def _healthy(self, pooled: PooledConnection) -> bool:
+        connection = pooled.connection
+        healthy = not connection.closed
+        if healthy and time.monotonic() - pooled.returned_at >= self.check_after:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            except Exception:
+                healthy = False
+        if not healthy:
+            self._discard(connection, 'health_check')
+        return healthy
+
+    def putconn(self, connection):
+        with self.condition:
+            pooled = self.in_use.pop(id(connection), None)
+        if pooled is None:
+            # Не наше соединение (например, открытое до fork): просто закрываем.
+            connection.close()
+            return
+        pool_connections.labels(self.name, 'in_use').dec()
+
+        reason = None
+        if connection.closed:
+            reason = 'broken'
+        elif time.monotonic() - pooled.created_at >= self.max_lifetime:
+            reason = 'expired'
+        elif connection.info.transaction_status != TRANSACTION_IDLE:
+            try:
+                connection.rollback()
+            except Exception:
+                reason = 'broken'
+
+        if reason is not None:
+            self._discard(connection, reason)
+            with self.condition:
+                self.filled = self.size >= self.min_size
+                self.condition.notify()
+            return
+
+        pooled.returned_at = time.monotonic()
+        with self.condition:
+            self.idle.append(pooled)
+            self.condition.notify()
+        pool_connections.labels(self.name, 'idle').inc()
+
+    def _discard(self, connection, reason: str):
+        pool_discarded.labels(self.name, reason).inc()
+        try:
+            connection.close()
+        except Exception:
+            logger.debug('Error closing pooled connection', exc_info=True)
+
+    def close(self):
+        """
+            Закрывает свободные соединения; выданные закроются при возврате.
+        """
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+            self.filled = False
+            self.max_lifetime = 0
+        for pooled in idle:
+            pool_connections.labels(self.name, 'idle').dec()
+            self._discard(pooled.connection, 'closed')
+
+
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+
+
+def get_pool(key, factory) -> ConnectionPool:
+    """
+        Пул на процесс и набор параметров подключения. После fork пулы родителя
+        забываются, но не закрываются: их сокеты всё ещё принадлежат родителю.
+    """
+    global _pools, _pools_pid
+    pid = os.getpid()
+    with _pools_lock:
+        if _pools_pid != pid:
+            _pools, _pools_pid = {}, pid
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def close_pools(database: str = None):
+    with _pools_lock:
+        pools = [pool for key, pool in _pools.items() if database is None or pool.name == database]
+        if database is None:
+            _pools.clear()
+        else:
+            for key in [key for key, pool in _pools.items() if pool.name == database]:
+                del _pools[key]
+    for pool in pools:
+        pool.close()
@@ -0,0 +1,53 @@
+from django.db.backends.postgresql import base
+
+from sitepytesseract.db.pool import ConnectionPool, get_pool
+from .creation import DatabaseCreation
+
+POOL_DEFAULTS = {
+    'MIN_SIZE': 1,
+    'MAX_SIZE': 10,
+    'MAX_LIFETIME': 1800,
+    'CHECK_AFTER': 10,
+    'TIMEOUT': 10,
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+        Бэкенд PostgreSQL с пулом соединений (settings.DATABASES[...]['POOL']).
+        Django по-прежнему "открывает" и "закрывает" соединение на каждый запрос
+        (CONN_MAX_AGE = 0), но физически оно берётся из пула процесса и возвращается в него.
+        У каждого потока своё соединение, пул общий и потокобезопасный.
+    """
+    creation_class = DatabaseCreation
+
+    def pool_options(self) -> dict:
+        return {**POOL_DEFAULTS, **self.settings_dict.get('POOL', {})}
+
+    def get_pool(self, conn_params: dict) -> ConnectionPool:
+        options = self.pool_options()
+        connect = super().get_new_connection
+
+        def factory():
+            return ConnectionPool(lambda: connect(conn_params),
+                                  name=conn_params.get('dbname', ''),
+                                  min_size=options['MIN_SIZE'],
+                                  max_size=options['MAX_SIZE'],
+                                  max_lifetime=options['MAX_LIFETIME'],
+                                  check_after=options['CHECK_AFTER'],
+                                  timeout=options['TIMEOUT'])
+
+        key = (self.alias, tuple(sorted((name, repr(value)) for name, value in conn_params.items())))
+        return get_pool(key, factory)
+
+    def get_new_connection(self, conn_params):
+        connection = self.get_pool(conn_params).getconn()
+        isolation_level = self.settings_dict['OPTIONS'].get('isolation_level')
+        self.isolation_level = (base.IsolationLevel(isolation_level) if isolation_level is not None
+                                else base.IsolationLevel.READ_COMMITTED)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.get_pool(self.get_connection_params()).putconn(self.connection)
@@ -1,39 +1,110 @@
-from prometheus_client import Counter, Histogram
+import logging
+import random
 import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from prometheus_client import Counter, Histogram
 
+# Метки только с ограниченным набором значений: шаблон маршрута, метод и класс статуса.
+# Путь, IP, User-Agent и т.п. в метках давали новый временной ряд на каждого клиента и URL,
+# они пишутся в выборочный лог запросов (REQUEST_LOG_SAMPLE_RATE).
 request_total = Counter('request_total',
                         'Total number of requests',
-                        ['method',
-                         'full_path',
-                         'ip',
-                         'user_agent',
-                         'referrer',
-                         'http_host',
-                         'server_name'])
+                        ['method', 'route', 'status'])
 
 request_time = Histogram('request_processing_seconds',
-                       'Time spent processing requests',
-                       ['method', 'full_path', 'ip', 'http_host', 'server_name'],
-                         buckets=[0.01, 0.1, 0.5, 1.0, 5.0, 10.0])
+                         'Time spent processing requests',
+                         ['method', 'route', 'status'],
+                         buckets=[0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0])
+
+KNOWN_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+UNMATCHED_ROUTE = '<unmatched>'
+
+logger = logging.getLogger('sitepytesseract.requests')
+
+
+def route_label(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return UNMATCHED_ROUTE
+    return match.route or match.view_name or UNMATCHED_ROUTE
+
+
+def method_label(method: str) -> str:
+    return method if method in KNOWN_METHODS else 'other'
+
+
+def status_label(status_code: int) -> str:
+    return f'{status_code // 100}xx'
 
 
 class StatisticsMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        method = request.method
-        full_path = request.get_full_path()
-        ip = request.META.get('REMOTE_ADDR', '')
-        user_agent = request.META.get('HTTP_USER_AGENT', '')
-        referrer = request.META.get('HTTP_REFERER', '')
-        http_host = request.META.get('HTTP_HOST', '')
-        server_name = request.META.get('SERVER_NAME', '')
-
-        start_time = time.time()
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start_time = time.perf_counter()
         response = self.get_response(request)
-        duration = time.time() - start_time
-        request_total.labels(method, full_path, ip, user_agent, referrer, http_host, server_name).inc()
-        request_time.labels(method, full_path, ip, http_host, server_name).observe(duration)
+        self.record(request, response, time.perf_counter() - start_time)
+        return response
+
+    async def __acall__(self, request):
+        start_time = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start_time)
+        return response
+
+    def record(self, request, response, duration: float):
+        labels = (method_label(request.method), route_label(request), status_label(response.status_code))
+        request_total.labels(*labels).inc()
+        request_time.labels(*labels).observe(duration)
+
+        sample_rate = settings.REQUEST_LOG_SAMPLE_RATE
+        if sample_rate > 0 and random.random() < sample_rate:
+            client = {'ip': request.META.get('REMOTE_ADDR', ''),
+                      'user_agent': request.META.get('HTTP_USER_AGENT', ''),
+                      'referrer': request.META.get('HTTP_REFERER', ''),
+                      'http_host': request.META.get('HTTP_HOST', ''),
+                      'server_name': request.META.get('SERVER_NAME', '')}
+            # Поля клиента пишутся и в текст записи (его выводят обычные обработчики), и в extra.
+            logger.info('%s %s %s %.3fs ip=%s host=%s server=%s referrer="%s" user_agent="%s"',
+                        request.method, request.get_full_path(), response.status_code, duration,
+                        client['ip'], client['http_host'], client['server_name'], client['referrer'],
+                        client['user_agent'], extra=client)
+
+
+class QueryCountMiddleware:
+    """
+        Добавляет к ответу заголовок X-DB-Queries с числом запросов к БД за время
+        обработки (для нагрузочных прогонов, benchmarks.load). Включается QUERY_COUNT_HEADER.
+        Считает запросы в потоке запроса: запросы из sync_to_async асинхронных
+        представлений и фоновых потоков сюда не попадают.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        count = 0
+
+        def counter(execute, sql, params, many, context):
+            nonlocal count
+            count += 1
+            return execute(sql, params, many, context)
 
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        response['X-DB-Queries'] = str(count)
         return response
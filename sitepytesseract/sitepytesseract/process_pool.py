@@ -0,0 +1,56 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+        Общий пул процессов для CPU-тяжёлой обработки изображений.
+        Создаётся лениво, один на процесс: после fork пул родителя не используется.
+        Дочерние процессы стартуют через PROCESS_POOL_START_METHOD (forkserver/spawn),
+        а не fork из многопоточного воркера.
+        Функции для пула не должны обращаться к настройкам и БД - все параметры
+        передаются аргументами.
+    """
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.PROCESS_POOL_WORKERS,
+                    mp_context=multiprocessing.get_context(settings.PROCESS_POOL_START_METHOD))
+                _pool_pid = pid
+    return _pool
+
+
+def _log_failure(future: Future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error('Background image task failed', exc_info=future.exception())
+
+
+def submit(fn, *args, **kwargs) -> Future:
+    """
+        Запускает задачу в пуле "в фоне": ошибки только логируются.
+    """
+    future = get_pool().submit(fn, *args, **kwargs)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True)
+            _pool = None
@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Группы эндпоинтов бэкенда для ограничения параллелизма (bulkhead):
+# медленный анализ не должен занимать все соединения, нужные авторизации и чтению текста.
+ENDPOINT_GROUPS = (
+    ('/token', 'auth'),
+    ('/doc_analyze/', 'analyze'),
+    ('/upload_doc/', 'analyze'),
+    ('/get_text/', 'docs'),
+    ('/doc_delete/', 'docs'),
+)
+DEFAULT_GROUP = 'other'
+
+
+def endpoint_group(endpoint: str) -> str:
+    for prefix, group in ENDPOINT_GROUPS:
+        if endpoint.startswith(prefix):
+            return group
+    return DEFAULT_GROUP
+
+
+def is_failure(status_code: int) -> bool:
+    return status_code >= 500
+
+
+class CircuitBreaker:
+    """
+        Предохранитель на эндпоинт бэкенда, состояние хранится в CACHES['default'] (Redis)
+        и общее для всех воркеров.
+
+        closed - запросы идут, ошибки 5xx считаются в окне window секунд (успешные
+        ответы счётчик не сбрасывают: так на каждый успех нет записи в Redis);
+        open - после failures ошибок за window секунд, даже вперемешку с успешными ответами,
+        запросы сразу отклоняются open_seconds секунд;
+        half-open - по истечении open_seconds один пробный запрос: успех закрывает
+        предохранитель, ошибка снова открывает.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, name: str, failures: int = 5, window: int = 30, open_seconds: int = 15):
+        self.name = name
+        self.failures = failures
+        self.window = window
+        self.open_seconds = open_seconds
+        self.open_key = f'breaker:{name}:open_until'
+        self.failures_key = f'breaker:{name}:failures'
+        self.probe_key = f'breaker:{name}:probe'
+
+    def state(self) -> str:
+        open_until = cache.get(self.open_key)
+        if open_until is None:
+            return self.CLOSED
+        return self.OPEN if time.time() < open_until else self.HALF_OPEN
+
+    def allow(self):
+        """
+            Возвращает состояние, в котором пропущен запрос, или None, если запрос нужно отклонить.
+            В half-open пропускается только тот, кто первым занял пробный слот.
+            Если кэш недоступен, запросы пропускаются.
+        """
+        try:
+            state = self.state()
+            if state == self.HALF_OPEN and not cache.add(self.probe_key, 1, self.open_seconds):
+                return None
+        except Exception:
+            logger.warning('Circuit breaker state is unavailable', exc_info=True)
+            return self.CLOSED
+        return None if state == self.OPEN else state
+
+    def record(self, state: str, success: bool):
+        try:
+            if success:
+                if state == self.HALF_OPEN:
+                    cache.delete_many([self.open_key, self.failures_key, self.probe_key])
+                return
+            if state == self.HALF_OPEN:
+                self.trip()
+                return
+            cache.add(self.failures_key, 0, self.window)
+            try:
+                failures = cache.incr(self.failures_key)
+            except ValueError:
+                failures = 1
+                cache.set(self.failures_key, failures, self.window)
+            if failures >= self.failures:
+                self.trip()
+        except Exception:
+            logger.warning('Circuit breaker state is unavailable', exc_info=True)
+
+    def trip(self):
+        logger.warning('Circuit breaker %s is open for %s s', self.name, self.open_seconds)
+        # Ключ живёт дольше периода open: по его истечении предохранитель в half-open.
+        cache.set(self.open_key, time.time() + self.open_seconds, self.open_seconds * 10)
+        cache.delete_many([self.failures_key, self.probe_key])
+
+
+class CircuitBreakers:
+
+    def __init__(self, failures: int = 5, window: int = 30, open_seconds: int = 15):
+        self.params = {'failures': failures, 'window': window, 'open_seconds': open_seconds}
+        self.breakers = {}
+
+    def __getitem__(self, endpoint: str) -> CircuitBreaker:
+        breaker = self.breakers.get(endpoint)
+        if breaker is None:
+            breaker = self.breakers.setdefault(endpoint, CircuitBreaker(endpoint, **self.params))
+        return breaker
+
+
+class Bulkhead:
+    """
+        Ограничение числа одновременных запросов к бэкенду на группу эндпоинтов в процессе.
+        Свободного места ждём не дольше wait секунд.
+    """
+
+    def __init__(self, limits: dict, wait: float = 0.5):
+        self.wait = wait
+        self.semaphores = {group: threading.BoundedSemaphore(limit) for group, limit in limits.items()}
+
+    @contextmanager
+    def slot(self, group: str):
+        semaphore = self.semaphores.get(group) or self.semaphores.get(DEFAULT_GROUP)
+        if semaphore is None:
+            yield True
+            return
+        acquired = semaphore.acquire(timeout=self.wait)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                semaphore.release()
+
+
+class AsyncBulkhead:
+
+    def __init__(self, limits: dict, wait: float = 0.5):
+        self.wait = wait
+        self.semaphores = {group: asyncio.Semaphore(limit) for group, limit in limits.items()}
+
+    @asynccontextmanager
+    async def slot(self, group: str):
+        semaphore = self.semaphores.get(group) or self.semaphores.get(DEFAULT_GROUP)
+        if semaphore is None:
+            yield True
+            return
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.wait)
+            acquired = True
+        except asyncio.TimeoutError:
+            acquired = False
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                semaphore.release()
@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -57,6 +57,31 @@ MIDDLEWARE = [
     'sitepytesseract.middleware.StatisticsMiddleware',
 ]
 
+# manage.py bootstrap: администратор и цены создаются, только если их ещё нет.
+# Цены задаются как '.png:0.001,.jpg:0.001' (цена за байт файла).
+BOOTSTRAP_ADMIN_USERNAME = config('BOOTSTRAP_ADMIN_USERNAME', default='admin')
+BOOTSTRAP_ADMIN_EMAIL = config('BOOTSTRAP_ADMIN_EMAIL', default='admin@myproject.com')
+BOOTSTRAP_ADMIN_PASSWORD = config('BOOTSTRAP_ADMIN_PASSWORD', default='admin')
+BOOTSTRAP_PRICES = config('BOOTSTRAP_PRICES', default='.png:0.001,.jpg:0.001,.jpeg:0.001')
+
+# Продакшн-сервер (manage.py serve, gunicorn). SERVER_WORKERS = 0 - по числу CPU.
+# SERVER_GRACEFUL_TIMEOUT должен покрывать самую долгую загрузку файла.
+SERVER_BIND = config('SERVER_BIND', default='0.0.0.0:8001')
+SERVER_WORKERS = config('SERVER_WORKERS', default=0, cast=int)
+SERVER_THREADS = config('SERVER_THREADS', default=8, cast=int)
+SERVER_MAX_REQUESTS = config('SERVER_MAX_REQUESTS', default=5000, cast=int)
+SERVER_MAX_REQUESTS_JITTER = config('SERVER_MAX_REQUESTS_JITTER', default=500, cast=int)
+SERVER_GRACEFUL_TIMEOUT = config('SERVER_GRACEFUL_TIMEOUT', default=120, cast=int)
+SERVER_TIMEOUT = config('SERVER_TIMEOUT', default=120, cast=int)
+
+# Доля запросов, которые StatisticsMiddleware пишет в лог с адресом, User-Agent и Referer клиента
+REQUEST_LOG_SAMPLE_RATE = config('REQUEST_LOG_SAMPLE_RATE', default=0.0, cast=float)
+
+# Заголовок X-DB-Queries с числом запросов к БД на каждый ответ (нагрузочные прогоны, benchmarks)
+QUERY_COUNT_HEADER = config('QUERY_COUNT_HEADER', default=False, cast=bool)
+if QUERY_COUNT_HEADER:
+    MIDDLEWARE.insert(1, 'sitepytesseract.middleware.QueryCountMiddleware')
+
 ROOT_URLCONF = 'sitepytesseract.urls'
 
 TEMPLATES = [
@@ -83,14 +108,25 @@ WSGI_APPLICATION = 'sitepytesseract.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# DB_POOL - пул соединений процесса (sitepytesseract.db.postgresql_pool): соединение
+# не открывается на каждый запрос, а берётся из пула. Без пула - обычный бэкенд Django.
+DB_POOL = config('DB_POOL', default=True, cast=bool)
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'sitepytesseract.db.postgresql_pool' if DB_POOL else 'django.db.backends.postgresql',
         'NAME': config('DB_NAME'),
         'USER': config('DB_USER'),
         'PASSWORD': config('DB_PASSWORD'),
         'HOST': config('DB_HOST'),
         'PORT': config('DB_PORT'),
+        'POOL': {
+            'MIN_SIZE': config('DB_POOL_MIN_SIZE', default=1, cast=int),
+            'MAX_SIZE': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'MAX_LIFETIME': config('DB_POOL_MAX_LIFETIME', default=1800, cast=int),
+            'CHECK_AFTER': config('DB_POOL_CHECK_AFTER', default=10, cast=float),
+            'TIMEOUT': config('DB_POOL_TIMEOUT', default=10, cast=float),
+        },
     }
 }
 
@@ -113,6 +149,15 @@ AUTH_PASSWORD_VALIDATORS = [
     # },
 ]
 
+# Пользователь сессии берётся из CACHES['default'], сессии пишутся в БД и кэш (write-through).
+# Вторая строка нужна для сессий, созданных до перехода на кэшируемый backend.
+AUTHENTICATION_BACKENDS = [
+    'users.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USER_CACHE_SECONDS = config('AUTH_USER_CACHE_SECONDS', default=15 * 60, cast=int)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -143,6 +188,35 @@ LOGIN_URL = 'users:login'
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
+# Доступ к загруженным файлам (/media/): public, authenticated или owner (загрузивший и админ).
+# По умолчанию public: главная страница (DocsHome) показывает все документы с миниатюрами,
+# при authenticated/owner чужие превью и файлы в галерее будут недоступны.
+# MEDIA_ACCEL: '' - файл отдаёт Django (ETag, 304, Range), nginx - X-Accel-Redirect на
+# internal-location MEDIA_ACCEL_PREFIX (location /protected-media/ { internal; alias <MEDIA_ROOT>/; }),
+# sendfile - X-Sendfile (Apache, lighttpd).
+MEDIA_ACCESS = config('MEDIA_ACCESS', default='public')
+MEDIA_ACCEL = config('MEDIA_ACCEL', default='')
+MEDIA_ACCEL_PREFIX = config('MEDIA_ACCEL_PREFIX', default='/protected-media/')
+MEDIA_CACHE_SECONDS = config('MEDIA_CACHE_SECONDS', default=60 * 60, cast=int)
+
+# Первым стоит обработчик, который проверяет изображение по заголовку и обрывает
+# приём слишком большого или не того файла. Следующий считает sha256 файла во время приёма:
+# по нему повторные загрузки связываются с уже существующим документом.
+FILE_UPLOAD_HANDLERS = [
+    'docs_analyze.upload_handlers.ImageLimitsUploadHandler',
+    'docs_analyze.upload_handlers.DigestUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Ограничения загружаемых изображений. Формат и размеры определяются по первым
+# UPLOAD_SNIFF_BYTES байтам; полное декодирование Pillow (UPLOAD_FULL_DECODE) по желанию.
+UPLOAD_MAX_BYTES = config('UPLOAD_MAX_BYTES', default=20 * 1024 * 1024, cast=int)
+UPLOAD_MAX_PIXELS = config('UPLOAD_MAX_PIXELS', default=40_000_000, cast=int)
+UPLOAD_SNIFF_BYTES = config('UPLOAD_SNIFF_BYTES', default=64 * 1024, cast=int)
+UPLOAD_IMAGE_FORMATS = config('UPLOAD_IMAGE_FORMATS', default='PNG,JPEG,GIF,BMP,TIFF,WEBP', cast=Csv())
+UPLOAD_FULL_DECODE = config('UPLOAD_FULL_DECODE', default=False, cast=bool)
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
@@ -150,6 +224,127 @@ CACHES = {
     }
 }
 
+# Backend API
+# Единственное место, где задаётся адрес бэкенда. Размер пула соединений
+# задаётся на воркер и должен быть не меньше числа его потоков.
+
+BACKEND_API_URL = config('BACKEND_API_URL', default='http://nginx:80/api/v1')
+BACKEND_POOL_SIZE = config('BACKEND_POOL_SIZE', default=10, cast=int)
+BACKEND_CONNECT_TIMEOUT = config('BACKEND_CONNECT_TIMEOUT', default=3.0, cast=float)
+BACKEND_READ_TIMEOUT = config('BACKEND_READ_TIMEOUT', default=60.0, cast=float)
+BACKEND_RETRIES = config('BACKEND_RETRIES', default=2, cast=int)
+BACKEND_RETRY_BACKOFF = config('BACKEND_RETRY_BACKOFF', default=0.2, cast=float)
+BACKEND_RETRY_JITTER = config('BACKEND_RETRY_JITTER', default=0.2, cast=float)
+
+# Предохранитель (circuit breaker) на эндпоинт бэкенда, состояние общее для воркеров (Redis):
+# после BACKEND_BREAKER_FAILURES ошибок 5xx за BACKEND_BREAKER_WINDOW секунд запросы
+# к эндпоинту отклоняются сразу на BACKEND_BREAKER_OPEN_SECONDS секунд.
+BACKEND_BREAKER_FAILURES = config('BACKEND_BREAKER_FAILURES', default=5, cast=int)
+BACKEND_BREAKER_WINDOW = config('BACKEND_BREAKER_WINDOW', default=30, cast=int)
+BACKEND_BREAKER_OPEN_SECONDS = config('BACKEND_BREAKER_OPEN_SECONDS', default=15, cast=int)
+
+# Bulkhead: сколько запросов каждой группы эндпоинтов одновременно держит один процесс.
+# Лимит analyze должен быть не меньше ANALYSIS_THREAD_WORKERS и ANALYSIS_BATCH_CONCURRENCY.
+BACKEND_BULKHEADS = {
+    'auth': config('BACKEND_BULKHEAD_AUTH', default=8, cast=int),
+    'analyze': config('BACKEND_BULKHEAD_ANALYZE', default=8, cast=int),
+    'docs': config('BACKEND_BULKHEAD_DOCS', default=8, cast=int),
+    'other': config('BACKEND_BULKHEAD_OTHER', default=4, cast=int),
+}
+BACKEND_BULKHEAD_WAIT = config('BACKEND_BULKHEAD_WAIT', default=0.5, cast=float)
+
+# Склейка одинаковых GET-запросов к бэкенду (single-flight): в процессе всегда,
+# между воркерами - через блокировку в Redis. Общий ответ живёт в кэше
+# SINGLE_FLIGHT_RESULT_SECONDS, ждущие опрашивают его каждые SINGLE_FLIGHT_POLL_INTERVAL секунд.
+SINGLE_FLIGHT_DISTRIBUTED = config('SINGLE_FLIGHT_DISTRIBUTED', default=True, cast=bool)
+SINGLE_FLIGHT_LOCK_SECONDS = config('SINGLE_FLIGHT_LOCK_SECONDS', default=60, cast=int)
+SINGLE_FLIGHT_RESULT_SECONDS = config('SINGLE_FLIGHT_RESULT_SECONDS', default=2, cast=int)
+SINGLE_FLIGHT_POLL_INTERVAL = config('SINGLE_FLIGHT_POLL_INTERVAL', default=0.05, cast=float)
+
+# Асинхронные представления (нужен ASGI-сервер): один воркер держит
+# до BACKEND_ASYNC_POOL_SIZE одновременных запросов к бэкенду.
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+BACKEND_ASYNC_POOL_SIZE = config('BACKEND_ASYNC_POOL_SIZE', default=200, cast=int)
+BACKEND_ASYNC_BULKHEADS = {
+    'auth': config('BACKEND_ASYNC_BULKHEAD_AUTH', default=80, cast=int),
+    'analyze': config('BACKEND_ASYNC_BULKHEAD_ANALYZE', default=40, cast=int),
+    'docs': config('BACKEND_ASYNC_BULKHEAD_DOCS', default=60, cast=int),
+    'other': config('BACKEND_ASYNC_BULKHEAD_OTHER', default=20, cast=int),
+}
+
+# Размер страницы списка документов на главной
+DOCS_PAGE_SIZE = config('DOCS_PAGE_SIZE', default=20, cast=int)
+
+# Кэш справочника цен (Price): Redis + копия в памяти процесса.
+# Сбрасывается сигналами post_save/post_delete модели Price.
+PRICE_CACHE_SECONDS = config('PRICE_CACHE_SECONDS', default=60 * 60, cast=int)
+PRICE_LOCAL_CACHE_SECONDS = config('PRICE_LOCAL_CACHE_SECONDS', default=30, cast=int)
+
+# Распознанный текст документов хранится в БД (DocText) и кэшируется в CACHES['default'].
+DOC_TEXT_CACHE_SECONDS = config('DOC_TEXT_CACHE_SECONDS', default=24 * 60 * 60, cast=int)
+
+# Очередь анализа документов
+# inline - анализ в том же запросе, thread - в фоновом потоке веб-процесса,
+# db - строки AnalysisJob как очередь, kafka - id задач публикуются в топик.
+# Для db и kafka нужен воркер: manage.py run_analysis_worker.
+
+ANALYSIS_QUEUE = config('ANALYSIS_QUEUE', default='db')
+ANALYSIS_MAX_ATTEMPTS = config('ANALYSIS_MAX_ATTEMPTS', default=3, cast=int)
+ANALYSIS_JOB_TIMEOUT = config('ANALYSIS_JOB_TIMEOUT', default=600, cast=int)
+ANALYSIS_THREAD_WORKERS = config('ANALYSIS_THREAD_WORKERS', default=4, cast=int)
+ANALYSIS_BATCH_CONCURRENCY = config('ANALYSIS_BATCH_CONCURRENCY', default=8, cast=int)
+ANALYSIS_BATCH_MAX_DOCS = config('ANALYSIS_BATCH_MAX_DOCS', default=100, cast=int)
+KAFKA_BOOTSTRAP_SERVERS = config('KAFKA_BOOTSTRAP_SERVERS', default='kafka:9092')
+KAFKA_ANALYSIS_TOPIC = config('KAFKA_ANALYSIS_TOPIC', default='doc_analysis')
+
+# Файлы удалённых документов убирает с диска сборщик (manage.py sweep_media) пачками.
+# reconcile_media не трогает файлы моложе MEDIA_ORPHAN_MIN_AGE секунд: их загрузка может идти.
+MEDIA_SWEEP_BATCH_SIZE = config('MEDIA_SWEEP_BATCH_SIZE', default=500, cast=int)
+MEDIA_SWEEP_INTERVAL = config('MEDIA_SWEEP_INTERVAL', default=30.0, cast=float)
+MEDIA_SWEEP_MAX_ATTEMPTS = config('MEDIA_SWEEP_MAX_ATTEMPTS', default=5, cast=int)
+MEDIA_ORPHAN_MIN_AGE = config('MEDIA_ORPHAN_MIN_AGE', default=60 * 60, cast=int)
+
+# Пул процессов для CPU-задач над изображениями (миниатюры и т.п.)
+# Воркеры gthread/ASGI многопоточные, а fork такого процесса может унаследовать чужие
+# захваченные блокировки (logging, драйвер БД, клиент Redis): пул запускается через forkserver.
+PROCESS_POOL_WORKERS = config('PROCESS_POOL_WORKERS', default=2, cast=int)
+PROCESS_POOL_START_METHOD = config('PROCESS_POOL_START_METHOD', default='forkserver')
+
+# Миниатюры документов: хранятся рядом с оригиналом, ширины в пикселях.
+THUMBNAIL_SIZES = config('THUMBNAIL_SIZES', default='160,320', cast=Csv(int))
+THUMBNAIL_FORMAT = config('THUMBNAIL_FORMAT', default='webp')
+THUMBNAIL_QUALITY = config('THUMBNAIL_QUALITY', default=80, cast=int)
+THUMBNAIL_TIMEOUT = config('THUMBNAIL_TIMEOUT', default=10.0, cast=float)
+
+# Предобработка сканов перед отправкой на OCR (в пуле процессов): хуки PREPROCESS_HOOKS
+# (docs_analyze.preprocessing.deskew, docs_analyze.preprocessing.crop_borders или свои
+# функции image -> image), оттенки серого, уменьшение до PREPROCESS_TARGET_DPI, пересжатие
+# (PNG без потерь, JPEG с PREPROCESS_JPEG_QUALITY). PREPROCESS_ASSUME_DPI - для файлов без DPI.
+PREPROCESS_ENABLED = config('PREPROCESS_ENABLED', default=False, cast=bool)
+PREPROCESS_KEEP_ORIGINAL = config('PREPROCESS_KEEP_ORIGINAL', default=True, cast=bool)
+PREPROCESS_GRAYSCALE = config('PREPROCESS_GRAYSCALE', default=True, cast=bool)
+PREPROCESS_TARGET_DPI = config('PREPROCESS_TARGET_DPI', default=300, cast=int)
+PREPROCESS_ASSUME_DPI = config('PREPROCESS_ASSUME_DPI', default=0, cast=int)
+PREPROCESS_JPEG_QUALITY = config('PREPROCESS_JPEG_QUALITY', default=90, cast=int)
+PREPROCESS_HOOKS = config('PREPROCESS_HOOKS', default='', cast=Csv())
+PREPROCESS_TIMEOUT = config('PREPROCESS_TIMEOUT', default=30.0, cast=float)
+
+# JWT
+# Локальная проверка токенов включается, если задан ключ подписи сервиса
+# авторизации или адрес его набора ключей (JWKS). Иначе токены проверяются
+# удалённо через /token/verify/.
+
+JWT_SIGNING_KEY = config('JWT_SIGNING_KEY', default='')
+JWT_JWKS_URL = config('JWT_JWKS_URL', default='')
+JWT_JWKS_CACHE_SECONDS = config('JWT_JWKS_CACHE_SECONDS', default=300, cast=int)
+JWT_LEEWAY_SECONDS = config('JWT_LEEWAY_SECONDS', default=0, cast=int)
+JWT_TOKEN_TYPE_CLAIM = config('JWT_TOKEN_TYPE_CLAIM', default='token_type')
+
+# Кэш результатов проверки токенов: LRU процесса перед CACHES['default'].
+JWT_CACHE_LOCAL_SIZE = config('JWT_CACHE_LOCAL_SIZE', default=1024, cast=int)
+JWT_CACHE_LOCAL_SECONDS = config('JWT_CACHE_LOCAL_SECONDS', default=30, cast=int)
+JWT_NEGATIVE_CACHE_SECONDS = config('JWT_NEGATIVE_CACHE_SECONDS', default=60, cast=int)
+
 # LOGGING = {
 #     'version': 1,
 #     'disable_existing_loggers': False,
@@ -203,6 +398,12 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        # Выборка запросов от StatisticsMiddleware (REQUEST_LOG_SAMPLE_RATE).
+        'sitepytesseract.requests': {
+            'handlers': ['console', 'file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
     'root': {
         'handlers': ['console', 'file'],
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+import weakref
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+        Склейка одинаковых запросов в процессе: пока выполняется вызов по ключу,
+        остальные потоки с тем же ключом ждут и получают его результат (или его исключение).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+
+    def do(self, key, fn):
+        with self.lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.event.set()
+        return flight.result
+
+
+class AsyncSingleFlight:
+    """
+        То же для корутин одного event loop.
+        Вызов идёт в отдельной задаче, которую ждут все: отмена любого из ждущих
+        (например, клиент первого запроса отключился) не отменяет вызов для остальных.
+    """
+
+    def __init__(self):
+        self.flights = {}
+
+    async def do(self, key, fn):
+        task = self.flights.get(key)
+        if task is None:
+            task = self.flights[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self.flights.get(key) is task:
+            del self.flights[key]
+        if not task.cancelled():
+            task.exception()  # ждущих может не остаться: не логировать "never retrieved"
+
+
+_async_flights = weakref.WeakKeyDictionary()
+
+
+def get_async_flight() -> AsyncSingleFlight:
+    loop = asyncio.get_running_loop()
+    flight = _async_flights.get(loop)
+    if flight is None:
+        flight = _async_flights[loop] = AsyncSingleFlight()
+    return flight
+
+
+class CacheFlight:
+    """
+        Склейка между воркерами через CACHES['default'] (Redis).
+        Первый занимает блокировку cache.add и выполняет вызов, результат кладётся
+        в кэш на result_seconds; остальные опрашивают кэш, пока блокировка жива.
+        Если результата не дождались за lock_seconds или кэш недоступен, вызов выполняется сам.
+    """
+
+    def __init__(self, lock_seconds: float = 30, result_seconds: float = 2, poll_interval: float = 0.05):
+        self.lock_seconds = lock_seconds
+        self.result_seconds = result_seconds
+        self.poll_interval = poll_interval
+
+    @staticmethod
+    def keys(key: str):
+        return f'flight:{key}:lock', f'flight:{key}:result'
+
+    def do(self, key: str, fn, dumps, loads):
+        lock_key, result_key = self.keys(key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_seconds
+        acquired = False
+        try:
+            while not acquired and time.monotonic() < deadline:
+                value = cache.get(result_key)
+                if value is not None:
+                    return loads(value)
+                acquired = cache.add(lock_key, token, self.lock_seconds)
+                if not acquired:
+                    time.sleep(self.poll_interval)
+        except Exception:
+            logger.warning('Request coalescing cache is unavailable', exc_info=True)
+        if not acquired:
+            return fn()
+
+        try:
+            result = fn()
+        except BaseException:
+            self.release(lock_key, token)
+            raise
+        try:
+            cache.set(result_key, dumps(result), self.result_seconds)
+        except Exception:
+            logger.warning('Request coalescing cache is unavailable', exc_info=True)
+        self.release(lock_key, token)
+        return result
+
+    def release(self, lock_key: str, token: str):
+        try:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+        except Exception:
+            logger.warning('Request coalescing cache is unavailable', exc_info=True)
+
+    async def ado(self, key: str, fn, dumps, loads):
+        lock_key, result_key = self.keys(key)
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_seconds
+        acquired = False
+        try:
+            while not acquired and time.monotonic() < deadline:
+                value = await cache.aget(result_key)
+                if value is not None:
+                    return loads(value)
+                acquired = await cache.aadd(lock_key, token, self.lock_seconds)
+                if not acquired:
+                    await asyncio.sleep(self.poll_interval)
+        except Exception:
+            logger.warning('Request coalescing cache is unavailable', exc_info=True)
+        if not acquired:
+            return await fn()
+
+        try:
+            result = await fn()
+        except BaseException:
+            await self.arelease(lock_key, token)
+            raise
+        try:
+            await cache.aset(result_key, dumps(result), self.result_seconds)
+        except Exception:
+            logger.warning('Request coalescing cache is unavailable', exc_info=True)
+        await self.arelease(lock_key, token)
+        return result
+
+    async def arelease(self, lock_key: str, token: str):
+        try:
+            if await cache.aget(lock_key) == token:
+                await cache.adelete(lock_key)
+        except Exception:
+            logger.warning('Request coalescing cache is unavailable', exc_info=True)
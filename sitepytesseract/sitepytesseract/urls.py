@@ -14,15 +14,12 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
-from . import settings
-
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('docs_analyze.urls')),
     path('users/', include(('users.urls', 'users'), namespace='users')),
     path('prometheus/', include('django_prometheus.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
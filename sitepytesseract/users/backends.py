@@ -0,0 +1,75 @@
+import logging
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(user_id) -> str:
+    return f'auth:user:{user_id}'
+
+
+def to_cache(user) -> dict:
+    """
+        Поля пользователя для кэша без хэша пароля. Для проверки сессии
+        хранится только готовый get_session_auth_hash().
+    """
+    fields = {field.attname: getattr(user, field.attname)
+              for field in user._meta.concrete_fields if field.attname != 'password'}
+    return {'fields': fields, 'session_auth_hash': user.get_session_auth_hash()}
+
+
+def from_cache(data: dict):
+    """
+        Пользователь из кэша. password остаётся отложенным полем: при обращении
+        он дочитывается из БД, а save() его не перезаписывает.
+    """
+    model = get_user_model()
+    fields = data['fields']
+    names = [field.attname for field in model._meta.concrete_fields if field.attname in fields]
+    user = model.from_db('default', names, [fields[name] for name in names])
+    session_auth_hash = data['session_auth_hash']
+    user.get_session_auth_hash = lambda: session_auth_hash
+    return user
+
+
+def evict(user_id):
+    if user_id is None:
+        return
+    try:
+        cache.delete(cache_key(user_id))
+    except Exception:
+        logger.warning('User cache is unavailable', exc_info=True)
+
+
+class CachedModelBackend(ModelBackend):
+    """
+        ModelBackend, который берёт пользователя сессии из CACHES['default'] (Redis),
+        а не из auth_user на каждом запросе. Запись сбрасывается при сохранении
+        пользователя (в том числе смене пароля) и при выходе.
+        Хэш сессии по-прежнему сверяется django.contrib.auth.get_user.
+        Хэш пароля в кэш не попадает (см. to_cache).
+    """
+
+    def get_user(self, user_id):
+        key = cache_key(user_id)
+        try:
+            data = cache.get(key)
+        except Exception:
+            logger.warning('User cache is unavailable', exc_info=True)
+            return super().get_user(user_id)
+        # Запись старого формата (целый pickled User) считается промахом и перезаписывается.
+        if isinstance(data, dict):
+            user = from_cache(data)
+            return user if self.user_can_authenticate(user) else None
+
+        user = super().get_user(user_id)
+        if user is not None:
+            try:
+                cache.set(key, to_cache(user), settings.AUTH_USER_CACHE_SECONDS)
+            except Exception:
+                logger.warning('User cache is unavailable', exc_info=True)
+        return user
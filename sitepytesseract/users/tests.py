@@ -1,6 +1,8 @@
 from unittest.mock import patch, MagicMock
 
+from django.contrib.auth import get_user, logout
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase, RequestFactory
 
 from .views import LoginUser, LogoutUser
@@ -25,7 +27,7 @@ class UserLoginTestCase(TestCase):
         session = self.client.session
         request.session = session
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_negative_login(self, mock_post):
         mock_post.return_value = MagicMock(status_code=400, json=lambda: {'detail': 'Test Negative Login'})
 
@@ -33,7 +35,7 @@ class UserLoginTestCase(TestCase):
 
         self.assertEqual(response.status_code, 400)
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_positive_login(self, mock_post):
         mock_post.return_value = MagicMock(status_code=200, json=lambda: {'access': 'Token Access Test',
                                                                           'refresh': 'Token Refresh Test'})
@@ -71,7 +73,7 @@ class UserLogoutTestCase(TestCase):
 
         self.view_logout = LogoutUser()
 
-    @patch('requests.post')
+    @patch('sitepytesseract.backend.BackendClient.post')
     def test_positive_logout(self, mock_post):
         mock_post.return_value = MagicMock(status_code=200, json=lambda: {'access': 'Token Access Test',
                                                                           'refresh': 'Token Refresh Test'})
@@ -93,6 +95,55 @@ class UserLogoutTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
 
 
+class CachedAuthTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', email='<EMAIL>', password='<PASSWORD>')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def get_request(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        return request
+
+    def test_authenticated_request_without_queries(self):
+        self.assertEqual(get_user(self.get_request()), self.user)
+
+        with self.assertNumQueries(0):
+            user = get_user(self.get_request())
+        self.assertEqual(user, self.user)
+
+    def test_password_change_invalidates_session(self):
+        get_user(self.get_request())
+
+        self.user.set_password('<NEW PASSWORD>')
+        self.user.save()
+
+        self.assertFalse(get_user(self.get_request()).is_authenticated)
+
+    def test_logout_evicts_user(self):
+        request = self.get_request()
+        request.user = get_user(request)
+
+        logout(request)
+
+        self.assertIsNone(cache.get(f'auth:user:{self.user.pk}'))
+
+    def test_password_hash_not_cached(self):
+        get_user(self.get_request())
+
+        cached = cache.get(f'auth:user:{self.user.pk}')
+        self.assertNotIn('password', cached['fields'])
+        self.assertNotIn(self.user.password, repr(cached))
 
+        with self.assertNumQueries(0):
+            user = get_user(self.get_request())
+        self.assertEqual((user.username, user.email), ('testuser', '<EMAIL>'))
 
-# Create your tests here.
+        user.first_name = 'Test'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('<PASSWORD>'))
@@ -0,0 +1,145 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import tokens
+
+logger = logging.getLogger(__name__)
+
+TOKEN_TYPES = ('access', 'refresh')
+
+
+class LocalLRU:
+    """
+        Потокобезопасный LRU-кэш процесса с временем жизни у каждой записи.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires: float):
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalLRU(settings.JWT_CACHE_LOCAL_SIZE)
+
+
+def cache_key(token: str, token_type: str) -> str:
+    digest = hashlib.sha256(f'{token_type}:{token}'.encode()).hexdigest()
+    return f'jwt:verified:{digest}'
+
+
+def token_expiry(token: str):
+    decoded = tokens.decode_unverified(token)
+    if decoded is None:
+        return None
+    try:
+        return float(decoded[1]['exp'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def local_expiry(expires: float) -> float:
+    # Запись в памяти процесса живёт недолго: выход пользователя в другом
+    # воркере чистит только Redis, и локальная копия должна быстро устареть.
+    return min(expires, time.time() + settings.JWT_CACHE_LOCAL_SECONDS)
+
+
+def get(token: str, token_type: str = 'access'):
+    """
+        Возвращает ранее полученный результат проверки токена или None.
+    """
+    key = cache_key(token, token_type)
+    result = local_cache.get(key)
+    if result is not None:
+        return result
+
+    try:
+        shared = cache.get(key)
+    except Exception:
+        logger.warning('JWT cache is unavailable', exc_info=True)
+        return None
+    if shared is None:
+        return None
+
+    result, expires = shared
+    local_cache.set(key, result, local_expiry(expires))
+    return result
+
+
+def store(token: str, token_type: str, valid: bool):
+    """
+        Запоминает результат проверки до истечения exp токена.
+        Отказ хранится не дольше JWT_NEGATIVE_CACHE_SECONDS.
+        Токены без exp не кэшируются.
+    """
+    exp = token_expiry(token)
+    if exp is None:
+        return
+
+    now = time.time()
+    if valid:
+        ttl = exp - now
+    else:
+        ttl = settings.JWT_NEGATIVE_CACHE_SECONDS
+    if ttl <= 0:
+        return
+
+    key = cache_key(token, token_type)
+    local_cache.set(key, valid, local_expiry(now + ttl))
+    try:
+        cache.set(key, (valid, now + ttl), int(ttl) or 1)
+    except Exception:
+        logger.warning('JWT cache is unavailable', exc_info=True)
+
+
+def evict(*raw_tokens):
+    """
+        Удаляет результаты проверки токенов (например, при выходе пользователя).
+    """
+    keys = [cache_key(token, token_type)
+            for token in raw_tokens if token
+            for token_type in TOKEN_TYPES]
+    for key in keys:
+        local_cache.delete(key)
+    if not keys:
+        return
+    try:
+        cache.delete_many(keys)
+    except Exception:
+        logger.warning('JWT cache is unavailable', exc_info=True)
+
+
+def clear():
+    local_cache.clear()
@@ -0,0 +1,139 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import time
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+
+from sitepytesseract.backend import get_client
+
+# Поддерживаются только HMAC-алгоритмы: для RSA/EC нужна криптобиблиотека,
+# такие токены уходят на удалённую проверку.
+ALGORITHMS = {
+    'HS256': hashlib.sha256,
+    'HS384': hashlib.sha384,
+    'HS512': hashlib.sha512,
+}
+
+JWKS_CACHE_KEY = 'jwt:jwks'
+
+_jwks_memo = {'keys': None, 'expires': 0.0}
+
+
+def b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def decode_unverified(token: str):
+    """
+        Разбирает JWT без проверки подписи.
+        Возвращает (header, payload, signing_input, signature) или None для битого токена.
+    """
+    try:
+        header_b64, payload_b64, signature_b64 = token.split('.')
+        header = json.loads(b64url_decode(header_b64))
+        payload = json.loads(b64url_decode(payload_b64))
+        signature = b64url_decode(signature_b64)
+    except (AttributeError, ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+    if not isinstance(header, dict) or not isinstance(payload, dict):
+        return None
+
+    signing_input = f'{header_b64}.{payload_b64}'.encode()
+    return header, payload, signing_input, signature
+
+
+def fetch_key_set() -> dict:
+    """
+        Загружает набор ключей (JWKS) с сервиса авторизации и кэширует его.
+        Возвращает словарь kid -> секрет для ключей типа 'oct'.
+    """
+    now = time.monotonic()
+    if _jwks_memo['keys'] is not None and _jwks_memo['expires'] > now:
+        return _jwks_memo['keys']
+
+    ttl = settings.JWT_JWKS_CACHE_SECONDS
+    keys = cache.get(JWKS_CACHE_KEY)
+    if keys is None:
+        try:
+            client = get_client()
+            response = client.session.get(settings.JWT_JWKS_URL, timeout=client.timeout)
+            response.raise_for_status()
+            jwks = response.json().get('keys', [])
+        except (requests.RequestException, ValueError):
+            # Сервис недоступен: коротко запоминаем пустой набор, чтобы не долбить его.
+            jwks, ttl = [], min(ttl, 30)
+
+        keys = {}
+        for jwk in jwks:
+            if jwk.get('kty') == 'oct' and 'k' in jwk:
+                keys[jwk.get('kid', '')] = b64url_decode(jwk['k'])
+        cache.set(JWKS_CACHE_KEY, keys, ttl)
+
+    _jwks_memo.update(keys=keys, expires=now + ttl)
+    return keys
+
+
+def get_signing_key(header: dict):
+    """
+        Подбирает ключ для проверки подписи по заголовку токена.
+        None означает, что ключ неизвестен и проверять нужно удалённо.
+    """
+    kid = header.get('kid')
+    if settings.JWT_JWKS_URL:
+        key = fetch_key_set().get(kid if kid is not None else '')
+        if key is not None:
+            return key
+
+    if settings.JWT_SIGNING_KEY and kid is None:
+        return settings.JWT_SIGNING_KEY.encode()
+
+    return None
+
+
+def local_verification_enabled() -> bool:
+    return bool(settings.JWT_SIGNING_KEY or settings.JWT_JWKS_URL)
+
+
+def verify_locally(token: str, token_type: str = 'access'):
+    """
+        Проверяет подпись, exp/nbf и тип токена без обращения к сервису авторизации.
+        Возвращает True/False или None, если локально решить нельзя
+        (локальная проверка не настроена, неизвестный ключ или алгоритм).
+    """
+    if not local_verification_enabled():
+        return None
+
+    decoded = decode_unverified(token)
+    if decoded is None:
+        return False
+    header, payload, signing_input, signature = decoded
+
+    digestmod = ALGORITHMS.get(header.get('alg'))
+    if digestmod is None:
+        return None
+
+    key = get_signing_key(header)
+    if key is None:
+        return None
+
+    expected = hmac.new(key, signing_input, digestmod).digest()
+    if not hmac.compare_digest(expected, signature):
+        return False
+
+    now = time.time()
+    leeway = settings.JWT_LEEWAY_SECONDS
+    try:
+        if 'exp' in payload and now > float(payload['exp']) + leeway:
+            return False
+        if 'nbf' in payload and now < float(payload['nbf']) - leeway:
+            return False
+    except (TypeError, ValueError):
+        return False
+
+    return payload.get(settings.JWT_TOKEN_TYPE_CLAIM) == token_type
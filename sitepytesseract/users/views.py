@@ -1,12 +1,12 @@
-import requests
-
 from django.contrib.auth.views import LoginView, LogoutView
 from django.urls.base import reverse_lazy
 from django.views.generic.edit import CreateView
 
+from sitepytesseract.backend import get_client
 from users.forms import UserLoginForm, UserRegistrationForm
 
-from .utils import proxi_url, api_error_handler
+from . import token_cache
+from .utils import api_error_handler
 
 # Create your views here.
 
@@ -23,8 +23,8 @@ class LoginUser(LoginView):
         username = form.cleaned_data['username']
         password = form.cleaned_data['password']
 
-        proxi_response = requests.post(proxi_url + 'token/',
-                                      json={'username': username, 'password': password})
+        proxi_response = get_client().post('/token/',
+                                           json={'username': username, 'password': password})
 
         if proxi_response.status_code == 200:
             proxi_json_response = proxi_response.json()
@@ -48,6 +48,9 @@ class RegisterUser(CreateView):
 
 class LogoutUser(LogoutView):
     def dispatch(self, request, *args, **kwargs):
+        token_cache.evict(request.COOKIES.get('access_token'),
+                          request.COOKIES.get('refresh_token'))
+
         response = super().dispatch(request, *args, **kwargs)
 
         response.delete_cookie('access_token', path='/')